@@ -0,0 +1,129 @@
+from argparse import ArgumentParser
+from pathlib import Path
+from pprint import pprint
+
+from picoprobe.flows import (
+    HyperspectralSettings,
+    PicoProbeMetadataFlow_Production_v5,
+    PicoProbeTemporalImaging_Production_v2,
+    TemporalSettings,
+    TransferPublishFlowHandler,
+    WatcherSettings,
+    create_checkpoint,
+    create_flow_client,
+)
+from picoprobe.local_backend import LocalBackend
+from picoprobe.router import FlowRouter
+from picoprobe.utils import BaseModel, GlobusEndpoint, Watcher
+
+
+class FlowDestination(BaseModel):
+    remote_globus_endpoint: GlobusEndpoint
+    """Where the flow stores the experiment files and analysis results."""
+    globus_search_index: str
+    """The Globus Search index the flow publishes to."""
+
+
+class PicoProbeRouterConfig(HyperspectralSettings, TemporalSettings, WatcherSettings):
+    local_globus_endpoint: GlobusEndpoint
+    remote_funcx_endpoint: str
+    remote_funcx_endpoint_non_compute: str
+    hyperspectral: FlowDestination
+    temporal: FlowDestination
+
+
+if __name__ == "__main__":
+    # Parse user arguments
+    parser = ArgumentParser()
+    parser.add_argument("-c", "--config", type=Path, required=True)
+    parser.add_argument("-l", "--local_dir", type=Path, required=True)
+    parser.add_argument(
+        "-p", "--checkpoint_file", type=Path, default="gladier-checkpoint-multi.db"
+    )
+    parser.add_argument(
+        "--polling",
+        action="store_true",
+        help="Poll the directory instead of using native file system events "
+        "(e.g., for network shares)",
+    )
+    parser.add_argument(
+        "--reconcile",
+        action="store_true",
+        help="On startup, also process the files written while the watcher "
+        "was not running",
+    )
+    parser.add_argument(
+        "--local_backend",
+        type=Path,
+        default=None,
+        help="Run the flows locally and record them in this directory "
+        "(e.g., for load testing without the Globus services)",
+    )
+    args = parser.parse_args()
+
+    # Load the configuration file
+    config = PicoProbeRouterConfig.from_yaml(args.config)
+
+    # Log the configuration
+    print("Configuration:")
+    pprint(config)
+
+    # Every flow shares the checkpoint and the submission queue
+    checkpoint = create_checkpoint(args.checkpoint_file)
+    submitter = config.create_submitter()
+
+    # Instantiate the flow clients (or local stand-ins)
+    backend = None
+    if args.local_backend:
+        backend = LocalBackend(
+            args.local_backend,
+            [
+                config.local_globus_endpoint,
+                config.hyperspectral.remote_globus_endpoint,
+                config.temporal.remote_globus_endpoint,
+            ],
+        )
+
+    hyperspectral_handler = TransferPublishFlowHandler(
+        config,
+        create_flow_client(PicoProbeMetadataFlow_Production_v5, backend),
+        checkpoint,
+        config.local_globus_endpoint,
+        config.hyperspectral.remote_globus_endpoint,
+        config.hyperspectral.globus_search_index,
+        # The hyperspectral analysis runs on the compute endpoint
+        analysis_input=config.hyperspectral_input(config.remote_funcx_endpoint),
+        label="Hyperspectral",
+        submitter=submitter,
+    )
+    temporal_handler = TransferPublishFlowHandler(
+        config,
+        create_flow_client(PicoProbeTemporalImaging_Production_v2, backend),
+        checkpoint,
+        config.local_globus_endpoint,
+        config.temporal.remote_globus_endpoint,
+        config.temporal.globus_search_index,
+        analysis_input=config.temporal_input(
+            config.remote_funcx_endpoint, config.remote_funcx_endpoint_non_compute
+        ),
+        label="Temporal",
+        submitter=submitter,
+    )
+
+    # Route each .emd file to a flow based on the type of its main signal
+    router = FlowRouter(
+        pattern="*.emd",
+        settle_time=config.settle_time,
+        backfill_rate=config.backfill_rate,
+    )
+    router.add_route(hyperspectral_handler, signal="spectrum_image")
+    router.add_route(temporal_handler, signal="time_series")
+
+    # Record the lifecycle of each file (and export the latency metrics)
+    config.configure_lifecycle()
+
+    # Instantiate a single watcher for every flow
+    w = Watcher(args.local_dir, router, polling=args.polling, reconcile=args.reconcile)
+
+    # Start the flow
+    w.run()
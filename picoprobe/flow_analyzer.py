@@ -18,8 +18,14 @@ class FlowInfoDataClass:
 class FlowInfo:
     """A class to inspect and describe Globus Flow runs."""
 
-    def __init__(self):
-        self.fc = create_flows_client()
+    def __init__(self, fc=None):
+        """
+        Args:
+            fc (optional): The flows client used to fetch the runs and their
+                logs (e.g., a `picoprobe.local_backend.LocalBackend`). Defaults
+                to a Globus flows client.
+        """
+        self.fc = fc if fc is not None else create_flows_client()
         self.data = FlowInfoDataClass()
         # self.flow_id = None
         # self.flow_scope = None
@@ -453,13 +459,24 @@ if __name__ == "__main__":
     arg_parser.add_argument(
         "-l", "--limit", type=int, default=10, help="Number of flows to analyze."
     )
+    arg_parser.add_argument(
+        "--local_backend",
+        type=str,
+        default=None,
+        help="Analyze the runs recorded by a local backend in this directory.",
+    )
     args = arg_parser.parse_args()
 
     # flow_id = "f892099b-39f5-4aa7-afc6-48c037664d03"
     flow_scope = f"https://auth.globus.org/scopes/{args.flow_id}/flow_{args.flow_id.replace('-','_')}_user"
     print(flow_scope)
 
-    fi = FlowInfo()
+    if args.local_backend:
+        from picoprobe.local_backend import LocalBackend
+
+        fi = FlowInfo(LocalBackend(args.local_backend))
+    else:
+        fi = FlowInfo()
     fi.load(args.flow_id, flow_scope, limit=args.limit)
 
     fi.describe_runtimes()
@@ -0,0 +1,293 @@
+"""The PicoProbe flows, and the settings and handlers that start them.
+
+Each flow transfers the experiment files from the instrument to a remote
+Globus endpoint, analyzes them with a Globus Compute function and publishes
+the metadata to Globus Search. `WatcherSettings` holds the settings shared
+by every flow (write completion, submission queue, batching, lifecycle
+log), and `HyperspectralSettings` and `TemporalSettings` hold the options
+of each analysis. The example configurations combine them by subclassing.
+"""
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Type, Union
+
+from gladier import GladierBaseClient, generate_flow_definition
+
+from picoprobe.local_backend import LocalBackend
+from picoprobe.tools.hyperspectral import HyperspectralImageTool
+from picoprobe.tools.temporal import TemporalImageTool
+from picoprobe.tools.transfer import TransferItems
+from picoprobe.utils import (
+    BaseFlowHandler,
+    BaseModel,
+    CheckPoint,
+    FlowBatcher,
+    FlowInputType,
+    FlowSubmitter,
+    GlobusEndpoint,
+    PathLike,
+    RunTracker,
+    SQLiteCheckPoint,
+    lifecycle,
+)
+
+
+@generate_flow_definition(
+    modifiers={
+        "hyperspectral_image_tool": {"endpoint": "funcx_endpoint_non_compute"},
+        "publishv2_gather_metadata": {
+            "payload": "$.HyperspectralImageTool.details.results[0].output"
+        },
+    }
+)
+class PicoProbeMetadataFlow_Production_v5(GladierBaseClient):
+    gladier_tools = [
+        TransferItems,
+        HyperspectralImageTool,
+        "gladier_tools.publish.Publishv2",
+    ]
+
+
+@generate_flow_definition(
+    modifiers={
+        # Increase wait time to 8 hours
+        # "Transfer": {"WaitTime": 28800},
+        "publishv2_gather_metadata": {
+            "payload": "$.TemporalImageTool.details.results[0].output"
+        },
+    },
+)
+class PicoProbeTemporalImaging_Production_v2(GladierBaseClient):
+    gladier_tools = [
+        TransferItems,
+        TemporalImageTool,
+        "gladier_tools.publish.Publishv2",
+    ]
+
+
+class WatcherSettings(BaseModel):
+    """Settings of the watcher and of the flow submission shared by every flow."""
+
+    settle_time: float = 5.0
+    """Seconds an .emd file must remain unchanged before its flow is started."""
+    num_submit_workers: int = 2
+    """Number of threads submitting flows to Globus concurrently."""
+    submit_queue_size: int = 64
+    """Maximum number of flows waiting to be submitted before the watcher blocks."""
+    submit_rate: float = 2.0
+    """Maximum number of flows started per second (reduced while Globus throttles)."""
+    submit_max_retries: int = 5
+    """Number of times a flow start failing with a transient error is retried."""
+    dead_letter_file: Optional[Path] = Path("gladier-dead-letter.jsonl")
+    """JSON lines file recording the flows that could not be started."""
+    max_in_flight: Optional[int] = 16
+    """Maximum number of flows submitted or running at once (new files wait locally)."""
+    status_poll_interval: float = 30.0
+    """Seconds between checks of the status of the flows in flight."""
+    batch_window: float = 0.0
+    """Seconds to collect files into a single flow (0 starts one flow per file)."""
+    max_batch_bytes: int = 8 * 1024**3
+    """Start the batched flow early once its files total this many bytes."""
+    max_batch_count: int = 32
+    """Start the batched flow early once it contains this many files."""
+    backfill_rate: int = 16
+    """Files missed while the watcher was down to release per second on startup (with --reconcile)."""
+    fingerprint: str = "sampled"
+    """Identify files by content to skip copies, "sampled" chunk hashes (fast, but may skip distinct files) or "full" hash, or by "path", size and modification time."""
+    event_log: Optional[Path] = Path("picoprobe-events.jsonl")
+    """JSON lines log of when each file was detected, submitted, transferred, analyzed and published."""
+    metrics_file: Optional[Path] = Path("picoprobe-metrics.prom")
+    """File exporting the file counts and latency histograms in the OpenMetrics text format."""
+    metrics_port: Optional[int] = None
+    """Serve the metrics at http://localhost:<port>/metrics (e.g., for Prometheus)."""
+
+    def create_submitter(self) -> FlowSubmitter:
+        """Return a flow submitter (which may be shared by several handlers)."""
+        return FlowSubmitter(
+            self.num_submit_workers,
+            self.submit_queue_size,
+            rate=self.submit_rate,
+            max_retries=self.submit_max_retries,
+            dead_letter_file=self.dead_letter_file,
+            tracker=RunTracker(self.max_in_flight, self.status_poll_interval),
+        )
+
+    def create_batcher(self) -> FlowBatcher:
+        """Return a flow batcher (each handler needs its own)."""
+        return FlowBatcher(
+            self.batch_window, self.max_batch_bytes, self.max_batch_count
+        )
+
+    def configure_lifecycle(self) -> None:
+        """Record the lifecycle of each file (and export the latency metrics)."""
+        lifecycle.configure(self.event_log, self.metrics_file, self.metrics_port)
+
+
+class HyperspectralSettings(BaseModel):
+    """Options of the hyperspectral analysis."""
+
+    element_windows: List[Union[str, List[float]]] = []
+    """X-ray lines (e.g., "Fe_Ka") or [low, high] keV windows to publish element maps for."""
+    decomposition: Optional[Dict[str, Any]] = None
+    """Options of the PCA/NMF decomposition of the spectrum images, e.g., {"method": "nmf", "n_components": 8}."""
+    pyramid: bool = False
+    """Publish tiled multi-resolution (Zarr) pyramids of the spectrum images."""
+
+    def hyperspectral_input(self, compute_endpoint: str) -> Dict[str, Any]:
+        """Return the input of `PicoProbeMetadataFlow_Production_v5` analysis steps.
+
+        The flow runs the hyperspectral tool on its "non compute" endpoint,
+        so both endpoints are the compute endpoint.
+        """
+        return {
+            "funcx_endpoint_compute": compute_endpoint,
+            "funcx_endpoint_non_compute": compute_endpoint,
+            "element_windows": self.element_windows,
+            "decomposition": self.decomposition,
+            "pyramid": self.pyramid,
+        }
+
+
+class TemporalSettings(BaseModel):
+    """Options of the spatiotemporal analysis."""
+
+    yolo_model_path: str
+    """Absolute path to the YOLOv8 model on the remote endpoint."""
+    video_normalization: str = "frame"
+    """Scale the video frames by "frame", "global" range or clipped "percentile"."""
+    yolo_batch_size: int = 16
+    """Number of frames per YOLOv8 inference batch."""
+    annotate_video: bool = False
+    """Also publish a video of the frames annotated with the YOLOv8 detections."""
+    fps: Optional[float] = None
+    """Frame rate of the videos and speeds (by default, read from the frame time of each stack)."""
+
+    def temporal_input(
+        self, compute_endpoint: str, non_compute_endpoint: str
+    ) -> Dict[str, Any]:
+        """Return the input of `PicoProbeTemporalImaging_Production_v2` analysis steps."""
+        return {
+            "yolo_model_path": self.yolo_model_path,
+            "video_normalization": self.video_normalization,
+            "yolo_batch_size": self.yolo_batch_size,
+            "annotate_video": self.annotate_video,
+            "fps": self.fps,
+            "funcx_endpoint_compute": compute_endpoint,
+            "funcx_endpoint_non_compute": non_compute_endpoint,
+        }
+
+
+class TransferPublishFlowHandler(BaseFlowHandler):
+    """Start a flow transferring, analyzing and publishing batches of .emd files."""
+
+    def __init__(
+        self,
+        settings: WatcherSettings,
+        flow_client: GladierBaseClient,
+        checkpoint: CheckPoint,
+        local_endpoint: GlobusEndpoint,
+        remote_endpoint: GlobusEndpoint,
+        globus_search_index: str,
+        analysis_input: Dict[str, Any],
+        label: str,
+        submitter: Optional[FlowSubmitter] = None,
+    ) -> None:
+        """Initialize the flow handler.
+
+        Parameters
+        ----------
+        settings : WatcherSettings
+            The settings of the watcher and of the flow submission.
+        flow_client : GladierBaseClient
+            The client used to run the flow.
+        checkpoint : CheckPoint
+            Checkpoint recording the files that have been processed.
+        local_endpoint : GlobusEndpoint
+            The endpoint the experiment files are written to.
+        remote_endpoint : GlobusEndpoint
+            Where the flow stores the experiment files and analysis results.
+        globus_search_index : str
+            The Globus Search index the flow publishes to.
+        analysis_input : Dict[str, Any]
+            The input of the analysis steps of the flow (e.g., the Globus
+            Compute endpoints, see `HyperspectralSettings.hyperspectral_input`).
+        label : str
+            Prefix of the run labels (e.g., "Hyperspectral").
+        submitter : Optional[FlowSubmitter], optional
+            Submitter used to start the flows, by default a new submitter
+            created from the `settings`
+        """
+        super().__init__(
+            flow_client,
+            checkpoint,
+            pattern="*.emd",
+            settle_time=settings.settle_time,
+            submitter=submitter or settings.create_submitter(),
+            batcher=settings.create_batcher(),
+            backfill_rate=settings.backfill_rate,
+            fingerprint=settings.fingerprint,
+        )
+        self.local = local_endpoint
+        self.remote = remote_endpoint
+        self.globus_search_index = globus_search_index
+        self.analysis_input = analysis_input
+        self.label = label
+
+    def create_flow_input(self, src_paths: List[str]) -> FlowInputType:
+        # Put remote data inside a time-stamped directory (unique per batch)
+        ts = datetime.now().strftime("%Y%m%d-%H%M%S-%f")
+        # Path to the remote directory containing experiment results and analysis
+        remote_experiment_dir = self.remote.to_absolute(src_paths[0], ts)
+        remote_experiment_dir = Path(remote_experiment_dir).parent.as_posix()
+
+        flow_input = {
+            "input": {
+                # Step 1. Transfer from local to remote
+                # ============================
+                "transfer_source_endpoint_id": self.local.endpoint_id,
+                "transfer_destination_endpoint_id": self.remote.endpoint_id,
+                "transfer_items": [
+                    {
+                        "source_path": self.local.to_relative(src_path),
+                        "destination_path": self.remote.to_relative(src_path, ts),
+                        "recursive": False,
+                    }
+                    for src_path in src_paths
+                ],
+                # ============================
+                # Step 2-3. Analyze the remote files and publish the metadata to Globus Search
+                **self.analysis_input,
+                "publishv2": {
+                    "dataset": remote_experiment_dir,
+                    "destination": remote_experiment_dir,
+                    "source_collection": self.remote.endpoint_id,
+                    "destination_collection": self.remote.endpoint_id,
+                    "index": self.globus_search_index,
+                    "metadata": {},  # Populated by the analysis tool
+                    "ingest_enabled": True,
+                    "transfer_enabled": False,
+                    "visible_to": ["public"],
+                },
+                # ============================
+            }
+        }
+        return flow_input
+
+    def run_label(self, src_paths: List[str]) -> str:
+        return f"{self.label} {super().run_label(src_paths)}"
+
+
+def create_checkpoint(checkpoint_file: PathLike) -> CheckPoint:
+    """Open the checkpoint (legacy .txt checkpoints only record which files have been seen)."""
+    if Path(checkpoint_file).suffix == ".txt":
+        return CheckPoint(checkpoint_file)
+    return SQLiteCheckPoint(checkpoint_file)
+
+
+def create_flow_client(
+    client_class: Type[GladierBaseClient], backend: Optional[LocalBackend] = None
+) -> GladierBaseClient:
+    """Instantiate the flow client, or a stand-in running it on the local `backend`."""
+    if backend is None:
+        return client_class()
+    return backend.client(client_class)
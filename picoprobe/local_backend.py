@@ -0,0 +1,471 @@
+"""Run flows locally, without the Globus services, e.g., for load testing.
+
+The `LocalBackend` executes the gladier tools of a flow client in-process:
+Globus Transfer tasks become local file copies, Globus Compute functions
+run in a process pool and Globus Search ingests are appended to a local
+JSON lines index. The `LocalFlowClient` it returns implements the
+`GladierBaseClient` methods used by the flow handlers, and the backend
+itself implements the flows client methods used by `FlowInfo`, so local
+runs can be analyzed like production runs.
+"""
+import json
+import logging
+import shutil
+import time
+import traceback
+import uuid
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime, timezone
+from pathlib import Path
+from threading import Lock
+from typing import Any, Callable, Dict, Iterable, List, Optional, Type
+
+from gladier import GladierBaseClient
+
+from picoprobe.utils import FlowInputType, GlobusEndpoint, PathLike
+
+logger = logging.getLogger(__name__)
+
+# Action URLs reported in the local flow definitions and logs
+# (FlowInfo recognizes the compute steps by "funcx" in the URL)
+TRANSFER_ACTION_URL = "https://actions.automate.globus.org/transfer/transfer"
+COMPUTE_ACTION_URL = "https://automate.funcx.org"
+SEARCH_ACTION_URL = "https://actions.globus.org/search/ingest"
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+def _state_name(function: Callable[..., Any]) -> str:
+    """Return the flow state name gladier gives a compute function."""
+    return "".join(part.capitalize() for part in function.__name__.split("_"))
+
+
+class LocalResponse(dict):  # type: ignore[type-arg]
+    """A dictionary standing in for a Globus SDK response."""
+
+    @property
+    def data(self) -> Dict[str, Any]:
+        return self
+
+
+class _Step:
+    """A single state of a local flow."""
+
+    def __init__(
+        self, name: str, kind: str, function: Optional[Callable[..., Any]] = None
+    ) -> None:
+        self.name = name
+        self.kind = kind
+        self.function = function
+
+    @property
+    def action_url(self) -> str:
+        return {
+            "transfer": TRANSFER_ACTION_URL,
+            "compute": COMPUTE_ACTION_URL,
+            "publish": SEARCH_ACTION_URL,
+        }[self.kind]
+
+
+def _plan(gladier_tools: Iterable[Any]) -> List[_Step]:
+    """Translate the gladier tools of a flow client into local steps."""
+    steps = []
+    for tool in gladier_tools:
+        name = tool if isinstance(tool, str) else tool.__name__
+        if name.split(".")[-1] == "Publishv2":
+            steps.append(_Step("Publishv2Ingest", "publish"))
+            continue
+
+        states = getattr(tool, "flow_definition", None) or {}
+        transfers = [
+            state_name
+            for state_name, state in states.get("States", {}).items()
+            if "transfer" in state.get("ActionUrl", "")
+        ]
+        if transfers:
+            steps.extend(_Step(state_name, "transfer") for state_name in transfers)
+        elif getattr(tool, "funcx_functions", None):
+            steps.extend(
+                _Step(_state_name(function), "compute", function)
+                for function in tool.funcx_functions
+            )
+        else:
+            raise ValueError(f"The local backend does not support the tool: {name}")
+    return steps
+
+
+class LocalFlowClient:
+    """Stand-in for a `GladierBaseClient` whose flows run on a `LocalBackend`."""
+
+    def __init__(self, backend: "LocalBackend", flow_id: str, steps: List[_Step]):
+        self.backend = backend
+        self.flow_id = flow_id
+        self.steps = steps
+
+    def get_flow_id(self) -> str:
+        return self.flow_id
+
+    def get_flow_definition(self) -> Dict[str, Any]:
+        return self.backend.flow_definition(self.flow_id)
+
+    def run_flow(
+        self, flow_input: Optional[FlowInputType] = None, label: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """Start a flow run in the background, returns the run information."""
+        return self.backend.run_flow(self, flow_input or {}, label or "Run")
+
+    def get_status(self, action_id: str) -> Dict[str, Any]:
+        return self.backend.get_run(action_id)
+
+    def get_action_logs(self, action_id: str) -> Dict[str, Any]:
+        return self.backend.flow_action_log(self.flow_id, None, action_id)
+
+
+class LocalBackend:
+    """Execute gladier flows locally.
+
+    Transfer paths are resolved relative to the root directory of each
+    endpoint, which is derived from the `GlobusEndpoint` configuration
+    (i.e., `abs_path` without its trailing `rel_path`). The runs, flows and
+    search index are recorded as JSON lines files in `directory`, so they
+    can be inspected (e.g., by `FlowInfo`) from another process.
+    """
+
+    def __init__(
+        self,
+        directory: PathLike,
+        endpoints: Iterable[GlobusEndpoint] = (),
+        max_workers: Optional[int] = None,
+        max_runs: int = 32,
+    ) -> None:
+        """Initialize the backend.
+
+        Parameters
+        ----------
+        directory : PathLike
+            Directory to record the flows, runs and search index in.
+        endpoints : Iterable[GlobusEndpoint], optional
+            The endpoints whose transfers are copied locally, by default ()
+        max_workers : Optional[int], optional
+            Number of processes running compute functions, by default the
+            number of CPUs
+        max_runs : int, optional
+            Maximum number of flow runs executing concurrently, by default 32
+        """
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.flows_file = self.directory / "flows.jsonl"
+        self.runs_file = self.directory / "runs.jsonl"
+        self.search_index = self.directory / "search_index.jsonl"
+
+        self.endpoint_roots: Dict[str, Path] = {}
+        for endpoint in endpoints:
+            self.add_endpoint(endpoint)
+
+        self.max_workers = max_workers
+        self.max_runs = max_runs
+        # Created on first use, so that analyzing past runs starts no workers
+        self._compute_pool: Optional[Executor] = None
+        self._run_pool: Optional[Executor] = None
+
+        self._lock = Lock()
+        self._flows: Dict[str, Dict[str, Any]] = {}
+        self._runs: Dict[str, Dict[str, Any]] = {}
+        self._logs: Dict[str, List[Dict[str, Any]]] = {}
+        self._load()
+
+    def __enter__(self) -> "LocalBackend":
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        self.shutdown()
+
+    def add_endpoint(self, endpoint: GlobusEndpoint) -> None:
+        """Copy the transfers to and from `endpoint` on the local file system."""
+        rel_parts = endpoint.rel_path.parts
+        abs_parts = endpoint.abs_path.parts
+        if rel_parts and abs_parts[-len(rel_parts) :] != rel_parts:
+            raise ValueError(
+                f"abs_path {endpoint.abs_path} must end with rel_path {endpoint.rel_path}"
+            )
+        root = Path(*abs_parts[: len(abs_parts) - len(rel_parts)])
+        self.endpoint_roots[endpoint.endpoint_id] = root
+
+    def client(self, client_class: Type[GladierBaseClient]) -> LocalFlowClient:
+        """Return a local flow client running the tools of `client_class`.
+
+        The gladier client is not instantiated, so no Globus login is needed.
+        """
+        steps = _plan(client_class.gladier_tools)
+        nexts: List[Optional[_Step]] = [*steps[1:], None]
+        title = client_class.__name__
+        definition = {
+            "StartAt": steps[0].name,
+            "States": {
+                step.name: {
+                    "Type": "Action",
+                    "ActionUrl": step.action_url,
+                    "ResultPath": f"$.{step.name}",
+                    **({"Next": nxt.name} if nxt else {"End": True}),
+                }
+                for step, nxt in zip(steps, nexts)
+            },
+        }
+        # The id is derived from the definition (like a deployed flow, it is
+        # the same across restarts until the flow changes)
+        key = json.dumps({"title": title, "definition": definition}, sort_keys=True)
+        flow_id = str(uuid.uuid5(uuid.NAMESPACE_URL, key))
+        with self._lock:
+            if flow_id not in self._flows:
+                flow = {"id": flow_id, "title": title, "definition": definition}
+                self._flows[flow_id] = flow
+                self._append(self.flows_file, flow)
+        return LocalFlowClient(self, flow_id, steps)
+
+    def flow_definition(self, flow_id: str) -> Dict[str, Any]:
+        definition: Dict[str, Any] = self._flows[flow_id]["definition"]
+        return definition
+
+    def run_flow(
+        self, client: LocalFlowClient, flow_input: FlowInputType, label: str
+    ) -> Dict[str, Any]:
+        """Start a run of the `client` flow, returns the run information."""
+        run_id = str(uuid.uuid4())
+        run: Dict[str, Any] = {
+            "run_id": run_id,
+            "action_id": run_id,
+            "flow_id": client.flow_id,
+            "label": label,
+            "status": "ACTIVE",
+            "start_time": _now(),
+            "completion_time": None,
+            "details": {},
+        }
+        with self._lock:
+            self._runs[run_id] = run
+            self._logs[run_id] = [
+                {"code": "FlowStarted", "time": run["start_time"], "details": {}}
+            ]
+            if self._run_pool is None:
+                self._run_pool = ThreadPoolExecutor(
+                    self.max_runs, thread_name_prefix="local-flow"
+                )
+        self._run_pool.submit(self._execute, client, run_id, flow_input)
+        return dict(run)
+
+    def get_run(self, run_id: str) -> Dict[str, Any]:
+        with self._lock:
+            return dict(self._runs[run_id])
+
+    def shutdown(self, wait: bool = True) -> None:
+        """Stop the worker pools, waiting for the active runs by default."""
+        if self._run_pool is not None:
+            self._run_pool.shutdown(wait)
+        if self._compute_pool is not None:
+            self._compute_pool.shutdown(wait)
+
+    # Flows client methods used by FlowInfo
+
+    def get_flow(self, flow_id: str) -> LocalResponse:
+        return LocalResponse(self._flows[flow_id])
+
+    def list_flow_runs(
+        self,
+        flow_id: Optional[str] = None,
+        role: Optional[str] = None,
+        marker: Optional[str] = None,
+    ) -> LocalResponse:
+        with self._lock:
+            runs = [
+                dict(run)
+                for run in self._runs.values()
+                if flow_id is None or run["flow_id"] == flow_id
+            ]
+        # Most recent runs first, like the Globus Flows service
+        runs.sort(key=lambda run: run["start_time"], reverse=True)
+        return LocalResponse(runs=runs, has_next_page=False, marker=None)
+
+    def flow_action_log(
+        self,
+        flow_id: str,
+        flow_scope: Optional[str],
+        action_id: str,
+        limit: int = 100,
+    ) -> LocalResponse:
+        with self._lock:
+            entries = list(self._logs[action_id])
+        return LocalResponse(entries=entries[:limit], has_next_page=False)
+
+    # Flow execution
+
+    def _execute(
+        self, client: LocalFlowClient, run_id: str, flow_input: FlowInputType
+    ) -> None:
+        data = flow_input.get("input", {})
+        output: Dict[str, Any] = {"input": data}
+        step = None
+        try:
+            for step in client.steps:
+                self._log(run_id, "ActionStarted", state_name=step.name)
+                if step.kind == "transfer":
+                    details = self._transfer(data)
+                elif step.kind == "compute":
+                    details = self._compute(step, data)
+                else:
+                    details = self._publish(data, output)
+                output[step.name] = {
+                    "action_id": str(uuid.uuid4()),
+                    "status": "SUCCEEDED",
+                    "details": details,
+                }
+                self._log(run_id, "ActionCompleted", state_name=step.name)
+        except Exception as e:
+            logger.warning(f"Local flow run {run_id} failed: {e}")
+            if step is not None:
+                self._log(run_id, "ActionFailed", state_name=step.name)
+            self._finish(
+                run_id,
+                "FAILED",
+                "FlowFailed",
+                {"output": output, "error": traceback.format_exc()},
+            )
+        else:
+            self._finish(run_id, "SUCCEEDED", "FlowSucceeded", {"output": output})
+
+    def _resolve(self, endpoint_id: str, path: str) -> Path:
+        if endpoint_id not in self.endpoint_roots:
+            raise ValueError(f"Unknown endpoint for the local backend: {endpoint_id}")
+        return self.endpoint_roots[endpoint_id] / path
+
+    def _transfer(self, data: Dict[str, Any]) -> Dict[str, Any]:
+        # Support both the TransferItems and the single file Transfer tools
+        items = data.get("transfer_items") or [
+            {
+                "source_path": data["transfer_source_path"],
+                "destination_path": data["transfer_destination_path"],
+                "recursive": data.get("transfer_recursive", False),
+            }
+        ]
+
+        request_time = _now()
+        nbytes = 0
+        for item in items:
+            src = self._resolve(
+                data["transfer_source_endpoint_id"], item["source_path"]
+            )
+            dst = self._resolve(
+                data["transfer_destination_endpoint_id"], item["destination_path"]
+            )
+            dst.parent.mkdir(parents=True, exist_ok=True)
+            if item.get("recursive"):
+                shutil.copytree(src, dst, dirs_exist_ok=True)
+                nbytes += sum(p.stat().st_size for p in dst.rglob("*") if p.is_file())
+            else:
+                shutil.copyfile(src, dst)
+                nbytes += dst.stat().st_size
+
+        return {
+            "status": "SUCCEEDED",
+            "files_transferred": len(items),
+            "bytes_transferred": nbytes,
+            "request_time": request_time,
+            "completion_time": _now(),
+        }
+
+    def _compute(self, step: _Step, data: Dict[str, Any]) -> Dict[str, Any]:
+        with self._lock:
+            if self._compute_pool is None:
+                self._compute_pool = ProcessPoolExecutor(self.max_workers)
+        start = time.monotonic()
+        result = self._compute_pool.submit(step.function, **data).result()  # type: ignore
+        return {
+            "results": [
+                {
+                    "task_id": str(uuid.uuid4()),
+                    "status": "success",
+                    "output": result,
+                    "runtime": time.monotonic() - start,
+                }
+            ]
+        }
+
+    def _publish(self, data: Dict[str, Any], output: Dict[str, Any]) -> Dict[str, Any]:
+        # As in the example flows, the publish metadata is the output of
+        # the last compute step, if any
+        publish = data["publishv2"]
+        for value in reversed(list(output.values())):
+            results = value.get("details", {}).get("results")
+            if results and isinstance(results[0]["output"], dict):
+                publish = results[0]["output"]
+                break
+
+        creation_date = _now()
+        if publish.get("ingest_enabled", True):
+            entry = {
+                "index": publish.get("index"),
+                "subject": publish.get("dataset"),
+                "visible_to": publish.get("visible_to", ["public"]),
+                "content": publish.get("metadata", {}),
+                "ingested": creation_date,
+            }
+            with self._lock:
+                self._append(self.search_index, entry)
+
+        return {
+            "index_id": publish.get("index"),
+            "subject": publish.get("dataset"),
+            "creation_date": creation_date,
+            "completion_date": _now(),
+        }
+
+    def _log(self, run_id: str, code: str, **details: Any) -> None:
+        with self._lock:
+            self._logs[run_id].append(
+                {"code": code, "time": _now(), "details": details}
+            )
+
+    def _finish(
+        self, run_id: str, status: str, code: str, details: Dict[str, Any]
+    ) -> None:
+        completion_time = _now()
+        with self._lock:
+            run = self._runs[run_id]
+            run["status"] = status
+            run["completion_time"] = completion_time
+            run["details"] = details
+            self._logs[run_id].append(
+                {"code": code, "time": completion_time, "details": details}
+            )
+            self._append(self.runs_file, {**run, "entries": self._logs[run_id]})
+
+    # Persistence
+
+    @staticmethod
+    def _append(filename: Path, record: Dict[str, Any]) -> None:
+        with open(filename, "a") as f:
+            f.write(json.dumps(record, default=str) + "\n")
+
+    @staticmethod
+    def _read(filename: Path) -> Iterable[Dict[str, Any]]:
+        if filename.exists():
+            with open(filename) as f:
+                for line in f:
+                    if line.strip():
+                        yield json.loads(line)
+
+    def _load(self) -> None:
+        for flow in self._read(self.flows_file):
+            self._flows[flow["id"]] = flow
+        for run in self._read(self.runs_file):
+            self._logs[run["run_id"]] = run.pop("entries")
+            self._runs[run["run_id"]] = run
+
+    def search(self, index: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Return the entries ingested into the local search `index` (or all)."""
+        return [
+            entry
+            for entry in self._read(self.search_index)
+            if index is None or entry["index"] == index
+        ]
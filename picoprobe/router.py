@@ -0,0 +1,147 @@
+"""Route files from a single watcher to several flows."""
+import logging
+import os
+from fnmatch import fnmatch
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from picoprobe.utils import (
+    BaseFlowHandler,
+    FileLifecycle,
+    StableFileEventHandler,
+    lifecycle,
+)
+
+logger = logging.getLogger(__name__)
+
+
+class FlowRoute:
+    """A rule that sends matching files to a flow handler."""
+
+    def __init__(
+        self,
+        handler: BaseFlowHandler,
+        pattern: str = "*",
+        signal: Optional[str] = None,
+        min_size: int = 0,
+        max_size: Optional[int] = None,
+    ) -> None:
+        """Initialize the route.
+
+        Parameters
+        ----------
+        handler : BaseFlowHandler
+            The flow handler which starts flows for the matching files.
+        pattern : str, optional
+            Glob pattern matched against file names, by default "*"
+        signal : Optional[str], optional
+            Only match EMD files whose main signal has this type (see
+            `picoprobe.tools.emd.signal_type`), e.g., "spectrum_image" or
+            "time_series", by default None (any file)
+        min_size : int, optional
+            Only match files of at least this many bytes, by default 0
+        max_size : Optional[int], optional
+            Only match files of at most this many bytes, by default None
+        """
+        self.handler = handler
+        self.pattern = pattern
+        self.signal = signal
+        self.min_size = min_size
+        self.max_size = max_size
+
+    def matches(self, path: str, size: int, signal: Optional[str]) -> bool:
+        """Returns True if the file should be sent to the route handler."""
+        if not fnmatch(Path(path).name, self.pattern):
+            return False
+        if size < self.min_size or (self.max_size is not None and size > self.max_size):
+            return False
+        return self.signal is None or self.signal == signal
+
+
+class FlowRouter(StableFileEventHandler):
+    """Watch for files once and route each to the first matching flow.
+
+    The router owns the write-completion tracking and startup backfill,
+    so a single `Watcher` (and observer) serves every registered flow.
+    Handlers registered with the router should share a `FlowSubmitter`
+    so that all flows are submitted from one queue.
+    """
+
+    def __init__(
+        self, pattern: str = "*", settle_time: float = 5.0, backfill_rate: int = 16
+    ) -> None:
+        super().__init__(pattern, settle_time, backfill_rate)
+        self.routes: List[FlowRoute] = []
+
+    @property
+    def handlers(self) -> List[BaseFlowHandler]:
+        """The distinct flow handlers, in the order they were registered."""
+        unique: Dict[int, BaseFlowHandler] = {}
+        for route in self.routes:
+            unique.setdefault(id(route.handler), route.handler)
+        return list(unique.values())
+
+    def add_route(
+        self,
+        handler: BaseFlowHandler,
+        pattern: str = "*",
+        signal: Optional[str] = None,
+        min_size: int = 0,
+        max_size: Optional[int] = None,
+    ) -> None:
+        """Register a flow handler for the files matching the rule.
+
+        Routes are tried in the order they were added. See `FlowRoute`
+        for a description of the parameters.
+        """
+        self.routes.append(FlowRoute(handler, pattern, signal, min_size, max_size))
+
+    def route(self, src_path: str) -> Optional[BaseFlowHandler]:
+        """Return the handler of the first route matching the file, if any."""
+        size = os.path.getsize(src_path)
+
+        # Only read the file header if a route needs it
+        signal = None
+        if any(route.signal is not None for route in self.routes):
+            from picoprobe.tools.emd import signal_type
+
+            try:
+                signal = signal_type(src_path)
+            except OSError as e:
+                logger.warning(f"Could not probe {src_path}: {e}")
+
+        for route in self.routes:
+            if route.matches(src_path, size, signal):
+                return route.handler
+        return None
+
+    def on_file_ready(self, src_path: str) -> None:
+        try:
+            handler = self.route(src_path)
+        except OSError as e:
+            logger.warning(f"Skipping unreadable file {src_path}: {e}")
+            lifecycle.record(FileLifecycle.FAILED, src_path)
+            return
+
+        if handler is None:
+            logger.debug(f"No flow route matches {src_path}")
+            lifecycle.record(FileLifecycle.SKIPPED, src_path)
+            return
+
+        handler.on_file_ready(src_path)
+
+    def is_known(self, src_path: str, stat: os.stat_result) -> bool:
+        return any(handler.is_known(src_path, stat) for handler in self.handlers)
+
+    def poll(self) -> None:
+        super().poll()
+        # Release the batches that are due
+        for handler in self.handlers:
+            handler.poll()
+
+    def shutdown(self) -> None:
+        # Flush every handler before stopping the (possibly shared) submitters
+        for handler in self.handlers:
+            handler.flush()
+        for handler in self.handlers:
+            handler.shutdown()
@@ -1,16 +1,504 @@
-"""Periodically copies file to a watched directory to simulate a PicoProbe user."""
-from argparse import ArgumentParser
-from pathlib import Path
+"""Simulate a PicoProbe user by writing files to a watched directory.
+
+Files arrive following a load profile (fixed interval, Poisson, bursts or
+a replayed trace) from one or more parallel streams (e.g., detectors).
+Each file is either copied from an input directory or synthesized as an
+EMD (HDF5) file, and written in chunks throttled to the detector write
+speed. If the watcher's SQLite checkpoint is given, the time until each
+file is found complete (which includes the watcher's settle time) and its
+flow submitted is reported.
+"""
+import csv
 import itertools
+import os
+import random
 import shutil
+import sqlite3
 import time
+from argparse import ArgumentParser
+from collections import deque
+from pathlib import Path
+from threading import Event, Lock, Thread
+from typing import Deque, Dict, Iterator, List, Optional, Sequence, Tuple, Union
+
+PathLike = Union[str, Path]
+
+MB = 1024**2
+
+
+def fixed_arrivals(interval: float) -> Iterator[float]:
+    """Yield a constant delay between files."""
+    return itertools.repeat(interval)
+
+
+def poisson_arrivals(rate: float, rng: random.Random) -> Iterator[float]:
+    """Yield exponentially distributed delays (`rate` files per second)."""
+    while True:
+        yield rng.expovariate(rate)
+
+
+def burst_arrivals(
+    rate: float, burst_size: int, burst_gap: float, rng: random.Random
+) -> Iterator[float]:
+    """Yield delays of bursts of `burst_size` files, `burst_gap` seconds apart.
+
+    The bursts arrive as a Poisson process, so that the mean rate is still
+    `rate` files per second.
+    """
+    while True:
+        yield rng.expovariate(rate / burst_size)
+        for _ in range(burst_size - 1):
+            yield burst_gap
+
+
+def trace_arrivals(trace_file: PathLike) -> Iterator[float]:
+    """Yield the delays between the timestamps (seconds) listed in `trace_file`.
+
+    The trace has one timestamp per line (e.g., the modification times of
+    the files of a past session); blank lines and lines starting with "#"
+    are ignored.
+    """
+    with open(trace_file) as f:
+        times = sorted(
+            float(line.split(",")[0])
+            for line in f
+            if line.strip() and not line.startswith("#")
+        )
+    yield 0.0
+    for previous, current in zip(times, times[1:]):
+        yield current - previous
+
+
+def _throttle(written: int, start: float, bandwidth: Optional[float]) -> None:
+    """Sleep until `written` bytes take at least the time allowed by `bandwidth`."""
+    if bandwidth:
+        delay = start + written / bandwidth - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+
+
+def write_copy(
+    src: PathLike, dst: PathLike, bandwidth: Optional[float], chunk_size: int
+) -> int:
+    """Copy `src` to `dst` in chunks, at most `bandwidth` bytes per second.
+
+    Returns
+    -------
+    int
+        The number of bytes written.
+    """
+    if not bandwidth:
+        shutil.copyfile(src, dst)
+        return Path(dst).stat().st_size
+
+    start = time.monotonic()
+    written = 0
+    with open(src, "rb") as fin, open(dst, "wb") as fout:
+        while True:
+            chunk = fin.read(chunk_size)
+            if not chunk:
+                break
+            fout.write(chunk)
+            fout.flush()
+            written += len(chunk)
+            _throttle(written, start, bandwidth)
+    return written
+
+
+def write_synthetic_emd(
+    dst: PathLike,
+    signal: str,
+    shape: Sequence[int],
+    bandwidth: Optional[float],
+    chunk_size: int,
+    rng: random.Random,
+) -> int:
+    """Write a synthetic (Berkeley) EMD file in chunks, like a detector would.
+
+    Parameters
+    ----------
+    dst : PathLike
+        The file to write.
+    signal : str
+        "spectrum_image" for a (Y, X, energy) cube or "time_series" for
+        (frames, Y, X) image frames.
+    shape : Sequence[int]
+        The shape of the signal.
+    bandwidth : Optional[float]
+        Maximum number of bytes written per second (None is unthrottled).
+    chunk_size : int
+        Approximate number of bytes written at a time.
+    rng : random.Random
+        Random number generator seeding the synthetic counts.
+
+    Returns
+    -------
+    int
+        The number of bytes of the file.
+    """
+    import h5py
+    import numpy as np
+
+    if signal == "spectrum_image":
+        dims = [("y", "px"), ("x", "px"), ("Energy", "keV")]
+        title = "EDS"
+    elif signal == "time_series":
+        dims = [("time", "s"), ("y", "px"), ("x", "px")]
+        title = "HAADF"
+    else:
+        raise ValueError(f"Unknown synthetic signal: {signal}")
+
+    counts = np.random.default_rng(rng.getrandbits(32))
+    slab_bytes = int(np.prod(shape[1:])) * np.dtype(np.uint16).itemsize
+    rows = min(max(1, chunk_size // slab_bytes), shape[0])
+
+    start = time.monotonic()
+    written = 0
+    with h5py.File(dst, "w") as f:
+        f.attrs["version_major"] = 0
+        f.attrs["version_minor"] = 2
+        group = f.create_group(f"data/{title}")
+        group.attrs["emd_group_type"] = 1
+        for i, (name, units) in enumerate(dims):
+            dim = group.create_dataset(f"dim{i + 1}", data=np.arange(shape[i]))
+            dim.attrs["name"] = name
+            dim.attrs["units"] = units
+
+        # Chunked along the first axis, so the file grows as slabs are written
+        data = group.create_dataset(
+            "data",
+            shape=tuple(shape),
+            dtype=np.uint16,
+            chunks=(rows, *shape[1:]),
+        )
+        for i in range(0, shape[0], rows):
+            slab = counts.poisson(4.0, size=(min(rows, shape[0] - i), *shape[1:]))
+            data[i : i + len(slab)] = slab
+            f.flush()
+            written += slab.nbytes
+            _throttle(written, start, bandwidth)
+
+    return Path(dst).stat().st_size
+
+
+class FileRecord:
+    """Timing of a single simulated file (times are UNIX timestamps)."""
+
+    __slots__ = (
+        "stream",
+        "path",
+        "size",
+        "write_start",
+        "write_end",
+        "ready",
+        "submitted",
+    )
+
+    def __init__(self, stream: int, path: Path) -> None:
+        self.stream = stream
+        self.path = path
+        self.size = 0
+        self.write_start = time.time()
+        self.write_end = 0.0
+        self.ready: Optional[float] = None
+        self.submitted: Optional[float] = None
+
+    @property
+    def write_time(self) -> float:
+        return self.write_end - self.write_start
+
+    @property
+    def ready_latency(self) -> Optional[float]:
+        """Seconds from the end of the write until the watcher found the file complete.
+
+        The watcher records the file in its checkpoint once it is complete,
+        so this includes the settle time of the watcher.
+        """
+        return None if self.ready is None else self.ready - self.write_end
+
+    @property
+    def submission_latency(self) -> Optional[float]:
+        """Seconds from the end of the write until the flow was submitted."""
+        return None if self.submitted is None else self.submitted - self.write_end
+
+
+class CheckpointMonitor:
+    """Read the watcher's SQLite checkpoint to time the simulated files."""
+
+    def __init__(self, checkpoint_file: PathLike) -> None:
+        # Read-only, so the watcher's writes are never blocked
+        self._conn = sqlite3.connect(
+            f"file:{Path(checkpoint_file).as_posix()}?mode=ro",
+            uri=True,
+            check_same_thread=False,
+        )
+
+    def update(self, record: FileRecord) -> None:
+        """Record when the file was found complete and submitted, if it has been."""
+        # Match the absolute path, or the path relative to the directory the
+        # watcher was started in (the simulated file names are unique), of
+        # the files recorded after the write started (not by a previous run)
+        name = record.path.name
+        for char in ("\\", "%", "_"):
+            name = name.replace(char, "\\" + char)
+        row = self._conn.execute(
+            "SELECT state, created, updated FROM checkpoint "
+            "WHERE (path = ? OR path LIKE ? ESCAPE '\\') AND created >= ? "
+            "ORDER BY created DESC LIMIT 1",
+            (str(record.path.resolve()), f"%{os.sep}{name}", record.write_start),
+        ).fetchone()
+        if row is None:
+            return
+
+        state, created, updated = row
+        record.ready = created
+        if state == "submitted":
+            record.submitted = updated
+        elif state in ("running", "succeeded"):
+            # The submission time was overwritten by a later state update,
+            # so it is approximated by the time it was first observed
+            record.submitted = record.submitted or time.time()
+
+    def close(self) -> None:
+        self._conn.close()
+
+
+class Simulator:
+    """Write files from several parallel streams following an arrival profile."""
+
+    def __init__(
+        self,
+        output_dir: PathLike,
+        arrivals: Sequence[Iterator[float]],
+        sources: Optional[List[Path]] = None,
+        synthetic: Optional[str] = None,
+        shape: Sequence[int] = (64, 64, 1024),
+        bandwidth: Optional[float] = None,
+        chunk_size: int = 4 * MB,
+        retention: float = 60.0,
+        count: Optional[int] = None,
+        seed: Optional[int] = None,
+        monitor: Optional[CheckpointMonitor] = None,
+    ) -> None:
+        """Initialize the simulator.
+
+        Parameters
+        ----------
+        output_dir : PathLike
+            The (watched) directory to write the files to.
+        arrivals : Sequence[Iterator[float]]
+            The delays between the files of each stream.
+        sources : Optional[List[Path]], optional
+            Files copied to the output directory in turn, by default None
+        synthetic : Optional[str], optional
+            Synthesize EMD files with this signal type instead of copying
+            `sources`, by default None
+        shape : Sequence[int], optional
+            The shape of the synthetic signal, by default (64, 64, 1024)
+        bandwidth : Optional[float], optional
+            Write speed (bytes per second) of each stream, by default None
+            (unthrottled)
+        chunk_size : int, optional
+            Number of bytes written at a time, by default 4 MiB
+        retention : float, optional
+            Seconds to keep each file before deleting it (negative keeps
+            the files), by default 60.0
+        count : Optional[int], optional
+            Number of files written by each stream, by default None (until
+            stopped)
+        seed : Optional[int], optional
+            Seed of the random number generators, by default None
+        monitor : Optional[CheckpointMonitor], optional
+            Monitor timing when the files are found complete and submitted by the
+            watcher, by default None
+        """
+        if not sources and synthetic is None:
+            raise ValueError("Either source files or a synthetic signal is required")
+
+        self.output_dir = Path(output_dir)
+        self.arrivals = arrivals
+        self.sources = sources or []
+        self.synthetic = synthetic
+        self.shape = shape
+        self.bandwidth = bandwidth
+        self.chunk_size = chunk_size
+        self.retention = retention
+        self.count = count
+        self.seed = seed
+        self.monitor = monitor
+
+        self.records: List[FileRecord] = []
+        self._lock = Lock()
+        self._stop = Event()
+
+    def run(
+        self, duration: Optional[float] = None, report_timeout: float = 60.0
+    ) -> List[FileRecord]:
+        """Write files until every stream is done, `duration` elapsed or Ctrl-C.
+
+        Then wait up to `report_timeout` seconds for the watcher to submit
+        the remaining files (if monitored).
+        """
+        monitor_done = Event()
+        monitor = Thread(target=self._monitor, args=(monitor_done,), daemon=True)
+        if self.monitor is not None:
+            monitor.start()
+
+        threads = [
+            Thread(target=self._stream, args=(i, arrivals), daemon=True)
+            for i, arrivals in enumerate(self.arrivals)
+        ]
+        for thread in threads:
+            thread.start()
+
+        deadline = None if duration is None else time.monotonic() + duration
+        try:
+            while any(thread.is_alive() for thread in threads):
+                if deadline is not None and time.monotonic() >= deadline:
+                    break
+                time.sleep(0.1)
+        except KeyboardInterrupt:
+            print("Stopping the simulation")
+        finally:
+            self._stop.set()
+            for thread in threads:
+                thread.join()
+
+        if self.monitor is not None:
+            deadline = time.monotonic() + report_timeout
+            try:
+                while self._pending() and time.monotonic() < deadline:
+                    time.sleep(0.1)
+            except KeyboardInterrupt:
+                pass
+            monitor_done.set()
+            monitor.join()
+        return self.records
+
+    def _pending(self) -> List[FileRecord]:
+        with self._lock:
+            return [r for r in self.records if r.submitted is None]
+
+    def _monitor(self, done: Event) -> None:
+        # Poll often, as the submission time may only be observed
+        while not done.wait(0.2):
+            for record in self._pending():
+                self.monitor.update(record)  # type: ignore[union-attr]
+
+    def _stream(self, stream: int, arrivals: Iterator[float]) -> None:
+        rng = random.Random(None if self.seed is None else self.seed + stream)
+        sources = itertools.cycle(self.sources) if self.sources else None
+        written: Deque[Tuple[float, Path]] = deque()
+
+        next_time = time.monotonic()
+        for ind, delay in enumerate(arrivals):
+            if self.count is not None and ind >= self.count:
+                break
+
+            # A stream writes one file at a time, so a slow write delays
+            # the next arrival
+            next_time += delay
+            if self._stop.wait(max(0.0, next_time - time.monotonic())):
+                break
+
+            if sources is not None:
+                src = next(sources)
+                dst = self.output_dir / f"simulator-{stream}-{ind}-{src.name}"
+            else:
+                dst = self.output_dir / f"simulator-{stream}-{ind}-{self.synthetic}.emd"
+
+            record = FileRecord(stream, dst)
+            print(f"Writing {dst}")
+            if sources is not None:
+                record.size = write_copy(src, dst, self.bandwidth, self.chunk_size)
+            else:
+                record.size = write_synthetic_emd(
+                    dst,
+                    self.synthetic,  # type: ignore[arg-type]
+                    self.shape,
+                    self.bandwidth,
+                    self.chunk_size,
+                    rng,
+                )
+            record.write_end = time.time()
+            with self._lock:
+                self.records.append(record)
+
+            # Clean up old data (to avoid running out of storage)
+            written.append((time.monotonic(), dst))
+            self._cleanup(written)
+
+    def _cleanup(self, written: Deque[Tuple[float, Path]]) -> None:
+        if self.retention < 0:
+            return
+        while written and time.monotonic() - written[0][0] >= self.retention:
+            _, path = written.popleft()
+            path.unlink(missing_ok=True)
+
+
+def _percentile(values: List[float], q: float) -> float:
+    """Nearest-rank percentile of the sorted `values`."""
+    return values[min(len(values) - 1, max(0, int(round(q / 100 * len(values))) - 1))]
+
+
+def summarize(records: List[FileRecord]) -> Dict[str, float]:
+    """Return the throughput and latency percentiles of the simulated files."""
+    summary: Dict[str, float] = {"files": len(records)}
+    if not records:
+        return summary
+
+    total_bytes = sum(r.size for r in records)
+    elapsed = max(r.write_end for r in records) - min(r.write_start for r in records)
+    summary["total_mb"] = total_bytes / MB
+    summary["throughput_mb_per_s"] = total_bytes / MB / max(elapsed, 1e-9)
+    summary["files_per_s"] = len(records) / max(elapsed, 1e-9)
+
+    for name in ("write_time", "ready_latency", "submission_latency"):
+        values = sorted(v for v in (getattr(r, name) for r in records) if v is not None)
+        summary[f"{name}_missing"] = len(records) - len(values)
+        if values:
+            for q in (50, 95, 99):
+                summary[f"{name}_p{q}"] = _percentile(values, q)
+            summary[f"{name}_max"] = values[-1]
+    return summary
+
+
+def write_report(records: List[FileRecord], report_file: PathLike) -> None:
+    """Write the timing of each file to a CSV file."""
+    with open(report_file, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(
+            [
+                "stream",
+                "path",
+                "size",
+                "write_start",
+                "write_end",
+                "write_time",
+                "ready_latency",
+                "submission_latency",
+            ]
+        )
+        for r in records:
+            writer.writerow(
+                [
+                    r.stream,
+                    r.path,
+                    r.size,
+                    r.write_start,
+                    r.write_end,
+                    r.write_time,
+                    r.ready_latency,
+                    r.submission_latency,
+                ]
+            )
 
 
 if __name__ == "__main__":
     # Parse user arguments
     parser = ArgumentParser()
     parser.add_argument(
-        "-i", "--input", type=Path, required=True, help="Input directory (or file)"
+        "-i", "--input", type=Path, default=None, help="Input directory (or file)"
     )
     parser.add_argument(
         "-o", "--output", type=Path, required=True, help="Output directory"
@@ -19,23 +507,139 @@ if __name__ == "__main__":
         "-g", "--glob", type=str, default="*.emd", help="Glob pattern for files to copy"
     )
     parser.add_argument(
-        "-t", "--time", type=int, default=10, help="Time between copies (seconds)"
+        "-t",
+        "--time",
+        type=float,
+        default=10,
+        help="Time between copies (seconds) of the fixed profile",
+    )
+    parser.add_argument(
+        "--profile",
+        choices=["fixed", "poisson", "burst", "trace"],
+        default="fixed",
+        help="Arrival profile of the files of each stream",
+    )
+    parser.add_argument(
+        "--rate", type=float, default=0.1, help="Mean files per second of each stream"
+    )
+    parser.add_argument(
+        "--burst_size", type=int, default=10, help="Number of files in a burst"
+    )
+    parser.add_argument(
+        "--burst_gap", type=float, default=0.5, help="Seconds between burst files"
     )
+    parser.add_argument(
+        "--trace", type=Path, default=None, help="File of arrival timestamps to replay"
+    )
+    parser.add_argument(
+        "--streams", type=int, default=1, help="Number of parallel streams"
+    )
+    parser.add_argument(
+        "--count", type=int, default=None, help="Number of files of each stream"
+    )
+    parser.add_argument(
+        "--duration", type=float, default=None, help="Seconds to run the simulation"
+    )
+    parser.add_argument(
+        "--write_speed",
+        type=float,
+        default=None,
+        help="Write speed (MB/s) of each stream (unthrottled by default)",
+    )
+    parser.add_argument(
+        "--chunk_size", type=float, default=4, help="Size (MB) of each write"
+    )
+    parser.add_argument(
+        "--synthetic",
+        choices=["spectrum_image", "time_series"],
+        default=None,
+        help="Write synthetic EMD files instead of copying the input files",
+    )
+    parser.add_argument(
+        "--shape",
+        type=str,
+        default="64,64,1024",
+        help="Comma separated shape of the synthetic signal",
+    )
+    parser.add_argument(
+        "--retention",
+        type=float,
+        default=None,
+        help="Seconds to keep each file before deleting it (-1 keeps the files), "
+        "by default the --time interval",
+    )
+    parser.add_argument(
+        "-p",
+        "--checkpoint_file",
+        type=Path,
+        default=None,
+        help="The watcher's SQLite checkpoint, to measure the latency of each file",
+    )
+    parser.add_argument(
+        "--report_timeout",
+        type=float,
+        default=60,
+        help="Seconds to wait for the watcher to submit the last files",
+    )
+    parser.add_argument(
+        "--report", type=Path, default=None, help="CSV file of the timing per file"
+    )
+    parser.add_argument("--seed", type=int, default=None, help="Random seed")
     args = parser.parse_args()
 
-    input_files = list(args.input.glob(args.glob))
-    print(f"Copying {len(input_files)} files from {args.input} to {args.output}")
+    input_files = []
+    if args.synthetic is None:
+        if args.input is None:
+            parser.error("--input is required unless --synthetic is set")
+        input_files = (
+            [args.input] if args.input.is_file() else sorted(args.input.glob(args.glob))
+        )
+        print(f"Copying {len(input_files)} files from {args.input} to {args.output}")
 
-    # Cycle around the input files indefinitely until the program is interrupted
-    for ind, file in enumerate(itertools.cycle(input_files)):
-        # Copy a unique file name to the output directory
-        dst_filename = f"simulator-{ind}-{file.name}"
-        dst_file = args.output / dst_filename
-        print(f"Copying {file} to {dst_file}")
-        shutil.copy(file, dst_file)
+    # Each stream has an independent arrival process
+    rng = random.Random(args.seed)
+    streams = []
+    for _ in range(args.streams):
+        stream_rng = random.Random(rng.getrandbits(32))
+        if args.profile == "fixed":
+            streams.append(fixed_arrivals(args.time))
+        elif args.profile == "poisson":
+            streams.append(poisson_arrivals(args.rate, stream_rng))
+        elif args.profile == "burst":
+            streams.append(
+                burst_arrivals(args.rate, args.burst_size, args.burst_gap, stream_rng)
+            )
+        else:
+            if args.trace is None:
+                parser.error("--trace is required by the trace profile")
+            streams.append(trace_arrivals(args.trace))
+
+    monitor = None
+    if args.checkpoint_file is not None:
+        monitor = CheckpointMonitor(args.checkpoint_file)
+
+    simulator = Simulator(
+        args.output,
+        streams,
+        sources=input_files,
+        synthetic=args.synthetic,
+        shape=[int(n) for n in args.shape.split(",")],
+        bandwidth=args.write_speed * MB if args.write_speed else None,
+        chunk_size=int(args.chunk_size * MB),
+        retention=args.time if args.retention is None else args.retention,
+        count=args.count,
+        seed=args.seed,
+        monitor=monitor,
+    )
+    records = simulator.run(args.duration, args.report_timeout)
+    if monitor is not None:
+        monitor.close()
 
-        # Sleep between each transfer to simulate the incoming data rate
-        time.sleep(args.time)
+    if args.report is not None:
+        write_report(records, args.report)
 
-        # Clean up old data (to avoid running out of storage)
-        dst_file.unlink()
+    print("Summary:")
+    for key, value in summarize(records).items():
+        print(
+            f"  {key}: {value:.3f}" if isinstance(value, float) else f"  {key}: {value}"
+        )
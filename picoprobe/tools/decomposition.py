@@ -0,0 +1,458 @@
+"""Low-rank decomposition of spectrum images with bounded memory.
+
+A spectrum image with shape (Y, X, S) is treated as a matrix of Y * X
+pixel spectra. Both decompositions stream blocks of rows from the
+(chunked) data with `reduce_spectrum_image`, so only a block of pixels
+and a few matrices of size (S, n_components) are held in memory besides
+the (Y, X, n_components) loadings.
+
+- `pca` fits a randomized PCA: one pass sketches the range of the
+  spectral covariance (X^T X Omega), a second pass projects the pixels
+  onto that basis, and the small projected problem is solved exactly.
+- `nmf` fits a non-negative factorization with online (mini-batch)
+  multiplicative updates, one pass per epoch. The statistics of each
+  pass fix the loadings, so the components are updated several times
+  per pass.
+
+By default the data is weighted for Poisson noise like HyperSpy does for
+EDS data (each count is divided by the square root of its pixel total
+times its channel total), and the results are scaled back to counts.
+"""
+from typing import Any, Optional, Sequence, Tuple, Union
+
+import numpy as np
+import numpy.typing as npt
+
+from picoprobe.tools.streaming import Reducer, reduce_spectrum_image
+
+# Blocks are converted to float32, so they are read in smaller blocks
+DEFAULT_DECOMPOSITION_BLOCK_BYTES = 64 * 1024**2
+
+# Avoids divisions by zero in the multiplicative updates
+_EPS = 1e-12
+
+
+class Decomposition:
+    """The components and loadings of a decomposed spectrum image.
+
+    The data is approximated as
+    ``row_scale * channel_scale * (mean + loadings @ components)``
+    with the loadings and components given in the weighted space.
+    """
+
+    def __init__(
+        self,
+        method: str,
+        components: np.ndarray,
+        loadings: np.ndarray,
+        mean: np.ndarray,
+        row_scale: np.ndarray,
+        channel_scale: np.ndarray,
+        explained_variance: Optional[np.ndarray] = None,
+        total_variance: Optional[float] = None,
+    ) -> None:
+        self.method = method
+        """The decomposition algorithm, "pca" or "nmf"."""
+        self.components = components
+        """The component spectra (weighted) with shape (n_components, S)."""
+        self.loadings = loadings
+        """The loading maps (weighted) with shape (Y, X, n_components)."""
+        self.mean = mean
+        """The mean spectrum (weighted) removed before the decomposition."""
+        self.row_scale = row_scale
+        """The Poisson weight of each pixel with shape (Y, X)."""
+        self.channel_scale = channel_scale
+        """The Poisson weight of each channel with shape (S,)."""
+        self.explained_variance = explained_variance
+        """The variance explained by each PCA component."""
+        self.total_variance = total_variance
+        """The total variance of the (weighted) data, for PCA."""
+
+    @property
+    def n_components(self) -> int:
+        return self.components.shape[0]
+
+    @property
+    def component_spectra(self) -> np.ndarray:
+        """The component spectra in counts with shape (n_components, S)."""
+        return self.components * self.channel_scale
+
+    @property
+    def loading_maps(self) -> np.ndarray:
+        """The loading maps in counts with shape (n_components, Y, X)."""
+        return np.moveaxis(self.loadings * self.row_scale[..., None], -1, 0)
+
+    @property
+    def explained_variance_ratio(self) -> Optional[np.ndarray]:
+        """The fraction of the total variance explained by each PCA component."""
+        if self.explained_variance is None or not self.total_variance:
+            return None
+        return self.explained_variance / self.total_variance
+
+    def reconstruct(self, rows: Union[slice, int] = slice(None)) -> np.ndarray:
+        """Return the denoised (low-rank) spectra of the given rows of pixels."""
+        model = self.mean + self.loadings[rows] @ self.components
+        return model * self.row_scale[rows][..., None] * self.channel_scale
+
+    def save(self, path: Any) -> None:
+        """Save the decomposition to a compressed .npz file."""
+        arrays = {
+            "method": np.array(self.method),
+            "components": self.components,
+            "loadings": self.loadings,
+            "mean": self.mean,
+            "row_scale": self.row_scale,
+            "channel_scale": self.channel_scale,
+        }
+        if self.explained_variance is not None:
+            arrays["explained_variance"] = self.explained_variance
+        np.savez_compressed(path, **arrays)
+
+
+def poisson_scales(
+    image: npt.ArrayLike, spectrum: npt.ArrayLike
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Return the Poisson noise weights of the pixels and channels.
+
+    Parameters
+    ----------
+    image : npt.ArrayLike
+        The spectrum image summed over channels with shape (Y, X).
+    spectrum : npt.ArrayLike
+        The spectrum image summed over pixels with shape (S,).
+
+    Returns
+    -------
+    np.ndarray
+        The weight of each pixel with shape (Y, X).
+    np.ndarray
+        The weight of each channel with shape (S,).
+    """
+    scales = []
+    for total in (image, spectrum):
+        total = np.asarray(total, dtype=np.float64)
+        mean = total.mean()
+        scale = np.sqrt(total / mean) if mean > 0 else np.ones_like(total)
+        # Pixels and channels without counts are left unweighted
+        scale[scale == 0] = 1.0
+        scales.append(scale.astype(np.float32))
+    return scales[0], scales[1]
+
+
+class _PixelReducer(Reducer):
+    """Convert each block to weighted float32 pixel spectra with shape (n, S)."""
+
+    def __init__(
+        self, row_scale: Optional[np.ndarray], channel_scale: Optional[np.ndarray]
+    ) -> None:
+        self.row_scale = row_scale
+        self.channel_scale = channel_scale
+
+    def pixels(self, rows: slice, block: np.ndarray) -> np.ndarray:
+        x = block.reshape(-1, block.shape[-1]).astype(np.float32)
+        if self.row_scale is not None:
+            x /= self.row_scale[rows].reshape(-1, 1)
+        if self.channel_scale is not None:
+            x /= self.channel_scale
+        return x
+
+
+class CovarianceSketch(_PixelReducer):
+    """Sketch the range of the spectral covariance, X^T X Omega, in one pass."""
+
+    def __init__(
+        self,
+        omega: np.ndarray,
+        row_scale: Optional[np.ndarray] = None,
+        channel_scale: Optional[np.ndarray] = None,
+    ) -> None:
+        super().__init__(row_scale, channel_scale)
+        self.omega = omega.astype(np.float32)
+
+    def start(self, shape: Sequence[int], dtype: np.dtype) -> None:
+        self.sketch = np.zeros((shape[2], self.omega.shape[1]), dtype=np.float64)
+        self.total = np.zeros(shape[2], dtype=np.float64)
+        self.sum_squares = 0.0
+        self.count = 0
+
+    def update(self, rows: slice, block: np.ndarray) -> None:
+        x = self.pixels(rows, block)
+        self.sketch += x.T @ (x @ self.omega)
+        self.total += x.sum(axis=0, dtype=np.float64)
+        self.sum_squares += float(np.einsum("ij,ij->", x, x, dtype=np.float64))
+        self.count += x.shape[0]
+
+    @property
+    def mean(self) -> np.ndarray:
+        return self.total / max(self.count, 1)
+
+    @property
+    def total_variance(self) -> float:
+        """The summed variance of every channel."""
+        centered = self.sum_squares - self.count * float(self.mean @ self.mean)
+        return max(centered, 0.0) / max(self.count - 1, 1)
+
+    def result(self) -> np.ndarray:
+        """Return the sketch of the centered covariance with shape (S, l)."""
+        return self.sketch - np.outer(self.total, self.mean @ self.omega)
+
+
+class PixelProjection(_PixelReducer):
+    """Project every (centered) pixel spectrum onto a basis of spectra."""
+
+    def __init__(
+        self,
+        basis: np.ndarray,
+        mean: Optional[np.ndarray] = None,
+        row_scale: Optional[np.ndarray] = None,
+        channel_scale: Optional[np.ndarray] = None,
+    ) -> None:
+        super().__init__(row_scale, channel_scale)
+        self.basis = basis.astype(np.float32)
+        self.offset = None if mean is None else (mean @ basis).astype(np.float32)
+
+    def start(self, shape: Sequence[int], dtype: np.dtype) -> None:
+        n = self.basis.shape[1]
+        self.scores = np.zeros((shape[0], shape[1], n), dtype=np.float32)
+
+    def update(self, rows: slice, block: np.ndarray) -> None:
+        scores = self.pixels(rows, block) @ self.basis
+        if self.offset is not None:
+            scores -= self.offset
+        self.scores[rows] = scores.reshape(block.shape[0], block.shape[1], -1)
+
+    def result(self) -> np.ndarray:
+        return self.scores
+
+
+class NMFUpdate(_PixelReducer):
+    """Accumulate one epoch of online NMF updates of the component spectra."""
+
+    def __init__(
+        self,
+        components: np.ndarray,
+        n_inner: int = 10,
+        row_scale: Optional[np.ndarray] = None,
+        channel_scale: Optional[np.ndarray] = None,
+        keep_loadings: bool = False,
+    ) -> None:
+        super().__init__(row_scale, channel_scale)
+        self.components = components.astype(np.float32)
+        self.n_inner = n_inner
+        self.keep_loadings = keep_loadings
+
+    def start(self, shape: Sequence[int], dtype: np.dtype) -> None:
+        k = self.components.shape[0]
+        self.gram = np.zeros((k, k), dtype=np.float64)
+        self.cross = np.zeros((k, shape[2]), dtype=np.float64)
+        self.loadings = (
+            np.zeros((shape[0], shape[1], k), dtype=np.float32)
+            if self.keep_loadings
+            else None
+        )
+
+    def loadings_of(self, x: np.ndarray) -> np.ndarray:
+        """Fit the non-negative loadings of pixel spectra for fixed components."""
+        h = self.components
+        hht = h @ h.T
+        xht = np.maximum(x @ h.T, 0)
+        w = xht / (np.diag(hht) + _EPS)
+        for _ in range(self.n_inner):
+            w *= xht / (w @ hht + _EPS)
+        return w
+
+    def update(self, rows: slice, block: np.ndarray) -> None:
+        x = np.maximum(self.pixels(rows, block), 0)
+        w = self.loadings_of(x)
+        self.gram += w.T @ w
+        self.cross += w.T @ x
+        if self.loadings is not None:
+            self.loadings[rows] = w.reshape(block.shape[0], block.shape[1], -1)
+
+    def result(self) -> np.ndarray:
+        """Return the updated component spectra with shape (k, S)."""
+        h = self.components.astype(np.float64)
+        # The loadings are fixed during the epoch, so the components are
+        # updated several times without reading the data again
+        for _ in range(self.n_inner):
+            h *= self.cross / (self.gram @ h + _EPS)
+        # Fix the scale of the components (the loadings absorb it)
+        norms = np.linalg.norm(h, axis=1, keepdims=True)
+        return (h / np.maximum(norms, _EPS)).astype(np.float32)
+
+
+def _scales(
+    data: Any,
+    image: Optional[npt.ArrayLike],
+    spectrum: Optional[npt.ArrayLike],
+) -> Tuple[np.ndarray, np.ndarray]:
+    if image is None or spectrum is None:
+        return (
+            np.ones(data.shape[:2], dtype=np.float32),
+            np.ones(data.shape[2], dtype=np.float32),
+        )
+    return poisson_scales(image, spectrum)
+
+
+def pca(
+    data: Any,
+    n_components: int = 8,
+    image: Optional[npt.ArrayLike] = None,
+    spectrum: Optional[npt.ArrayLike] = None,
+    oversample: int = 10,
+    seed: int = 0,
+    max_block_bytes: int = DEFAULT_DECOMPOSITION_BLOCK_BYTES,
+) -> Decomposition:
+    """Fit a randomized PCA of a spectrum image in two streaming passes.
+
+    Parameters
+    ----------
+    data : Any
+        The spectrum image with shape (Y, X, S), as an h5py dataset, dask
+        array or NumPy array.
+    n_components : int, optional
+        The number of components, by default 8
+    image : Optional[npt.ArrayLike], optional
+        The spectrum image summed over channels, used with `spectrum` to
+        weight the data for Poisson noise, by default None (no weighting)
+    spectrum : Optional[npt.ArrayLike], optional
+        The spectrum image summed over pixels, by default None
+    oversample : int, optional
+        Extra dimensions of the sketch, which improve the accuracy of the
+        last components, by default 10
+    seed : int, optional
+        The seed of the random sketch, by default 0
+    max_block_bytes : int, optional
+        Approximate upper bound of the size of a block of data read,
+        by default 64 MiB
+
+    Returns
+    -------
+    Decomposition
+        The principal components and their loadings.
+    """
+    n_channels = data.shape[2]
+    n_components = min(n_components, n_channels)
+    rank = min(n_components + oversample, n_channels)
+    row_scale, channel_scale = _scales(data, image, spectrum)
+
+    # Pass 1: sketch the range of the covariance matrix
+    rng = np.random.default_rng(seed)
+    omega = rng.standard_normal((n_channels, rank))
+    sketch = CovarianceSketch(omega, row_scale, channel_scale)
+    reduce_spectrum_image(data, [sketch], max_block_bytes)
+    basis, _ = np.linalg.qr(sketch.result())
+
+    # Pass 2: project the centered pixels onto the basis
+    projection = PixelProjection(basis, sketch.mean, row_scale, channel_scale)
+    reduce_spectrum_image(data, [projection], max_block_bytes)
+    scores = projection.result()
+
+    # Solve the small (rank x rank) eigenproblem of the projected covariance
+    flat = scores.reshape(-1, rank).astype(np.float64)
+    covariance = flat.T @ flat / max(flat.shape[0] - 1, 1)
+    eigenvalues, eigenvectors = np.linalg.eigh(covariance)
+    order = np.argsort(eigenvalues)[::-1][:n_components]
+    eigenvalues, eigenvectors = eigenvalues[order], eigenvectors[:, order]
+
+    components = (basis @ eigenvectors).T
+    # Make the largest entry of each component spectrum positive
+    signs = np.sign(components[np.arange(n_components), np.abs(components).argmax(1)])
+    signs[signs == 0] = 1
+    components *= signs[:, None]
+    eigenvectors = eigenvectors * signs
+
+    loadings = (scores @ eigenvectors.astype(np.float32)).astype(np.float32)
+    return Decomposition(
+        "pca",
+        components.astype(np.float32),
+        loadings,
+        sketch.mean.astype(np.float32),
+        row_scale,
+        channel_scale,
+        np.maximum(eigenvalues, 0),
+        sketch.total_variance,
+    )
+
+
+def nmf(
+    data: Any,
+    n_components: int = 8,
+    image: Optional[npt.ArrayLike] = None,
+    spectrum: Optional[npt.ArrayLike] = None,
+    n_epochs: int = 10,
+    n_inner: int = 10,
+    init: Optional[npt.ArrayLike] = None,
+    seed: int = 0,
+    max_block_bytes: int = DEFAULT_DECOMPOSITION_BLOCK_BYTES,
+) -> Decomposition:
+    """Fit a non-negative matrix factorization of a spectrum image online.
+
+    Each epoch is a streaming pass that fits the loadings of every block
+    of pixels for the current components and accumulates the statistics
+    of the multiplicative update of the components. A final pass computes
+    the loadings of the converged components.
+
+    Parameters
+    ----------
+    data : Any
+        The spectrum image with shape (Y, X, S), as an h5py dataset, dask
+        array or NumPy array.
+    n_components : int, optional
+        The number of components, by default 8
+    image : Optional[npt.ArrayLike], optional
+        The spectrum image summed over channels, used with `spectrum` to
+        weight the data for Poisson noise, by default None (no weighting)
+    spectrum : Optional[npt.ArrayLike], optional
+        The spectrum image summed over pixels, by default None
+    n_epochs : int, optional
+        The number of passes updating the components, by default 10. On
+        synthetic EDS data, the reconstruction error is then within about
+        10% of that of PCA with the same number of components.
+    n_inner : int, optional
+        The number of multiplicative updates of the loadings of each
+        block, by default 10
+    init : Optional[npt.ArrayLike], optional
+        The initial component spectra with shape (n_components, S), e.g.,
+        the absolute values of PCA components, by default None (random)
+    seed : int, optional
+        The seed of the random initialization, by default 0
+    max_block_bytes : int, optional
+        Approximate upper bound of the size of a block of data read,
+        by default 64 MiB
+
+    Returns
+    -------
+    Decomposition
+        The non-negative components and their loadings.
+    """
+    n_channels = data.shape[2]
+    row_scale, channel_scale = _scales(data, image, spectrum)
+
+    if init is None:
+        rng = np.random.default_rng(seed)
+        components = rng.uniform(0.1, 1.0, size=(n_components, n_channels))
+    else:
+        components = np.abs(np.asarray(init, dtype=np.float64)) + _EPS
+    components /= np.linalg.norm(components, axis=1, keepdims=True)
+
+    for _ in range(n_epochs):
+        update = NMFUpdate(components, n_inner, row_scale, channel_scale)
+        reduce_spectrum_image(data, [update], max_block_bytes)
+        components = update.result()
+
+    # Final pass: the loadings of the converged components
+    update = NMFUpdate(
+        components, n_inner, row_scale, channel_scale, keep_loadings=True
+    )
+    reduce_spectrum_image(data, [update], max_block_bytes)
+    assert update.loadings is not None
+
+    return Decomposition(
+        "nmf",
+        components.astype(np.float32),
+        update.loadings,
+        np.zeros(n_channels, dtype=np.float32),
+        row_scale,
+        channel_scale,
+    )
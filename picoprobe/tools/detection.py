@@ -0,0 +1,143 @@
+"""Run YOLO object detection on stacks of image frames in process.
+
+The normalized 8-bit frames (see `picoprobe.tools.video`) are fed to the
+detector in batches by the "detect" stage of the temporal analysis
+pipeline, without encoding and decoding a video in between. Loaded models are cached at
+module level, so a long-lived compute worker only loads each model once.
+"""
+import threading
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Union
+
+import numpy as np
+
+PathLike = Union[str, Path]
+
+# The columns of the detection tables
+DETECTION_COLUMNS = ("frame", "x1", "y1", "x2", "y2", "confidence", "class")
+
+_models: Dict[str, Any] = {}
+_models_lock = threading.Lock()
+
+
+def load_model(model_path: PathLike) -> Any:
+    """Return the YOLO model, loading it on first use in this process."""
+    key = str(model_path)
+    with _models_lock:
+        model = _models.get(key)
+        if model is None:
+            from ultralytics import YOLO
+
+            model = YOLO(key)
+            _models[key] = model
+        return model
+
+
+def iter_frame_batches(
+    blocks: Iterable[np.ndarray], batch_size: int
+) -> Iterator[List[np.ndarray]]:
+    """Regroup blocks of uint8 (T, Y, X) frames into batches of (Y, X, 3) images."""
+    batch: List[np.ndarray] = []
+    for block in blocks:
+        for frame in block:
+            # The detector expects 3 channel images
+            batch.append(np.repeat(frame[..., None], 3, axis=2))
+            if len(batch) == batch_size:
+                yield batch
+                batch = []
+    if batch:
+        yield batch
+
+
+def empty_detections() -> Dict[str, np.ndarray]:
+    """Return a detection table without rows."""
+    return {
+        "frame": np.zeros(0, dtype=np.int32),
+        "x1": np.zeros(0, dtype=np.float32),
+        "y1": np.zeros(0, dtype=np.float32),
+        "x2": np.zeros(0, dtype=np.float32),
+        "y2": np.zeros(0, dtype=np.float32),
+        "confidence": np.zeros(0, dtype=np.float32),
+        "class": np.zeros(0, dtype=np.int16),
+    }
+
+
+class Detector:
+    """Detect objects in consecutive batches of frames with a (cached) YOLO model."""
+
+    def __init__(
+        self,
+        model_path: PathLike,
+        conf: float = 0.25,
+        device: str = "cpu",
+        annotated_video: Optional[PathLike] = None,
+        fps: float = 100,
+    ) -> None:
+        """Initialize the detector.
+
+        Parameters
+        ----------
+        model_path : PathLike
+            The path to the YOLO model weights.
+        conf : float, optional
+            The minimum confidence of the detections, by default 0.25
+        device : str, optional
+            The device running the model, by default "cpu"
+        annotated_video : Optional[PathLike], optional
+            Also write a video of the frames annotated with the detected
+            boxes, by default None
+        fps : float, optional
+            The frame rate of the annotated video, by default 100
+        """
+        self.model = load_model(model_path)
+        self.conf = conf
+        self.device = device
+        self.next_frame = 0
+        self.columns: Dict[str, List[np.ndarray]] = {
+            name: [] for name in DETECTION_COLUMNS
+        }
+        self.writer = None
+        if annotated_video is not None:
+            import imageio
+
+            self.writer = imageio.get_writer(annotated_video, fps=fps)
+
+    def predict(self, batch: List[np.ndarray]) -> None:
+        """Detect objects in the next batch of (Y, X, 3) uint8 frames."""
+        results = self.model.predict(
+            source=batch, conf=self.conf, device=self.device, verbose=False
+        )
+        for i, result in enumerate(results):
+            boxes = result.boxes
+            xyxy = boxes.xyxy.cpu().numpy().astype(np.float32).reshape(-1, 4)
+            self.columns["frame"].append(
+                np.full(len(xyxy), self.next_frame + i, dtype=np.int32)
+            )
+            for j, name in enumerate(("x1", "y1", "x2", "y2")):
+                self.columns[name].append(xyxy[:, j])
+            self.columns["confidence"].append(
+                boxes.conf.cpu().numpy().astype(np.float32)
+            )
+            self.columns["class"].append(boxes.cls.cpu().numpy().astype(np.int16))
+            if self.writer is not None:
+                # The annotated frames are BGR images
+                self.writer.append_data(result.plot()[..., ::-1])
+        self.next_frame += len(batch)
+
+    def close(self) -> None:
+        """Finish writing the annotated video."""
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+
+    def result(self) -> Dict[str, np.ndarray]:
+        """Return the detections as columns (see `DETECTION_COLUMNS`).
+
+        The columns are the frame index, the box corners in pixels, the
+        confidence and the class of each detection.
+        """
+        detections = empty_detections()
+        for name, values in self.columns.items():
+            if values:
+                detections[name] = np.concatenate(values).astype(detections[name].dtype)
+        return detections
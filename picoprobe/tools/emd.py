@@ -0,0 +1,408 @@
+"""Helpers to inspect EMD (HDF5) files without reading their data arrays."""
+import json
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Union
+
+import h5py
+import numpy as np
+
+PathLike = Union[str, Path]
+
+# Signal types in order of precedence
+SIGNAL_TYPES = ("spectrum_image", "time_series", "image")
+
+# The HyperSpy `select_type` of each Velox signal type
+_VELOX_SELECT_TYPES = {
+    "spectrum_image": "spectrum_image",
+    "time_series": "image",
+    "image": "image",
+}
+
+
+class SignalInfo:
+    """Header information of a signal stored in an EMD file."""
+
+    __slots__ = ("name", "kind", "format", "shape", "dtype", "chunks", "metadata")
+
+    def __init__(
+        self,
+        name: str,
+        kind: str,
+        format: str,
+        shape: Tuple[int, ...],
+        dtype: np.dtype,
+        chunks: Optional[Tuple[int, ...]] = None,
+        metadata: Optional[str] = None,
+    ) -> None:
+        self.name = name
+        """The HDF5 path of the signal group."""
+        self.kind = kind
+        """The signal type (see `signal_type`)."""
+        self.format = format
+        """The EMD flavor, "velox" or "berkeley"."""
+        self.shape = shape
+        """The shape of the stored data (Velox spectrum streams are 1-D)."""
+        self.dtype = dtype
+        """The dtype of the stored data."""
+        self.chunks = chunks
+        """The HDF5 chunk shape of the data, if chunked."""
+        self.metadata = metadata
+        """The HDF5 path of the metadata dataset, if any."""
+
+    def __repr__(self) -> str:
+        return (
+            f"SignalInfo(name={self.name!r}, kind={self.kind!r}, "
+            f"shape={self.shape}, dtype={self.dtype})"
+        )
+
+    @property
+    def nbytes(self) -> int:
+        return int(np.prod(self.shape, dtype=np.int64)) * self.dtype.itemsize
+
+    def load_kwargs(self) -> Dict[str, Any]:
+        """Return the `hyperspy.api.load` arguments that load only this signal."""
+        if self.format == "velox":
+            return {"select_type": _VELOX_SELECT_TYPES[self.kind]}
+        return {"dataset_path": self.name}
+
+
+def probe(path: PathLike) -> List[SignalInfo]:
+    """List the signals of an EMD file by reading only the HDF5 headers.
+
+    Parameters
+    ----------
+    path : PathLike
+        The path to the EMD file.
+
+    Returns
+    -------
+    List[SignalInfo]
+        The shape, dtype and location of each signal, in file order.
+    """
+    with h5py.File(path, "r") as f:
+        # Velox EMD files store each signal under /Data/<type>/<uuid>/Data
+        data = f.get("Data")
+        if isinstance(data, h5py.Group):
+            return _velox_signals(data)
+
+        # Berkeley EMD files mark each signal group with emd_group_type=1
+        signals: List[SignalInfo] = []
+
+        def visit(name: str, obj: object) -> None:
+            if isinstance(obj, h5py.Group) and obj.attrs.get("emd_group_type") == 1:
+                dataset = obj.get("data")
+                if isinstance(dataset, h5py.Dataset):
+                    signals.append(
+                        SignalInfo(
+                            obj.name,
+                            _berkeley_signal_type(obj),
+                            "berkeley",
+                            dataset.shape,
+                            dataset.dtype,
+                            dataset.chunks,
+                        )
+                    )
+
+        f.visititems(visit)
+        return signals
+
+
+def find_signal(path: PathLike, kinds: Union[str, Sequence[str]]) -> SignalInfo:
+    """Return the largest signal of the first of `kinds` found in the EMD file.
+
+    Raises
+    ------
+    ValueError
+        If the file contains no signal of the given types.
+    """
+    if isinstance(kinds, str):
+        kinds = [kinds]
+    signals = probe(path)
+    for kind in kinds:
+        matches = [signal for signal in signals if signal.kind == kind]
+        if matches:
+            return max(matches, key=lambda signal: signal.nbytes)
+    raise ValueError(f"No {' or '.join(kinds)} signal found in: {path}")
+
+
+def load_signal(
+    path: PathLike, kinds: Union[str, Sequence[str]], lazy: bool = True
+) -> Any:
+    """Load a single signal of the EMD file with HyperSpy.
+
+    The file structure is probed first, so that only the signal of interest
+    is read (rather than every detector channel in the file).
+
+    Parameters
+    ----------
+    path : PathLike
+        The path to the EMD file.
+    kinds : Union[str, Sequence[str]]
+        The signal type (or types, in order of preference) to load.
+    lazy : bool, optional
+        Load the data lazily, by default True
+
+    Returns
+    -------
+    hyperspy.signal.BaseSignal
+        The signal.
+
+    Raises
+    ------
+    ValueError
+        If the file contains no signal of the given types.
+    """
+    import hyperspy.api as hs
+
+    info = find_signal(path, kinds)
+    signals = hs.load(path, lazy=lazy, **info.load_kwargs())
+    if not isinstance(signals, list):
+        return signals
+
+    # A Velox file may hold several signals of the same type (e.g., the
+    # HAADF and BF images), pick the one with the probed size
+    for signal in signals:
+        if signal.data.size == int(np.prod(info.shape)):
+            return signal
+    for signal in signals:
+        if signal.data.ndim == 3:
+            return signal
+    return signals[0]
+
+
+def read_metadata(path: PathLike, info: SignalInfo) -> Dict[str, Any]:
+    """Read the metadata of a signal, without reading its data.
+
+    Velox stores the JSON metadata of each frame as a byte array; the
+    metadata of the first frame is returned. For Berkeley EMD files, the
+    attributes of the signal group are returned.
+    """
+    with h5py.File(path, "r") as f:
+        if info.metadata is not None:
+            dataset = f[info.metadata]
+            raw = dataset[:, 0] if dataset.ndim == 2 else dataset[()]
+            text = np.asarray(raw, dtype=np.uint8).tobytes().rstrip(b"\0")
+            return json.loads(text.decode(errors="ignore"))
+
+        metadata = {}
+        for key, value in f[info.name].attrs.items():
+            if isinstance(value, bytes):
+                value = value.decode(errors="ignore")
+            elif isinstance(value, np.generic):
+                value = value.item()
+            elif isinstance(value, np.ndarray):
+                value = value.tolist()
+            metadata[key] = value
+        return metadata
+
+
+def signal_metadata(path: PathLike, info: SignalInfo) -> Dict[str, Any]:
+    """Return the HyperSpy-style metadata of a signal, without reading its data.
+
+    The dictionary has the layout of `signal.metadata.as_dictionary()` for
+    a signal loaded with HyperSpy (General, Signal and, for Velox files,
+    Acquisition_instrument) and is JSON serializable. Only the common
+    fields are reconstructed (e.g., not the EDS detector settings or the
+    noise properties), see `merge_metadata` to complete them.
+
+    Parameters
+    ----------
+    path : PathLike
+        The path to the EMD file.
+    info : SignalInfo
+        The signal (see `probe`).
+
+    Returns
+    -------
+    Dict[str, Any]
+        The metadata dictionary.
+    """
+    raw = read_metadata(path, info)
+    is_eds = info.kind == "spectrum_image"
+    metadata: Dict[str, Any] = {
+        "General": {
+            "title": Path(info.name).name,
+            "original_filename": Path(path).name,
+        },
+        "Signal": {"signal_type": "EDS_TEM" if is_eds else ""},
+    }
+    if info.format != "velox":
+        title = raw.get("title")
+        if isinstance(title, str) and title:
+            metadata["General"]["title"] = title
+        return metadata
+
+    # The detector name is the signal title (e.g., "HAADF", "BF" or "EDS")
+    detector = raw.get("BinaryResult", {}).get("Detector")
+    metadata["General"]["title"] = "EDS" if is_eds else detector or info.name
+
+    timestamp = raw.get("Acquisition", {}).get("AcquisitionStartDatetime", {})
+    timestamp = _to_float(timestamp.get("DateTime"))
+    if timestamp is not None:
+        started = datetime.fromtimestamp(timestamp, tz=timezone.utc)
+        metadata["General"]["date"] = started.date().isoformat()
+        metadata["General"]["time"] = started.time().isoformat()
+        metadata["General"]["time_zone"] = "UTC"
+
+    # Convert the Velox units (V, m, rad) to the HyperSpy ones (kV, mm, deg)
+    optics = raw.get("Optics", {})
+    stage = raw.get("Stage", {})
+    tem = {
+        "beam_energy": _scaled(optics.get("AccelerationVoltage"), 1e-3),
+        "camera_length": _scaled(optics.get("CameraLength"), 1e3),
+        "magnification": _scaled(optics.get("NominalMagnification"), 1.0),
+        "microscope": raw.get("Instrument", {}).get("InstrumentModel"),
+        "Stage": {
+            "tilt_alpha": _scaled(stage.get("AlphaTilt"), 180 / np.pi),
+            "tilt_beta": _scaled(stage.get("BetaTilt"), 180 / np.pi),
+            "x": _scaled(stage.get("Position", {}).get("x"), 1e3),
+            "y": _scaled(stage.get("Position", {}).get("y"), 1e3),
+            "z": _scaled(stage.get("Position", {}).get("z"), 1e3),
+        },
+    }
+    tem["Stage"] = {k: v for k, v in tem["Stage"].items() if v is not None}
+    tem = {k: v for k, v in tem.items() if v not in (None, {})}
+    if tem:
+        metadata["Acquisition_instrument"] = {"TEM": tem}
+    return metadata
+
+
+def file_metadata(path: PathLike) -> Dict[str, Dict[str, Any]]:
+    """Return the metadata of every signal of an EMD file, keyed by title.
+
+    Only the HDF5 headers and metadata datasets are read, so this takes
+    milliseconds regardless of the file size.
+    """
+    metadata = {}
+    for info in probe(path):
+        signal = signal_metadata(path, info)
+        metadata[signal["General"]["title"]] = signal
+    return metadata
+
+
+def hyperspy_metadata(path: PathLike) -> Dict[str, Dict[str, Any]]:
+    """Return the metadata of every signal of a file loaded with HyperSpy, keyed by title.
+
+    The signals are loaded lazily, so their data arrays are not read, but
+    the file is parsed by HyperSpy (which is much slower than `file_metadata`).
+    """
+    import hyperspy.api as hs
+
+    signals = hs.load(path, lazy=True)
+    if not isinstance(signals, list):
+        signals = [signals]
+    return {
+        signal.metadata.General.title: signal.metadata.as_dictionary()
+        for signal in signals
+    }
+
+
+def merge_metadata(
+    metadata: Dict[str, Any], reference: Dict[str, Any]
+) -> Dict[str, Any]:
+    """Return the `metadata` completed (recursively) with the `reference` metadata.
+
+    The values of the `reference` (e.g., `hyperspy_metadata`) take precedence,
+    and the fields it does not have are kept.
+    """
+    merged = dict(metadata)
+    for key, value in reference.items():
+        if isinstance(value, dict) and isinstance(merged.get(key), dict):
+            merged[key] = merge_metadata(merged[key], value)
+        else:
+            merged[key] = value
+    return merged
+
+
+def _to_float(value: Any) -> Optional[float]:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _scaled(value: Any, scale: float) -> Optional[float]:
+    value = _to_float(value)
+    return None if value is None else value * scale
+
+
+def signal_type(path: PathLike) -> str:
+    """Classify the main signal of an EMD file from its HDF5 structure.
+
+    Only the dataset shapes are read, so this takes milliseconds regardless
+    of the file size.
+
+    Parameters
+    ----------
+    path : PathLike
+        The path to the EMD file.
+
+    Returns
+    -------
+    str
+        "spectrum_image" for a 3-D spectrum image (e.g., an EDS cube),
+        "time_series" for a stack of image frames, "image" for a single
+        image, or "unknown" otherwise.
+    """
+    kinds = {signal.kind for signal in probe(path)}
+    for kind in SIGNAL_TYPES:
+        if kind in kinds:
+            return kind
+    return "unknown"
+
+
+def _velox_signals(data: h5py.Group) -> List[SignalInfo]:
+    signals = []
+    for group_type in ("SpectrumStream", "SpectrumImage", "Image", "Spectrum"):
+        groups = data.get(group_type)
+        if not isinstance(groups, h5py.Group):
+            continue
+        for group in groups.values():
+            dataset = group.get("Data")
+            if not isinstance(dataset, h5py.Dataset):
+                continue
+            if group_type in ("SpectrumStream", "SpectrumImage"):
+                kind = "spectrum_image"
+            elif group_type == "Image":
+                # Velox stores image stacks with shape (Y, X, frames)
+                is_stack = dataset.ndim == 3 and dataset.shape[2] > 1
+                kind = "time_series" if is_stack else "image"
+            else:
+                kind = "unknown"
+            metadata = group.get("Metadata")
+            signals.append(
+                SignalInfo(
+                    group.name,
+                    kind,
+                    "velox",
+                    dataset.shape,
+                    dataset.dtype,
+                    dataset.chunks,
+                    metadata.name if isinstance(metadata, h5py.Dataset) else None,
+                )
+            )
+    return signals
+
+
+def _berkeley_signal_type(group: h5py.Group) -> str:
+    dataset = group.get("data")
+    if not isinstance(dataset, h5py.Dataset) or dataset.ndim < 2:
+        return "unknown"
+    if dataset.ndim == 2:
+        return "image"
+
+    # The name and units of each dimension are attributes of dim1, dim2, ...
+    labels = []
+    for i in range(dataset.ndim):
+        dim = group.get(f"dim{i + 1}")
+        if dim is not None:
+            for key in ("name", "units"):
+                value = dim.attrs.get(key, b"")
+                if isinstance(value, bytes):
+                    value = value.decode(errors="ignore")
+                labels.append(str(value).lower())
+
+    if any("energy" in label or label in ("ev", "kev") for label in labels):
+        return "spectrum_image"
+    return "time_series"
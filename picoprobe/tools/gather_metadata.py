@@ -2,10 +2,15 @@ from gladier import GladierBaseTool, generate_flow_definition
 
 
 def gather_metadata(**data):
-    import json
     from pathlib import Path
 
-    import hyperspy.api as hs
+    from picoprobe.tools.emd import file_metadata, hyperspy_metadata, merge_metadata
+    from picoprobe.tools.serialization import (
+        DEFAULT_MAX_ARRAY_SIZE,
+        dumps,
+        to_jsonable,
+        write_sidecar,
+    )
 
     # General experiment metadata
     metadata = {
@@ -21,22 +26,32 @@ def gather_metadata(**data):
     e_metadata = {}
     experiment_file = data["publishv2"]["dataset"]
 
-    # TODO: Talk to Nestor to confirm we have all the metadata
-
     try:
-        # Load the microscopy dataset and extract metadata
-        signals = hs.load(experiment_file)
-
-        # Load each field from the experiment metadata (e.g., "HAADF", "BFS", etc.)
-        for dataset in signals:
-            e_metadata[
-                dataset.metadata.General.title
-            ] = dataset.metadata.as_dictionary()
+        # Read the metadata of each signal (e.g., "HAADF", "BF", etc.) from
+        # the file headers, without reading the data arrays
+        e_metadata = file_metadata(experiment_file)
     except Exception as e:
-        print(f"Error loading metadata: {e}")
+        print(f"Error reading metadata headers: {e}")
+
+    # Loading the file with HyperSpy is slow, so it only completes the fields
+    # the headers do not provide (e.g., the EDS detector settings) on request,
+    # or reads the metadata of files that are not EMD
+    if data.get("complete_metadata", False) or not e_metadata:
+        try:
+            e_metadata = merge_metadata(e_metadata, hyperspy_metadata(experiment_file))
+        except Exception as e:
+            print(f"Error loading metadata: {e}")
+
+    # Convert the metadata to JSON types, moving the large arrays to a sidecar file
+    arrays = {}
+    max_array_size = data.get("max_metadata_array_size", DEFAULT_MAX_ARRAY_SIZE)
+    e_metadata = to_jsonable(e_metadata, max_array_size, arrays)
+    sidecar_file = Path(experiment_file).parent / "metadata.npz"
+    sidecar = write_sidecar(arrays, sidecar_file)
 
     # Add the experiment metadata to the general metadata
     metadata["experiment_metadata"] = e_metadata
+    metadata["experiment_metadata_arrays"] = str(sidecar) if sidecar else None
 
     # Update the output data with the experiment metadata
     final_data = data["publishv2"]
@@ -45,7 +60,7 @@ def gather_metadata(**data):
     # Save the metadata to a file
     metadata_file = Path(experiment_file).parent / "metadata.json"
     with open(metadata_file, "w") as f:
-        f.write(json.dumps(final_data, indent=4))
+        f.write(dumps(final_data, data.get("metadata_indent")))
 
     return final_data
 
@@ -2,7 +2,7 @@ from gladier import GladierBaseTool, generate_flow_definition
 
 
 def hyperspectral_image_tool(**data):
-    """Given an experiment file (.emd), extract the hyperspectral image and metadata.
+    """Given the experiment files (.emd) in the dataset, extract the hyperspectral images and metadata.
 
     Returns
     -------
@@ -14,97 +14,21 @@ def hyperspectral_image_tool(**data):
     ValueError
         If no hyperspectral image is found in the experiment file.
     """
-    import json
     from pathlib import Path
-    from typing import Any, Dict, Optional, Tuple
-
-    import hyperspy.api as hs
-    import matplotlib.pyplot as plt
-    import numpy as np
-    import numpy.typing as npt
-
-    def load_hyperspectral_image(
-        experiment_file: Path,
-    ) -> Tuple[npt.ArrayLike, npt.ArrayLike, Dict[str, Any]]:
-        """Load the hyperspectral image from the experiment file.
-
-        Parameters
-        ----------
-        experiment_file : Path
-            The path to the experiment file.
-
-        Returns
-        -------
-        npt.ArrayLike
-            The hyperspectral image with shape (X, Y, S).
-        np.ArrayLike
-            Energy axis with shape (S,).
-        Dict[str, Any]
-            The metadata dictionary (JSON data).
-
-        Raises
-        ------
-        ValueError
-            If no hyperspectral image is found in the experiment file.
-        """
-        # Load the hyperspectral image
-        signals = hs.load(experiment_file)
-
-        # Find the hyperspectral image by checking the data dimensionality
-        for signal in signals:
-            if signal._data.ndim == 3:
-                # Extract the hyperspectral image
-                hs_image = signal._data
-                # Extract the metadata for the hyperspectral image
-                metadata = signal.metadata.as_dictionary()
-                # Convert the metadata to JSON (by default it has np.int64, np.float64, etc.)
-                metadata = json.loads(json.dumps(metadata))
-                break
-        else:
-            raise ValueError(
-                f"No hyperspectral image found in experiment file: {experiment_file}"
-            )
-
-        # These should be read from the metadata it will change with instrument
-        x_offset = -479.0021  # The zero channel enegry offset in eV
-        x_increment = 5  # The evch
-        n_channels = hs_image.shape[2]  # The number of channels
-
-        # Compute the energy axis
-        energy = (x_offset + x_increment * np.arange(n_channels)) / 1000.0
-
-        return hs_image, energy, metadata
-
-    def plot_hyperspectral_image(
-        hs_image: npt.ArrayLike, energy: npt.ArrayLike, savefile: Optional[Path] = None
-    ) -> None:
-        """Plot the hyperspectral image and spectrum.
-
-        Parameters
-        ----------
-        hs_image : npt.ArrayLike
-            The hyperspectral image with shape (X, Y, S).
-        energy : npt.ArrayLike
-            The energy axis with shape (S,).
-        savefile : Optional[Path], optional
-            A path to save the plot .png file, by default None
-        """
-        fig, (ax_im, ax_spec) = plt.subplots(1, 2, figsize=(15, 5))
-
-        # Configure Image subplot
-        ax_im.set(xlabel="x [pixel]", ylabel="y [pixel]")
-        im = ax_im.imshow(hs_image.sum(axis=2), cmap="Blues_r", interpolation="nearest")
-        colorbar = fig.colorbar(im, ax=ax_im)
-        colorbar.set_label("Intensity")
-
-        # Configure Spectrum subplot
-        ax_spec.set(
-            ylabel="XEDS counts", xlabel="Energy (keV)", yscale="log", title="Spectrum"
-        )
-        ax_spec.plot(energy, hs_image.sum(axis=(0, 1)), lw=2)
 
-        if savefile:
-            plt.savefig(savefile, dpi=300, bbox_inches="tight")
+    from picoprobe.tools.serialization import (
+        DEFAULT_MAX_ARRAY_SIZE,
+        add_experiments,
+        dumps,
+        to_jsonable,
+        write_sidecar,
+    )
+    from picoprobe.tools.spectrum_image import (
+        decompose_hyperspectral_image,
+        load_hyperspectral_image,
+        render_previews,
+        save_element_maps,
+    )
 
     # General experiment metadata
     metadata = {
@@ -116,29 +40,92 @@ def hyperspectral_image_tool(**data):
         "exp_type": "picoprobe",
     }
 
-    # Unpack the experiment file from the input payload
+    # Unpack the experiment files from the input payload (a batched flow
+    # run transfers several experiment files into the same directory)
     experiment_dir = data["publishv2"]["dataset"]
-    experiment_file = next(Path(experiment_dir).glob("*.emd"))
+    experiment_files = sorted(Path(experiment_dir).glob("*.emd"))
+    if not experiment_files:
+        raise ValueError(f"No experiment files found in: {experiment_dir}")
+
+    # Optional formatting of the metadata (compact JSON is faster to ingest)
+    max_array_size = data.get("max_metadata_array_size", DEFAULT_MAX_ARRAY_SIZE)
+    indent = data.get("metadata_indent")
+    # The full matplotlib figure is slow to render, so it is opt-in
+    plot_figure = data.get("hyperspectral_figure", False)
+    # X-ray lines (e.g., "Fe_Ka") or [low, high] keV windows to map
+    windows = data.get("element_windows", [])
+    # Options of the low-rank decomposition (disabled by default)
+    decomposition = data.get("decomposition")
+    # Write tiled multi-resolution pyramids for interactive viewers
+    write_pyramid = data.get("pyramid", False)
+
+    experiments = []
+    for experiment_file in experiment_files:
+        # Load the microscopy dataset and extract metadata (the pyramid is
+        # written in the same pass over the hyperspectral image)
+        pyramid_file = experiment_file.with_suffix(".zarr") if write_pyramid else None
+        (
+            image,
+            spectrum,
+            energy,
+            element_maps,
+            experiment_metadata,
+        ) = load_hyperspectral_image(experiment_file, windows, pyramid_file)
+
+        # Convert the metadata to JSON types (it has np.int64, np.float64, etc.)
+        # and move the large arrays to a sidecar file
+        arrays = {}
+        experiment_metadata = to_jsonable(experiment_metadata, max_array_size, arrays)
+        sidecar = write_sidecar(arrays, experiment_file.with_suffix(".metadata.npz"))
+
+        # Render the intensity map, its web thumbnail and each element map
+        previews = render_previews(
+            experiment_file, image, spectrum, energy, plot_figure
+        )
+        element_map_files = save_element_maps(experiment_file, element_maps)
 
-    # Load the microscopy dataset and extract metadata
-    hs_image, energy, experiment_metadata = load_hyperspectral_image(experiment_file)
+        # Fit a low-rank model of the hyperspectral image
+        decomposition_results = None
+        if decomposition:
+            decomposition_results = decompose_hyperspectral_image(
+                experiment_file, image, spectrum, decomposition
+            )
 
-    # Plot the hyperspectral image and spectrum
-    plot_file = experiment_file.with_suffix(".png")
-    plot_hyperspectral_image(hs_image, energy, plot_file)
+        experiments.append(
+            {
+                "experiment_file": str(experiment_file),
+                "experiment_metadata": experiment_metadata,
+                **previews,
+                **element_map_files,
+                "decomposition": decomposition_results,
+                "pyramid": str(pyramid_file) if pyramid_file else None,
+                "experiment_metadata_arrays": str(sidecar) if sidecar else None,
+            }
+        )
 
-    # Add the experiment metadata to the general metadata
-    metadata["experiment_metadata"] = experiment_metadata
-    metadata["hyperspectral_image"] = str(plot_file)
+    # Add the experiment metadata to the general metadata (the first
+    # experiment is reported at the top level for the portal)
+    add_experiments(
+        metadata,
+        experiments,
+        [
+            "experiment_metadata",
+            "experiment_metadata_arrays",
+            "hyperspectral_image",
+            "hyperspectral_thumbnail",
+        ],
+    )
 
     # Update the output data with the experiment metadata
     final_data = data["publishv2"]
     final_data["metadata"] = metadata
 
-    # Save the metadata to a file
-    metadata_file = experiment_file.with_suffix(".json")
-    with open(metadata_file, "w") as f:
-        f.write(json.dumps(final_data, indent=4))
+    # Save the metadata to a file (encoded once for every experiment file)
+    text = dumps(final_data, indent)
+    for experiment_file in experiment_files:
+        metadata_file = experiment_file.with_suffix(".json")
+        with open(metadata_file, "w") as f:
+            f.write(text)
 
     return final_data
 
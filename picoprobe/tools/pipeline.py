@@ -0,0 +1,253 @@
+"""Run analysis stages concurrently, connected by bounded queues.
+
+Each stage runs in its own thread and transforms the stream of items of
+its upstream stage (e.g., blocks of frames) into a stream of items for
+its downstream stages. Since every queue is bounded, a slow stage blocks
+its producers, and the memory held by the pipeline is bounded by the
+queue sizes. NumPy, zlib, video encoders and PyTorch release the GIL, so
+I/O, normalization, encoding and inference overlap.
+
+Example
+-------
+>>> pipeline = Pipeline(queue_size=4)
+>>> pipeline.add_source("read", blocks)
+>>> pipeline.add_stage("normalize", normalize_blocks, upstream="read")
+>>> pipeline.add_stage("encode", encode_blocks, upstream="normalize")
+>>> pipeline.add_stage("detect", detect_blocks, upstream="normalize")
+>>> stats = pipeline.run()
+"""
+import logging
+import queue
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Marks the end of the stream in a queue
+_DONE = object()
+
+
+class StageStats:
+    """Throughput of a pipeline stage."""
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self.items = 0
+        """The number of items produced (or consumed, by a sink)."""
+        self.units = 0
+        """The number of units (e.g., frames) in those items."""
+        self.elapsed = 0.0
+        """Seconds from the start to the end of the stage."""
+        self.wait_input = 0.0
+        """Seconds spent waiting for the upstream stage."""
+        self.wait_output = 0.0
+        """Seconds spent blocked on full downstream queues."""
+
+    @property
+    def busy(self) -> float:
+        """Seconds spent working."""
+        return max(self.elapsed - self.wait_input - self.wait_output, 0.0)
+
+    @property
+    def throughput(self) -> float:
+        """Units per second of work (the rate the stage could sustain alone)."""
+        return self.units / self.busy if self.busy > 0 else 0.0
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "items": self.items,
+            "units": self.units,
+            "elapsed": round(self.elapsed, 3),
+            "busy": round(self.busy, 3),
+            "wait_input": round(self.wait_input, 3),
+            "wait_output": round(self.wait_output, 3),
+            "throughput": round(self.throughput, 3),
+        }
+
+
+class _Stage:
+    def __init__(
+        self,
+        name: str,
+        func: Optional[Callable[[Iterator[Any]], Optional[Iterable[Any]]]],
+        source: Optional[Iterable[Any]],
+        upstream: Optional[str],
+    ) -> None:
+        self.name = name
+        self.func = func
+        self.source = source
+        self.upstream = upstream
+        self.inbox: Optional["queue.Queue[Any]"] = None
+        self.outboxes: List["queue.Queue[Any]"] = []
+        self.input_done = False
+        self.stats = StageStats(name)
+
+
+class Pipeline:
+    """A graph of stages, each running in a thread, connected by bounded queues."""
+
+    def __init__(self, queue_size: int = 4, size: Callable[[Any], int] = len) -> None:
+        """Initialize the pipeline.
+
+        Parameters
+        ----------
+        queue_size : int, optional
+            The maximum number of items waiting between two stages,
+            by default 4
+        size : Callable[[Any], int], optional
+            Returns the number of units (e.g., frames) in an item, used to
+            report the throughput, by default len
+        """
+        self.queue_size = queue_size
+        self.size = size
+        self.stages: Dict[str, _Stage] = {}
+        self._stop = threading.Event()
+        self._errors: List[BaseException] = []
+
+    def add_source(self, name: str, items: Iterable[Any]) -> None:
+        """Add a stage producing the items of an iterable (e.g., reading blocks)."""
+        self._add(_Stage(name, None, items, None))
+
+    def add_stage(
+        self,
+        name: str,
+        func: Callable[[Iterator[Any]], Optional[Iterable[Any]]],
+        upstream: str,
+    ) -> None:
+        """Add a stage transforming the items of its upstream stage.
+
+        Parameters
+        ----------
+        name : str
+            The name of the stage.
+        func : Callable[[Iterator[Any]], Optional[Iterable[Any]]]
+            Maps the iterator of upstream items to the items of the stage
+            (e.g., a generator). A sink may return None or nothing.
+        upstream : str
+            The name of the stage whose items are consumed. A stage may
+            feed several stages, which each receive every item.
+        """
+        if upstream not in self.stages:
+            raise ValueError(f"Unknown upstream stage: {upstream}")
+        stage = _Stage(name, func, None, upstream)
+        stage.inbox = queue.Queue(self.queue_size)
+        self.stages[upstream].outboxes.append(stage.inbox)
+        self._add(stage)
+
+    def _add(self, stage: _Stage) -> None:
+        if stage.name in self.stages:
+            raise ValueError(f"Duplicate stage: {stage.name}")
+        self.stages[stage.name] = stage
+
+    def _inputs(self, stage: _Stage) -> Iterator[Any]:
+        assert stage.inbox is not None
+        while True:
+            start = time.perf_counter()
+            item = stage.inbox.get()
+            stage.stats.wait_input += time.perf_counter() - start
+            if item is _DONE:
+                stage.input_done = True
+                return
+            if self._stop.is_set():
+                return
+            if not stage.outboxes:
+                # Sinks report the items they consume
+                stage.stats.items += 1
+                stage.stats.units += self.size(item)
+            yield item
+
+    def _put(self, stage: _Stage, item: Any) -> None:
+        start = time.perf_counter()
+        for outbox in stage.outboxes:
+            while not self._stop.is_set():
+                try:
+                    outbox.put(item, timeout=0.1)
+                    break
+                except queue.Full:
+                    pass
+        stage.stats.wait_output += time.perf_counter() - start
+
+    def _run_stage(self, stage: _Stage) -> None:
+        start = time.perf_counter()
+        try:
+            if stage.source is not None:
+                items: Iterable[Any] = stage.source
+            else:
+                assert stage.func is not None
+                items = stage.func(self._inputs(stage)) or ()
+            for item in items:
+                if self._stop.is_set():
+                    break
+                if stage.outboxes:
+                    stage.stats.items += 1
+                    stage.stats.units += self.size(item)
+                    self._put(stage, item)
+        except BaseException as e:
+            logger.error(f"Pipeline stage {stage.name} failed: {e}")
+            self._errors.append(e)
+            self._stop.set()
+        finally:
+            stage.stats.elapsed = time.perf_counter() - start
+            # Unblock the downstream stages, and consume the rest of the
+            # input so that the upstream stage is not left blocked on a
+            # full queue (e.g., if this stage stopped early)
+            for outbox in stage.outboxes:
+                _put_done(outbox, self._stop)
+            if stage.inbox is not None and not stage.input_done:
+                while stage.inbox.get() is not _DONE:
+                    pass
+
+    def run(self) -> Dict[str, StageStats]:
+        """Run every stage until the sources are exhausted.
+
+        Returns
+        -------
+        Dict[str, StageStats]
+            The throughput of each stage.
+
+        Raises
+        ------
+        BaseException
+            The first error raised by a stage (the other stages are stopped).
+        """
+        threads = [
+            threading.Thread(
+                target=self._run_stage, args=(stage,), name=f"pipeline-{name}"
+            )
+            for name, stage in self.stages.items()
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        if self._errors:
+            raise self._errors[0]
+
+        stats = {name: stage.stats for name, stage in self.stages.items()}
+        for s in stats.values():
+            logger.info(
+                f"Stage {s.name}: {s.units} units in {s.elapsed:.2f}s "
+                f"({s.throughput:.1f}/s busy, waited {s.wait_input:.2f}s for "
+                f"input and {s.wait_output:.2f}s for output)"
+            )
+        return stats
+
+
+def _put_done(outbox: "queue.Queue[Any]", stop: threading.Event) -> None:
+    while True:
+        try:
+            outbox.put(_DONE, timeout=0.1)
+            return
+        except queue.Full:
+            if stop.is_set():
+                _drain(outbox)
+
+
+def _drain(inbox: "queue.Queue[Any]") -> None:
+    try:
+        while True:
+            inbox.get_nowait()
+    except queue.Empty:
+        pass
@@ -0,0 +1,290 @@
+"""Write multi-resolution pyramids of spectrum images as Zarr (v2) stores.
+
+The store is a directory that a viewer (or `zarr.open`) can read a tile
+at a time, e.g., over HTTP from the Globus collection::
+
+    <experiment>.zarr/
+        image/0, image/1, ...   the (Y, X) projection, binned 2x per level
+        cube/0, cube/1, ...     the (Y, X, S) spectrum image, binned 2x2
+                                spatially per level (spectra are kept)
+
+Both groups carry OME-NGFF style "multiscales" attributes. Levels above
+0 hold the sum of the binned pixels (counts are preserved). The chunks
+are compressed with zlib and written directly, without the zarr package.
+
+`SpectrumImagePyramid` is a `Reducer`, so the cube pyramid is built in
+the same streaming pass as the other reductions: each level writes its
+complete rows of chunks as soon as they arrive (keeping less than a row
+of chunks between blocks) and bins pairs of rows into the next level.
+"""
+import json
+import math
+import zlib
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+import numpy.typing as npt
+
+from picoprobe.tools.streaming import Reducer
+
+PathLike = Union[str, Path]
+
+# Chunk shapes of the projection and spectrum image levels
+DEFAULT_IMAGE_CHUNKS = (256, 256)
+DEFAULT_CUBE_CHUNKS = (32, 32, 512)
+
+
+def level_dtype(dtype: npt.DTypeLike) -> np.dtype:
+    """Return the dtype of the binned levels (sums of `dtype` values)."""
+    dtype = np.dtype(dtype)
+    if np.issubdtype(dtype, np.unsignedinteger) or dtype == np.bool_:
+        return np.dtype(np.uint32) if dtype.itemsize <= 4 else np.dtype(np.uint64)
+    if np.issubdtype(dtype, np.integer):
+        return np.dtype(np.int32) if dtype.itemsize <= 4 else np.dtype(np.int64)
+    return np.dtype(np.float32) if dtype.itemsize <= 4 else np.dtype(np.float64)
+
+
+def _write_json(path: Path, data: Dict[str, Any]) -> None:
+    with open(path, "w") as f:
+        json.dump(data, f, indent=4)
+
+
+def write_group(path: PathLike, attrs: Optional[Dict[str, Any]] = None) -> Path:
+    """Create a Zarr group (with optional attributes)."""
+    path = Path(path)
+    path.mkdir(parents=True, exist_ok=True)
+    _write_json(path / ".zgroup", {"zarr_format": 2})
+    if attrs:
+        _write_json(path / ".zattrs", attrs)
+    return path
+
+
+class ZarrArrayWriter:
+    """Write a chunked, zlib compressed Zarr (v2) array one row of chunks at a time."""
+
+    def __init__(
+        self,
+        path: PathLike,
+        shape: Sequence[int],
+        chunks: Sequence[int],
+        dtype: npt.DTypeLike,
+        compression: int = 1,
+    ) -> None:
+        self.path = Path(path)
+        self.shape = tuple(int(n) for n in shape)
+        self.chunks = tuple(min(int(c), max(n, 1)) for c, n in zip(chunks, shape))
+        self.dtype = np.dtype(dtype)
+        self.compression = compression
+
+        self.path.mkdir(parents=True, exist_ok=True)
+        _write_json(
+            self.path / ".zarray",
+            {
+                "zarr_format": 2,
+                "shape": list(self.shape),
+                "chunks": list(self.chunks),
+                "dtype": self.dtype.str,
+                "compressor": {"id": "zlib", "level": compression},
+                "fill_value": 0,
+                "order": "C",
+                "filters": None,
+                "dimension_separator": ".",
+            },
+        )
+
+    def write_rows(self, start: int, rows: np.ndarray) -> None:
+        """Write whole chunks of rows starting at `start` (a multiple of the chunk rows).
+
+        Only the last rows of the array may span a partial chunk.
+        """
+        chunk_rows = self.chunks[0]
+        for offset in range(0, rows.shape[0], chunk_rows):
+            row_chunk = (start + offset) // chunk_rows
+            self._write_row_chunk(row_chunk, rows[offset : offset + chunk_rows])
+
+    def _write_row_chunk(self, row_chunk: int, rows: np.ndarray) -> None:
+        # Zarr stores the edge chunks padded to the full chunk shape
+        grid = [range(0, n, c) for n, c in zip(self.shape[1:], self.chunks[1:])]
+        for corner in np.ndindex(*(len(axis) for axis in grid)):
+            starts = [axis[i] for axis, i in zip(grid, corner)]
+            index = tuple(slice(s, s + c) for s, c in zip(starts, self.chunks[1:]))
+            data = rows[(slice(None),) + index]
+            chunk = np.zeros(self.chunks, dtype=self.dtype)
+            chunk[tuple(slice(0, n) for n in data.shape)] = data
+            key = ".".join(str(i) for i in (row_chunk,) + tuple(corner))
+            with open(self.path / key, "wb") as f:
+                f.write(zlib.compress(chunk.tobytes(), self.compression))
+
+
+def bin2x2(rows: np.ndarray, dtype: np.dtype) -> np.ndarray:
+    """Sum blocks of 2x2 pixels of an even number of rows (odd columns are padded)."""
+    n, width = rows.shape[0] // 2, rows.shape[1]
+    pairs = rows.reshape((n, 2) + rows.shape[1:]).sum(axis=1, dtype=dtype)
+    if width % 2:
+        pad = np.zeros((n, 1) + rows.shape[2:], dtype=dtype)
+        pairs = np.concatenate([pairs, pad], axis=1)
+    shape = (n, (width + 1) // 2, 2) + rows.shape[2:]
+    return pairs.reshape(shape).sum(axis=2, dtype=dtype)
+
+
+class _Level:
+    """A level of a pyramid, written as rows arrive and binned into the next level."""
+
+    def __init__(self, writer: ZarrArrayWriter, next_level: Optional["_Level"]):
+        self.writer = writer
+        self.next_level = next_level
+        self.buffer: List[np.ndarray] = []
+        self.buffered = 0
+        self.written = 0
+        self.odd_row: Optional[np.ndarray] = None
+
+    def feed(self, rows: np.ndarray) -> None:
+        # The rows may be a reused buffer, so they are copied
+        rows = np.array(rows, dtype=self.writer.dtype)
+        self.buffer.append(rows)
+        self.buffered += rows.shape[0]
+        chunk_rows = self.writer.chunks[0]
+        if self.buffered >= chunk_rows:
+            self._flush((self.buffered // chunk_rows) * chunk_rows)
+
+        if self.next_level is not None:
+            if self.odd_row is not None:
+                rows = np.concatenate([self.odd_row, rows])
+            even = (rows.shape[0] // 2) * 2
+            self.odd_row = rows[even:] if even < rows.shape[0] else None
+            if even:
+                self.next_level.feed(bin2x2(rows[:even], self.next_level.writer.dtype))
+
+    def _flush(self, n_rows: int) -> None:
+        rows = np.concatenate(self.buffer) if len(self.buffer) > 1 else self.buffer[0]
+        self.writer.write_rows(self.written, rows[:n_rows])
+        self.written += n_rows
+        self.buffer = [rows[n_rows:]] if n_rows < rows.shape[0] else []
+        self.buffered -= n_rows
+
+    def finish(self) -> None:
+        if self.buffered:
+            self._flush(self.buffered)
+        if self.next_level is not None:
+            if self.odd_row is not None:
+                # The last row is binned alone
+                padded = np.concatenate([self.odd_row, np.zeros_like(self.odd_row)])
+                self.next_level.feed(bin2x2(padded, self.next_level.writer.dtype))
+                self.odd_row = None
+            self.next_level.finish()
+
+
+def _level_shapes(shape: Sequence[int], chunks: Sequence[int]) -> List[Tuple[int, ...]]:
+    """Halve the spatial axes until the level fits in a single chunk."""
+    shapes = [tuple(shape)]
+    while shapes[-1][0] > chunks[0] or shapes[-1][1] > chunks[1]:
+        y, x = shapes[-1][:2]
+        shapes.append((math.ceil(y / 2), math.ceil(x / 2)) + tuple(shape[2:]))
+    return shapes
+
+
+def _multiscales(name: str, axes: List[Dict[str, str]], n_levels: int) -> Dict:
+    datasets = []
+    for level in range(n_levels):
+        scale = [2.0**level, 2.0**level] + [1.0] * (len(axes) - 2)
+        datasets.append(
+            {
+                "path": str(level),
+                "coordinateTransformations": [{"type": "scale", "scale": scale}],
+            }
+        )
+    return {
+        "multiscales": [
+            {
+                "version": "0.4",
+                "name": name,
+                "axes": axes,
+                "datasets": datasets,
+                "type": "sum",
+            }
+        ]
+    }
+
+
+def _create_levels(
+    path: Path,
+    name: str,
+    axes: List[Dict[str, str]],
+    shape: Sequence[int],
+    chunks: Sequence[int],
+    dtype: np.dtype,
+    compression: int,
+) -> _Level:
+    shapes = _level_shapes(shape, chunks)
+    group = write_group(path / name, _multiscales(name, axes, len(shapes)))
+
+    level: Optional[_Level] = None
+    for i in reversed(range(len(shapes))):
+        level_type = dtype if i == 0 else level_dtype(dtype)
+        writer = ZarrArrayWriter(
+            group / str(i), shapes[i], chunks, level_type, compression
+        )
+        level = _Level(writer, level)
+    assert level is not None
+    return level
+
+
+_SPACE_AXES = [{"name": "y", "type": "space"}, {"name": "x", "type": "space"}]
+
+
+class SpectrumImagePyramid(Reducer):
+    """Write the pyramid of the spectrum image while it is streamed."""
+
+    def __init__(
+        self,
+        path: PathLike,
+        chunks: Sequence[int] = DEFAULT_CUBE_CHUNKS,
+        compression: int = 1,
+    ) -> None:
+        """Initialize the writer.
+
+        Parameters
+        ----------
+        path : PathLike
+            The path of the Zarr store (a directory ending in .zarr).
+        chunks : Sequence[int], optional
+            The (Y, X, S) chunk shape of every level, by default (32, 32, 512)
+        compression : int, optional
+            The zlib compression level, by default 1 (fastest)
+        """
+        self.path = Path(path)
+        self.chunks = tuple(chunks)
+        self.compression = compression
+
+    def start(self, shape: Sequence[int], dtype: np.dtype) -> None:
+        write_group(self.path)
+        axes = _SPACE_AXES + [{"name": "energy", "type": "channel"}]
+        self.level = _create_levels(
+            self.path, "cube", axes, shape, self.chunks, dtype, self.compression
+        )
+
+    def update(self, rows: slice, block: np.ndarray) -> None:
+        self.level.feed(block)
+
+    def result(self) -> Path:
+        self.level.finish()
+        return self.path
+
+
+def write_image_pyramid(
+    image: npt.ArrayLike,
+    path: PathLike,
+    chunks: Sequence[int] = DEFAULT_IMAGE_CHUNKS,
+    compression: int = 1,
+) -> Path:
+    """Write the pyramid of a (Y, X) image to the "image" group of a Zarr store."""
+    image = np.asarray(image)
+    path = Path(path)
+    write_group(path)
+    level = _create_levels(
+        path, "image", _SPACE_AXES, image.shape, chunks, image.dtype, compression
+    )
+    level.feed(image)
+    level.finish()
+    return path
@@ -0,0 +1,187 @@
+"""Render analysis previews as PNG files without the pyplot state machine.
+
+An image is scaled to 8 bits, mapped through a colormap lookup table and
+written as an RGB PNG directly with zlib, which takes milliseconds. The
+full matplotlib figure is optional and uses the object-oriented API, so
+no figure is left registered in a long-lived worker process.
+"""
+import struct
+import zlib
+from functools import lru_cache
+from pathlib import Path
+from typing import Optional, Tuple, Union
+
+import numpy as np
+import numpy.typing as npt
+
+PathLike = Union[str, Path]
+
+# Longest side of the web thumbnails, in pixels
+DEFAULT_THUMBNAIL_SIZE = 256
+
+
+@lru_cache(maxsize=None)
+def colormap_lut(name: str = "Blues_r", n: int = 256) -> np.ndarray:
+    """Return the (n, 3) uint8 RGB lookup table of a matplotlib colormap."""
+    import matplotlib
+
+    cmap = matplotlib.colormaps[name].resampled(n)
+    lut = cmap(np.arange(n))[:, :3] * 255 + 0.5
+    lut = lut.astype(np.uint8)
+    lut.setflags(write=False)
+    return lut
+
+
+def scale_to_uint8(
+    image: npt.ArrayLike,
+    vmin: Optional[float] = None,
+    vmax: Optional[float] = None,
+    out: Optional[np.ndarray] = None,
+) -> np.ndarray:
+    """Linearly scale an image to [0, 255] (by default from its min to its max).
+
+    Non-finite values are mapped to 0.
+    """
+    image = np.asarray(image, dtype=np.float32)
+    finite = np.isfinite(image)
+    if vmin is None:
+        vmin = float(image[finite].min()) if finite.any() else 0.0
+    if vmax is None:
+        vmax = float(image[finite].max()) if finite.any() else 1.0
+    scale = 255.0 / (vmax - vmin) if vmax > vmin else 0.0
+
+    scaled = (image - vmin) * scale
+    np.clip(scaled, 0, 255, out=scaled)
+    scaled[~finite] = 0
+    if out is None:
+        out = np.empty(image.shape, dtype=np.uint8)
+    np.rint(scaled, out=scaled)
+    out[...] = scaled
+    return out
+
+
+def downsample(image: npt.ArrayLike, max_size: int) -> np.ndarray:
+    """Average blocks of pixels so that the longest side is at most `max_size`."""
+    image = np.asarray(image, dtype=np.float32)
+    factor = -(-max(image.shape[:2]) // max_size)
+    if factor <= 1:
+        return image
+    h, w = (image.shape[0] // factor) * factor, (image.shape[1] // factor) * factor
+    if h == 0 or w == 0:
+        # Very elongated images are subsampled instead
+        return image[::factor, ::factor]
+    blocks = image[:h, :w].reshape(h // factor, factor, w // factor, factor)
+    return blocks.mean(axis=(1, 3))
+
+
+def write_png(path: PathLike, rgb: np.ndarray, compression: int = 3) -> None:
+    """Write an (H, W, 3) uint8 RGB (or (H, W) grayscale) array as a PNG file."""
+    rgb = np.ascontiguousarray(rgb, dtype=np.uint8)
+    height, width = rgb.shape[:2]
+    color_type = 2 if rgb.ndim == 3 else 0
+
+    # Each row is prefixed with its filter type (0, none)
+    raw = np.zeros((height, 1 + rgb[0].size), dtype=np.uint8)
+    raw[:, 1:] = rgb.reshape(height, -1)
+
+    def chunk(tag: bytes, data: bytes) -> bytes:
+        crc = zlib.crc32(tag + data) & 0xFFFFFFFF
+        return struct.pack(">I", len(data)) + tag + data + struct.pack(">I", crc)
+
+    header = struct.pack(">IIBBBBB", width, height, 8, color_type, 0, 0, 0)
+    with open(path, "wb") as f:
+        f.write(b"\x89PNG\r\n\x1a\n")
+        f.write(chunk(b"IHDR", header))
+        f.write(chunk(b"IDAT", zlib.compress(raw.tobytes(), compression)))
+        f.write(chunk(b"IEND", b""))
+
+
+def render_image(
+    image: npt.ArrayLike,
+    savefile: PathLike,
+    cmap: str = "Blues_r",
+    thumbnail: Optional[PathLike] = None,
+    thumbnail_size: int = DEFAULT_THUMBNAIL_SIZE,
+) -> Tuple[Path, Optional[Path]]:
+    """Write an intensity map as a colormapped PNG (and optionally a thumbnail).
+
+    Parameters
+    ----------
+    image : npt.ArrayLike
+        The intensity map with shape (Y, X).
+    savefile : PathLike
+        The path of the PNG file (one pixel per image pixel).
+    cmap : str, optional
+        The matplotlib colormap, by default "Blues_r"
+    thumbnail : Optional[PathLike], optional
+        The path of the thumbnail PNG file, by default None (no thumbnail)
+    thumbnail_size : int, optional
+        The longest side of the thumbnail in pixels, by default 256
+
+    Returns
+    -------
+    Path
+        The path of the PNG file.
+    Optional[Path]
+        The path of the thumbnail, if any.
+    """
+    lut = colormap_lut(cmap)
+    image = np.asarray(image, dtype=np.float32)
+    write_png(savefile, lut[scale_to_uint8(image)])
+
+    if thumbnail is None:
+        return Path(savefile), None
+
+    # Scale the thumbnail with the range of the full image
+    finite = image[np.isfinite(image)]
+    vmin, vmax = (finite.min(), finite.max()) if finite.size else (0.0, 1.0)
+    small = downsample(image, thumbnail_size)
+    write_png(thumbnail, lut[scale_to_uint8(small, vmin, vmax)])
+    return Path(savefile), Path(thumbnail)
+
+
+def plot_hyperspectral_figure(
+    image: npt.ArrayLike,
+    spectrum: npt.ArrayLike,
+    energy: npt.ArrayLike,
+    savefile: PathLike,
+    dpi: int = 100,
+) -> None:
+    """Plot the hyperspectral image and spectrum side by side with matplotlib.
+
+    The figure is not registered with pyplot, so it is released as soon as
+    it is saved.
+
+    Parameters
+    ----------
+    image : npt.ArrayLike
+        The hyperspectral image summed over energy with shape (Y, X).
+    spectrum : npt.ArrayLike
+        The spectrum summed over pixels with shape (S,).
+    energy : npt.ArrayLike
+        The energy axis with shape (S,).
+    savefile : PathLike
+        The path of the PNG file.
+    dpi : int, optional
+        The resolution of the figure, by default 100
+    """
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+
+    fig = Figure(figsize=(15, 5))
+    FigureCanvasAgg(fig)
+    ax_im, ax_spec = fig.subplots(1, 2)
+
+    # Configure Image subplot
+    ax_im.set(xlabel="x [pixel]", ylabel="y [pixel]")
+    im = ax_im.imshow(image, cmap="Blues_r", interpolation="nearest")
+    colorbar = fig.colorbar(im, ax=ax_im)
+    colorbar.set_label("Intensity")
+
+    # Configure Spectrum subplot
+    ax_spec.set(
+        ylabel="XEDS counts", xlabel="Energy (keV)", yscale="log", title="Spectrum"
+    )
+    ax_spec.plot(energy, spectrum, lw=2)
+
+    fig.savefig(savefile, dpi=dpi)
@@ -0,0 +1,145 @@
+"""Convert analysis metadata to JSON in a single pass.
+
+HyperSpy metadata contains NumPy scalars and, occasionally, large arrays
+(e.g., calibration tables). `to_jsonable` converts every value to a native
+Python type in one walk of the dictionary, replacing arrays larger than
+`max_array_size` elements with a short summary. The full arrays are
+collected so that they can be saved to a sidecar .npz file instead of
+bloating the Globus Search records.
+"""
+import json
+import math
+from datetime import date, datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Union
+
+import numpy as np
+
+PathLike = Union[str, Path]
+
+# Arrays (and numeric lists) larger than this are summarized
+DEFAULT_MAX_ARRAY_SIZE = 64
+
+
+def to_jsonable(
+    obj: Any,
+    max_array_size: int = DEFAULT_MAX_ARRAY_SIZE,
+    arrays: Optional[Dict[str, np.ndarray]] = None,
+    key: str = "",
+) -> Any:
+    """Convert `obj` to native Python types that can be encoded as JSON.
+
+    Parameters
+    ----------
+    obj : Any
+        The object to convert (typically a metadata dictionary).
+    max_array_size : int, optional
+        Arrays with more elements are replaced by a summary (shape, dtype,
+        min, max and mean), by default 64
+    arrays : Optional[Dict[str, np.ndarray]], optional
+        Collects the full values of the summarized arrays, keyed by their
+        dotted location in `obj` (see `write_sidecar`), by default None
+    key : str, optional
+        The dotted location of `obj`, by default ""
+
+    Returns
+    -------
+    Any
+        The converted object. Non-finite floats become None, and values of
+        unknown types are converted to strings.
+    """
+    if obj is None or isinstance(obj, (str, bool, int)):
+        return obj
+    if isinstance(obj, float):
+        return obj if math.isfinite(obj) else None
+    if isinstance(obj, dict):
+        return {
+            str(k): to_jsonable(v, max_array_size, arrays, f"{key}.{k}" if key else k)
+            for k, v in obj.items()
+        }
+    if isinstance(obj, (list, tuple, set)):
+        if len(obj) > max_array_size:
+            try:
+                array = np.asarray(list(obj))
+            except (ValueError, TypeError):
+                # Ragged or mixed nested lists are converted element by element
+                array = None
+            if array is not None and array.dtype.kind in "biuf":
+                return _encode_array(array, max_array_size, arrays, key)
+        return [
+            to_jsonable(v, max_array_size, arrays, f"{key}.{i}")
+            for i, v in enumerate(obj)
+        ]
+    if isinstance(obj, np.ndarray):
+        return _encode_array(obj, max_array_size, arrays, key)
+    if isinstance(obj, np.generic):
+        return to_jsonable(obj.item(), max_array_size, arrays, key)
+    if isinstance(obj, bytes):
+        return obj.decode(errors="replace")
+    if isinstance(obj, (datetime, date)):
+        return obj.isoformat()
+    return str(obj)
+
+
+def _encode_array(
+    array: np.ndarray,
+    max_array_size: int,
+    arrays: Optional[Dict[str, np.ndarray]],
+    key: str,
+) -> Any:
+    if array.size <= max_array_size or array.dtype.kind not in "biuf":
+        return to_jsonable(array.tolist(), max_array_size, arrays, key)
+
+    summary: Dict[str, Any] = {
+        "shape": list(array.shape),
+        "dtype": str(array.dtype),
+    }
+    finite = array[np.isfinite(array)] if array.dtype.kind == "f" else array
+    if finite.size:
+        summary["min"] = to_jsonable(finite.min())
+        summary["max"] = to_jsonable(finite.max())
+        summary["mean"] = to_jsonable(finite.mean())
+    if arrays is not None:
+        arrays[key] = array
+        summary["sidecar_key"] = key
+    return summary
+
+
+def dumps(obj: Any, indent: Optional[int] = None) -> str:
+    """Encode converted data (see `to_jsonable`) as JSON.
+
+    The output is compact unless `indent` is given.
+    """
+    if indent is None:
+        return json.dumps(obj, separators=(",", ":"))
+    return json.dumps(obj, indent=indent)
+
+
+def write_sidecar(arrays: Dict[str, np.ndarray], path: PathLike) -> Optional[Path]:
+    """Save the summarized arrays (see `to_jsonable`) to a compressed .npz file.
+
+    Returns
+    -------
+    Optional[Path]
+        The path of the sidecar file, or None if there were no arrays.
+    """
+    if not arrays:
+        return None
+    np.savez_compressed(path, **arrays)
+    return Path(path)
+
+
+def add_experiments(
+    metadata: Dict[str, Any], experiments: List[Dict[str, Any]], keys: Sequence[str]
+) -> None:
+    """Add the results of the experiments of a flow run to the published metadata.
+
+    The first experiment is reported at the top level, the layout of the
+    single file runs read by the portal. Its `keys` (e.g., the experiment
+    metadata) are moved there rather than copied, so each value is only
+    published once, and the other experiments keep them.
+    """
+    first = experiments[0]
+    for key in keys:
+        metadata[key] = first.pop(key)
+    metadata["experiments"] = experiments
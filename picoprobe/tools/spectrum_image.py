@@ -0,0 +1,306 @@
+"""Analyze the hyperspectral images (spectrum images) of experiment files.
+
+These are the steps of `hyperspectral_image_tool`, which imports them on
+the compute endpoint: the spectrum image is probed and loaded lazily,
+reduced in a single streaming pass (image projection, sum spectrum,
+element maps and, optionally, the Zarr pyramid), rendered to PNG previews
+and, optionally, decomposed into a low-rank model.
+"""
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+import numpy.typing as npt
+
+from picoprobe.tools.decomposition import nmf, pca
+from picoprobe.tools.emd import load_signal
+from picoprobe.tools.pyramid import SpectrumImagePyramid, write_image_pyramid
+from picoprobe.tools.rendering import plot_hyperspectral_figure, render_image
+from picoprobe.tools.streaming import (
+    ImageProjection,
+    Reducer,
+    SumSpectrum,
+    WindowMaps,
+    reduce_spectrum_image,
+)
+
+# X-ray lines (e.g., "Fe_Ka") or [low, high] energy windows (in keV)
+EnergyWindows = Sequence[Union[str, Sequence[float]]]
+
+
+def xray_line_window(line: str, resolution: float = 130.0) -> Tuple[float, float]:
+    """Return the integration window (in keV) of an X-ray line, e.g., "Fe_Ka".
+
+    The window spans twice the FWHM of the line, given the detector
+    energy resolution (in eV) at Mn Ka.
+
+    Raises
+    ------
+    ValueError
+        If the X-ray line is unknown.
+    """
+    from hyperspy.misc.elements import elements_db
+
+    try:
+        element, name = line.split("_")
+        lines = elements_db[element]["Atomic_properties"]["Xray_lines"]
+        energy = lines[name]["energy (keV)"]
+    except (KeyError, ValueError):
+        raise ValueError(f"Unknown X-ray line: {line}") from None
+
+    mn_ka = elements_db["Mn"]["Atomic_properties"]["Xray_lines"]["Ka"]
+    fwhm = (
+        np.sqrt(2.5 * (energy - mn_ka["energy (keV)"]) * 1000 + resolution**2)
+        / 1000.0
+    )
+    return energy - fwhm, energy + fwhm
+
+
+def energy_windows(
+    windows: EnergyWindows, energy: npt.ArrayLike
+) -> Dict[str, Tuple[int, int]]:
+    """Convert X-ray lines (e.g., "Fe_Ka") or [low, high] keV windows to channels.
+
+    Returns
+    -------
+    Dict[str, Tuple[int, int]]
+        The (start, stop) channels of each window, keyed by its label.
+    """
+    channels = {}
+    for window in windows:
+        if isinstance(window, str):
+            label, (low, high) = window, xray_line_window(window)
+        else:
+            low, high = (float(value) for value in window)
+            label = f"{low:g}-{high:g}keV"
+        start = int(np.searchsorted(energy, low, side="left"))
+        stop = int(np.searchsorted(energy, high, side="right"))
+        channels[label] = (start, max(start, stop))
+    return channels
+
+
+def energy_axis(n_channels: int) -> np.ndarray:
+    """Return the energy (in keV) of each channel of the spectra."""
+    # These should be read from the metadata it will change with instrument
+    x_offset = -479.0021  # The zero channel enegry offset in eV
+    x_increment = 5  # The evch
+    return (x_offset + x_increment * np.arange(n_channels)) / 1000.0
+
+
+def open_spectrum_image(experiment_file: Path) -> Any:
+    """Probe the file header and load only the hyperspectral image (lazily).
+
+    The other detector signals in the file are never read.
+
+    Raises
+    ------
+    ValueError
+        If no hyperspectral image is found in the experiment file.
+    """
+    try:
+        signal = load_signal(experiment_file, "spectrum_image", lazy=True)
+    except ValueError:
+        signal = None
+    if signal is None or signal.data.ndim != 3:
+        raise ValueError(
+            f"No hyperspectral image found in experiment file: {experiment_file}"
+        )
+    return signal
+
+
+def load_hyperspectral_image(
+    experiment_file: Path,
+    windows: EnergyWindows = (),
+    pyramid_file: Optional[Path] = None,
+) -> Tuple[
+    npt.ArrayLike,
+    npt.ArrayLike,
+    npt.ArrayLike,
+    Dict[str, npt.ArrayLike],
+    Dict[str, Any],
+]:
+    """Load the projections of the hyperspectral image from the experiment file.
+
+    Only the hyperspectral image is loaded (lazily) and it is reduced in
+    a single pass over its chunks, so it never needs to fit in memory.
+
+    Parameters
+    ----------
+    experiment_file : Path
+        The path to the experiment file.
+    windows : EnergyWindows, optional
+        The X-ray lines (e.g., "Fe_Ka") or [low, high] energy windows
+        (in keV) to compute element maps for, by default ()
+    pyramid_file : Optional[Path], optional
+        Write the multi-resolution pyramids of the projection and of the
+        hyperspectral image to this Zarr store, by default None
+
+    Returns
+    -------
+    npt.ArrayLike
+        The image (summed over energy) with shape (X, Y).
+    npt.ArrayLike
+        The spectrum (summed over pixels) with shape (S,).
+    np.ArrayLike
+        Energy axis with shape (S,).
+    Dict[str, npt.ArrayLike]
+        The element maps (integrated over each window) with shape (X, Y).
+    Dict[str, Any]
+        The metadata dictionary (may contain NumPy values).
+
+    Raises
+    ------
+    ValueError
+        If no hyperspectral image is found in the experiment file.
+    """
+    signal = open_spectrum_image(experiment_file)
+    energy = energy_axis(signal.data.shape[2])
+
+    # Reduce the hyperspectral image in a single streaming pass
+    channels = energy_windows(windows, energy)
+    image, spectrum = ImageProjection(), SumSpectrum()
+    maps = WindowMaps(list(channels.values()))
+    reducers: List[Reducer] = [image, spectrum, maps]
+    pyramid = None
+    if pyramid_file is not None:
+        pyramid = SpectrumImagePyramid(pyramid_file)
+        reducers.append(pyramid)
+    reduce_spectrum_image(signal.data, reducers)
+    element_maps = dict(zip(channels, maps.result()))
+
+    # Finish the pyramid of the hyperspectral image and add the projection
+    if pyramid is not None:
+        pyramid.result()
+        write_image_pyramid(image.result(), pyramid.path)
+
+    # Extract the metadata for the hyperspectral image
+    metadata = signal.metadata.as_dictionary()
+
+    return image.result(), spectrum.result(), energy, element_maps, metadata
+
+
+def render_previews(
+    experiment_file: Path,
+    image: npt.ArrayLike,
+    spectrum: npt.ArrayLike,
+    energy: npt.ArrayLike,
+    figure: bool = False,
+) -> Dict[str, Optional[str]]:
+    """Render the intensity map, its web thumbnail and (optionally) the figure.
+
+    Returns
+    -------
+    Dict[str, Optional[str]]
+        The paths of the "hyperspectral_image", "hyperspectral_thumbnail"
+        and "hyperspectral_figure" (None unless `figure` is set).
+    """
+    plot_file = experiment_file.with_suffix(".png")
+    thumbnail_file = experiment_file.with_suffix(".thumb.png")
+    render_image(image, plot_file, thumbnail=thumbnail_file)
+
+    # The full matplotlib figure is slow to render, so it is opt-in
+    figure_file = None
+    if figure:
+        figure_file = experiment_file.with_suffix(".figure.png")
+        plot_hyperspectral_figure(image, spectrum, energy, figure_file)
+
+    return {
+        "hyperspectral_image": str(plot_file),
+        "hyperspectral_thumbnail": str(thumbnail_file),
+        "hyperspectral_figure": str(figure_file) if figure_file else None,
+    }
+
+
+def save_element_maps(
+    experiment_file: Path, element_maps: Dict[str, npt.ArrayLike]
+) -> Dict[str, Any]:
+    """Render each element map and save their values to an .npz file.
+
+    Returns
+    -------
+    Dict[str, Any]
+        The paths of the rendered "element_maps" (keyed by label) and of
+        the "element_maps_data" (None if there are no maps).
+    """
+    element_map_files = {}
+    for label, element_map in element_maps.items():
+        map_file = experiment_file.with_name(f"{experiment_file.stem}.{label}.png")
+        render_image(element_map, map_file, cmap="viridis")
+        element_map_files[label] = str(map_file)
+
+    element_maps_file = None
+    if element_maps:
+        element_maps_file = experiment_file.with_suffix(".element_maps.npz")
+        np.savez_compressed(element_maps_file, **element_maps)
+
+    return {
+        "element_maps": element_map_files,
+        "element_maps_data": str(element_maps_file) if element_maps_file else None,
+    }
+
+
+def decompose_hyperspectral_image(
+    experiment_file: Path,
+    image: npt.ArrayLike,
+    spectrum: npt.ArrayLike,
+    options: Dict[str, Any],
+) -> Dict[str, Any]:
+    """Fit a low-rank model of the hyperspectral image and save its results.
+
+    The data is streamed from the file in blocks of pixels, so the
+    decomposition has bounded memory (see `picoprobe.tools.decomposition`).
+
+    Parameters
+    ----------
+    experiment_file : Path
+        The path to the experiment file.
+    image : npt.ArrayLike
+        The image (summed over energy) with shape (X, Y).
+    spectrum : npt.ArrayLike
+        The spectrum (summed over pixels) with shape (S,).
+    options : Dict[str, Any]
+        The "method" ("pca" or "nmf"), "n_components" (8), "n_epochs"
+        of NMF (10) and "normalize_poissonian_noise" (True).
+
+    Returns
+    -------
+    Dict[str, Any]
+        The paths of the saved components and loading maps.
+    """
+    method = options.get("method", "pca")
+    if method not in ("pca", "nmf"):
+        raise ValueError(f"Unknown decomposition method: {method}")
+    n_components = options.get("n_components", 8)
+    if not options.get("normalize_poissonian_noise", True):
+        image, spectrum = None, None
+
+    signal = open_spectrum_image(experiment_file)
+    result = pca(signal.data, n_components, image, spectrum)
+    ratio = result.explained_variance_ratio
+    if method == "nmf":
+        # Start NMF from the principal components
+        result = nmf(
+            signal.data,
+            n_components,
+            image,
+            spectrum,
+            n_epochs=options.get("n_epochs", 10),
+            init=result.components,
+        )
+
+    data_file = experiment_file.with_suffix(".decomposition.npz")
+    result.save(data_file)
+
+    loading_map_files = []
+    for i, loading_map in enumerate(result.loading_maps):
+        map_file = experiment_file.with_name(f"{experiment_file.stem}.{method}{i}.png")
+        render_image(loading_map, map_file, cmap="RdBu_r")
+        loading_map_files.append(str(map_file))
+
+    return {
+        "method": method,
+        "n_components": result.n_components,
+        "data": str(data_file),
+        "loading_maps": loading_map_files,
+        "pca_explained_variance_ratio": None if ratio is None else ratio.tolist(),
+    }
@@ -0,0 +1,236 @@
+"""Single-pass, bounded-memory reductions of large spectrum images.
+
+A spectrum image with shape (Y, X, S) is read a block of rows at a time,
+aligned to the storage chunks of the array, and every reducer is updated
+with each block. All the reductions therefore share a single read of the
+data, and at most one block is held in memory at a time.
+
+The data may be an `h5py.Dataset` (blocks are read directly into a reused
+buffer), a lazily loaded dask array (e.g., `signal.data` of a HyperSpy
+signal loaded with `lazy=True`) or an in-memory NumPy array.
+"""
+from abc import ABC, abstractmethod
+from typing import Any, Iterator, Sequence, Tuple
+
+import numpy as np
+import numpy.typing as npt
+
+# Default upper bound of the memory used by a block of rows
+DEFAULT_BLOCK_BYTES = 256 * 1024**2
+
+
+def accumulator_dtype(dtype: npt.DTypeLike) -> np.dtype:
+    """Return a dtype that can accumulate sums of `dtype` values without overflow."""
+    dtype = np.dtype(dtype)
+    if np.issubdtype(dtype, np.unsignedinteger) or dtype == np.bool_:
+        return np.dtype(np.uint64)
+    if np.issubdtype(dtype, np.integer):
+        return np.dtype(np.int64)
+    if np.issubdtype(dtype, np.complexfloating):
+        return np.dtype(np.complex128)
+    return np.dtype(np.float64)
+
+
+def _row_chunk(data: Any) -> int:
+    """Return the number of rows of a storage chunk of `data`."""
+    chunks = getattr(data, "chunks", None)
+    if not chunks:
+        # Contiguous HDF5 datasets and NumPy arrays
+        return 1
+    first = chunks[0]
+    # Dask arrays report the size of every chunk along each axis
+    return int(max(first) if isinstance(first, tuple) else first)
+
+
+def iter_row_blocks(
+    data: Any, max_block_bytes: int = DEFAULT_BLOCK_BYTES
+) -> Iterator[Tuple[slice, np.ndarray]]:
+    """Iterate over blocks of rows (the first axis) of `data`.
+
+    Blocks span a whole number of storage chunks so that each chunk is read
+    and decompressed once. The yielded array may be a reused buffer, so it
+    is only valid until the next block is requested.
+
+    Parameters
+    ----------
+    data : Any
+        An h5py dataset, dask array or NumPy array.
+    max_block_bytes : int, optional
+        Approximate upper bound of the size of a block, by default 256 MiB
+        (a single chunk of rows is always read, even if it is larger)
+
+    Yields
+    ------
+    Tuple[slice, np.ndarray]
+        The rows of the block and the block data.
+    """
+    n_rows = data.shape[0]
+    row_bytes = (
+        int(np.prod(data.shape[1:], dtype=np.int64)) * np.dtype(data.dtype).itemsize
+    )
+    chunk_rows = _row_chunk(data)
+    rows = max(1, max_block_bytes // max(row_bytes * chunk_rows, 1)) * chunk_rows
+    rows = min(rows, n_rows)
+
+    read_direct = getattr(data, "read_direct", None)
+    if read_direct is not None:
+        # Read HDF5 blocks straight into a reused buffer
+        buffer = np.empty((rows,) + tuple(data.shape[1:]), dtype=data.dtype)
+        for start in range(0, n_rows, rows):
+            stop = min(start + rows, n_rows)
+            read_direct(buffer, np.s_[start:stop], np.s_[: stop - start])
+            yield slice(start, stop), buffer[: stop - start]
+    elif hasattr(data, "compute"):
+        for start in range(0, n_rows, rows):
+            stop = min(start + rows, n_rows)
+            yield slice(start, stop), np.asarray(data[start:stop].compute())
+    else:
+        for start in range(0, n_rows, rows):
+            stop = min(start + rows, n_rows)
+            yield slice(start, stop), np.asarray(data[start:stop])
+
+
+class Reducer(ABC):
+    """A reduction of a spectrum image, updated one block of rows at a time."""
+
+    def start(self, shape: Sequence[int], dtype: np.dtype) -> None:
+        """Prepare the reduction of data with `shape` and `dtype`."""
+
+    @abstractmethod
+    def update(self, rows: slice, block: np.ndarray) -> None:
+        """Add a block of rows (with shape (rows, X, S)) to the reduction."""
+
+    @abstractmethod
+    def result(self) -> Any:
+        """Return the reduced data."""
+
+
+class ImageProjection(Reducer):
+    """Sum the spectrum of each pixel, giving an (Y, X) image."""
+
+    def start(self, shape: Sequence[int], dtype: np.dtype) -> None:
+        self.image = np.zeros(shape[:2], dtype=accumulator_dtype(dtype))
+
+    def update(self, rows: slice, block: np.ndarray) -> None:
+        block.sum(axis=2, dtype=self.image.dtype, out=self.image[rows])
+
+    def result(self) -> np.ndarray:
+        return self.image
+
+
+class SumSpectrum(Reducer):
+    """Sum the spectra of every pixel, giving an (S,) spectrum."""
+
+    def start(self, shape: Sequence[int], dtype: np.dtype) -> None:
+        self.spectrum = np.zeros(shape[2], dtype=accumulator_dtype(dtype))
+
+    def update(self, rows: slice, block: np.ndarray) -> None:
+        self.spectrum += block.sum(axis=(0, 1), dtype=self.spectrum.dtype)
+
+    def result(self) -> np.ndarray:
+        return self.spectrum
+
+
+class WindowMaps(Reducer):
+    """Integrate the spectrum of each pixel over channel windows, giving (W, Y, X) maps.
+
+    Each window is integrated as the difference of two entries of the
+    cumulative sum of the spectrum, so the cost per pixel does not depend
+    on the number (or width) of the windows. Windows may overlap.
+    """
+
+    def __init__(self, windows: Sequence[Tuple[int, int]]) -> None:
+        """Initialize the reduction.
+
+        Parameters
+        ----------
+        windows : Sequence[Tuple[int, int]]
+            The (start, stop) channels of each window (stop excluded).
+        """
+        self.windows = [(int(start), int(stop)) for start, stop in windows]
+
+    def start(self, shape: Sequence[int], dtype: np.dtype) -> None:
+        n_channels = shape[2]
+        for start, stop in self.windows:
+            if not 0 <= start <= stop <= n_channels:
+                raise ValueError(
+                    f"Window {start}:{stop} is outside of the {n_channels} channels"
+                )
+        acc = accumulator_dtype(dtype)
+        self.maps = np.zeros((len(self.windows), shape[0], shape[1]), dtype=acc)
+        self._starts = np.array([start for start, _ in self.windows], dtype=np.intp)
+        self._stops = np.array([stop for _, stop in self.windows], dtype=np.intp)
+        # Cumulative sum of a row of spectra, with a leading zero channel
+        self._cumsum = np.zeros((shape[1], n_channels + 1), dtype=acc)
+
+    def update(self, rows: slice, block: np.ndarray) -> None:
+        if not self.windows:
+            return
+        # One row of pixels at a time bounds the size of the cumulative sum
+        for i, row in enumerate(block):
+            np.cumsum(row, axis=1, dtype=self._cumsum.dtype, out=self._cumsum[:, 1:])
+            window_sums = self._cumsum[:, self._stops] - self._cumsum[:, self._starts]
+            self.maps[:, rows.start + i] = window_sums.T
+
+    def result(self) -> np.ndarray:
+        return self.maps
+
+
+def reduce_spectrum_image(
+    data: Any,
+    reducers: Sequence[Reducer],
+    max_block_bytes: int = DEFAULT_BLOCK_BYTES,
+) -> Sequence[Reducer]:
+    """Update every reducer with a single pass over the spectrum image.
+
+    Parameters
+    ----------
+    data : Any
+        The spectrum image with shape (Y, X, S), as an h5py dataset, dask
+        array or NumPy array.
+    reducers : Sequence[Reducer]
+        The reductions to compute.
+    max_block_bytes : int, optional
+        Approximate upper bound of the memory used to read the data,
+        by default 256 MiB
+
+    Returns
+    -------
+    Sequence[Reducer]
+        The `reducers`, whose results are ready.
+    """
+    if len(data.shape) != 3:
+        raise ValueError(f"Expected a spectrum image with 3 axes, got {data.shape}")
+
+    for reducer in reducers:
+        reducer.start(data.shape, np.dtype(data.dtype))
+    for rows, block in iter_row_blocks(data, max_block_bytes):
+        for reducer in reducers:
+            reducer.update(rows, block)
+    return reducers
+
+
+def project_spectrum_image(
+    data: Any, max_block_bytes: int = DEFAULT_BLOCK_BYTES
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Compute the image projection and the summed spectrum in a single pass.
+
+    Parameters
+    ----------
+    data : Any
+        The spectrum image with shape (Y, X, S), as an h5py dataset, dask
+        array or NumPy array.
+    max_block_bytes : int, optional
+        Approximate upper bound of the memory used to read the data,
+        by default 256 MiB
+
+    Returns
+    -------
+    np.ndarray
+        The image (summed over the spectral axis) with shape (Y, X).
+    np.ndarray
+        The spectrum (summed over every pixel) with shape (S,).
+    """
+    image, spectrum = ImageProjection(), SumSpectrum()
+    reduce_spectrum_image(data, [image, spectrum], max_block_bytes)
+    return image.result(), spectrum.result()
@@ -2,57 +2,122 @@ from gladier import GladierBaseTool, generate_flow_definition
 
 
 def temporal_image_tool(**data):
-    """Given an experiment file (.emd), extract the temporal video and metadata.
+    """Given the experiment files (.emd) in the dataset, extract the temporal videos and metadata.
 
     Returns
     -------
     Dict[str, Any]
         The output data dictionary containing the experiment metadata.
+
+    Raises
+    ------
+    ValueError
+        If no image stack is found in the experiment file.
     """
-    import json
-    import shutil
     from pathlib import Path
+    from typing import Any, Dict, Iterator, Optional, Tuple
+
     import imageio
-    import hyperspy.api as hs
     import numpy as np
-    import numpy.typing as npt
-    import subprocess
-
-    def create_mp4_from_array(a: npt.ArrayLike, output_filename: str, fps: int = 100):
-        """Create an MP4 video from a 3D array (T, X, Y)."""
-        # Supress type conversion warnings at each iteration
-        # logging.getLogger("imageio").setLevel(logging.ERROR)
-        bitdepth = 8
-        with imageio.get_writer(output_filename, fps=fps) as writer:
-            for frame in a:
-                # Having this explicit type conversion avoids warnings
-                # from imageio and speeds up the code significantly
-                mi, ma = np.min(frame), np.max(frame)
-                im = (frame - mi) / (ma - mi) * (
-                    np.power(2.0, bitdepth) - 1
-                ) + 0.499999999
-                im = im.astype(np.uint8)
-                writer.append_data(im)  # Write each frame
-
-    def run_yolo(source_path: str, model_path: str) -> str:
-        """Run a pre-trained YOLOv8 model on a source video file."""
-        command = f"yolo task=detect mode=predict model={model_path} conf=0.25 source='{source_path}' save=True"
-        output_dir = Path(source_path).parent
-        subprocess.run(command, cwd=output_dir, shell=True)
-
-        # Collect the output file with the predictions
-        prediction_path = (
-            output_dir / "runs" / "detect" / "predict" / Path(source_path).name
-        )
 
-        # Move the prediction file to the output directory
-        final_prediction_path = output_dir / f"prediction-{prediction_path.name}"
-        shutil.move(prediction_path, final_prediction_path)
-
-        # Clean up the yolo output directory
-        shutil.rmtree(output_dir / "runs", ignore_errors=True)
+    from picoprobe.tools.detection import Detector, iter_frame_batches
+    from picoprobe.tools.emd import load_signal
+    from picoprobe.tools.pipeline import Pipeline
+    from picoprobe.tools.serialization import (
+        DEFAULT_MAX_ARRAY_SIZE,
+        add_experiments,
+        dumps,
+        to_jsonable,
+        write_sidecar,
+    )
+    from picoprobe.tools.streaming import iter_row_blocks
+    from picoprobe.tools.tracking import (
+        summarize_tracks,
+        track_detections,
+        track_table,
+        write_tables,
+    )
+    from picoprobe.tools.video import frame_rate, stack_normalizer
+
+    def analyze_frames(
+        data: Any,
+        video_file: str,
+        model_path: str,
+        prediction_file: Optional[str],
+        fps: float,
+        normalization: str,
+        batch_size: int,
+        queue_size: int,
+        block_bytes: int,
+    ) -> Tuple[Dict[str, np.ndarray], Dict[str, Dict[str, Any]]]:
+        """Encode the video and detect nanoparticles in a single pipelined pass.
+
+        Reading, normalizing, encoding and inference run concurrently in
+        threads connected by bounded queues, so the frames flow through
+        as they are read and at most a few blocks are held in memory.
+
+        Parameters
+        ----------
+        data : Any
+            The (lazily loaded) frames with shape (T, X, Y).
+        video_file : str
+            The path of the video file.
+        model_path : str
+            The path to the YOLOv8 model weights.
+        prediction_file : Optional[str]
+            The path of the annotated video (None if not written).
+        fps : float
+            The frame rate of the videos.
+        normalization : str
+            The normalization of the frames (see `picoprobe.tools.video`).
+        batch_size : int
+            The number of frames per inference batch.
+        queue_size : int
+            The number of blocks in flight between consecutive stages.
+        block_bytes : int
+            Approximate upper bound of the size of a block of frames.
+
+        Returns
+        -------
+        Dict[str, np.ndarray]
+            The detections as columns (see `Detector.result`).
+        Dict[str, Dict[str, Any]]
+            The throughput of each stage (see `StageStats.as_dict`).
+        """
+        normalize = stack_normalizer(data, normalization)
+        detector = Detector(model_path, annotated_video=prediction_file, fps=fps)
+
+        def normalize_blocks(blocks: Iterator[np.ndarray]) -> Iterator[np.ndarray]:
+            for block in blocks:
+                # The normalizer reuses its buffer, so the frames are copied
+                yield normalize(block).copy()
+
+        def encode_blocks(blocks: Iterator[np.ndarray]) -> None:
+            with imageio.get_writer(video_file, fps=fps) as writer:
+                for block in blocks:
+                    for frame in block:
+                        writer.append_data(frame)
+
+        def detect_blocks(blocks: Iterator[np.ndarray]) -> None:
+            for batch in iter_frame_batches(blocks, batch_size):
+                detector.predict(batch)
+
+        pipeline = Pipeline(queue_size)
+        # Blocks read from HDF5 reuse a buffer, so they are copied
+        pipeline.add_source(
+            "read",
+            (np.array(block) for _, block in iter_row_blocks(data, block_bytes)),
+        )
+        pipeline.add_stage("normalize", normalize_blocks, upstream="read")
+        pipeline.add_stage("encode", encode_blocks, upstream="normalize")
+        pipeline.add_stage("detect", detect_blocks, upstream="normalize")
+        try:
+            stats = pipeline.run()
+        finally:
+            detector.close()
 
-        return str(final_prediction_path)
+        throughput = {name: stage.as_dict() for name, stage in stats.items()}
+        return detector.result(), throughput
 
     # General experiment metadata
     metadata = {
@@ -64,37 +129,116 @@ def temporal_image_tool(**data):
         "exp_type": "picoprobe",
     }
 
-    # Unpack the experiment file from the input payload
+    # Unpack the experiment files from the input payload (a batched flow
+    # run transfers several experiment files into the same directory)
     experiment_dir = data["publishv2"]["dataset"]
-    experiment_file = next(Path(experiment_dir).glob("*.emd"))
-
-    # Load the microscopy dataset and extract metadata
-    signals = hs.load(experiment_file)
-    experiment_metadata = signals.metadata.as_dictionary()
-
-    # Convert the metadata to JSON (by default it has np.int64, np.float64, etc.)
-    experiment_metadata = json.loads(json.dumps(experiment_metadata))
+    experiment_files = sorted(Path(experiment_dir).glob("*.emd"))
+    if not experiment_files:
+        raise ValueError(f"No experiment files found in: {experiment_dir}")
+
+    # Optional formatting of the metadata (compact JSON is faster to ingest)
+    max_array_size = data.get("max_metadata_array_size", DEFAULT_MAX_ARRAY_SIZE)
+    indent = data.get("metadata_indent")
+    # Scale each frame ("frame"), the whole stack ("global") or clip the
+    # stack percentiles ("percentile") to the 8-bit range of the video
+    normalization = data.get("video_normalization", "frame")
+    # Frames per inference batch, and whether to render the annotated video
+    batch_size = data.get("yolo_batch_size", 16)
+    annotate_video = data.get("annotate_video", False)
+    # Blocks of frames in flight between the stages bound the memory used
+    queue_size = data.get("pipeline_queue_size", 4)
+    block_bytes = data.get("pipeline_block_bytes", 16 * 1024**2)
+    # Detections are linked into tracks when their boxes overlap by at
+    # least the IoU threshold, allowing a few missed frames in between
+    iou_threshold = data.get("tracking_iou_threshold", 0.3)
+    max_gap = data.get("tracking_max_gap", 2)
+
+    experiments = []
+    for experiment_file in experiment_files:
+        # Probe the file header and load only the image stack (the other
+        # detector signals in the file are never read)
+        signal = load_signal(experiment_file, "time_series", lazy=True)
+        experiment_metadata = signal.metadata.as_dictionary()
+        # The frame rate given in the flow input, or recorded in the file
+        fps = data.get("fps") or frame_rate(signal)
+
+        # Convert the metadata to JSON types (it has np.int64, np.float64, etc.)
+        # and move the large arrays to a sidecar file
+        arrays: Dict[str, np.ndarray] = {}
+        experiment_metadata = to_jsonable(experiment_metadata, max_array_size, arrays)
+        sidecar = write_sidecar(arrays, experiment_file.with_suffix(".metadata.npz"))
+
+        # Extract a video from the raw signal and run YOLOv8 on the frames to
+        # predict nanoparticle locations (the model stays loaded in the
+        # worker between tasks)
+        video_file = str(experiment_file.with_suffix(".mp4"))
+        prediction_path = None
+        if annotate_video:
+            prediction_path = str(
+                experiment_file.with_name(f"prediction-{experiment_file.stem}.mp4")
+            )
+        detections, throughput = analyze_frames(
+            signal.data,
+            video_file,
+            data["yolo_model_path"],
+            prediction_path,
+            fps,
+            normalization,
+            batch_size,
+            queue_size,
+            block_bytes,
+        )
 
-    # Extract a video from the raw signal
-    video_file = str(experiment_file.with_suffix(".mp4"))
-    create_mp4_from_array(signals._data, video_file, fps=100)
+        # Link the detections across frames and write the detection and
+        # track tables as columns (frame, box, confidence, class, track)
+        detections["track"] = track_detections(detections, iou_threshold, max_gap)
+        tracks = track_table(detections)
+        summary = summarize_tracks(detections, tracks, signal.data.shape[0], fps)
+        detections_file = write_tables(
+            experiment_file.with_suffix(".detections.h5"),
+            {"detections": detections, "tracks": tracks},
+            {"fps": fps},
+        )
 
-    # Run YOLOv8 on the video to predict nanoparticle locations
-    prediction_path = run_yolo(video_file, data["yolo_model_path"])
+        experiments.append(
+            {
+                "experiment_file": str(experiment_file),
+                "experiment_metadata": experiment_metadata,
+                "temporal_data": video_file,
+                "temporal_prediction_data": prediction_path,
+                "temporal_detections": str(detections_file),
+                "num_detections": summary["num_detections"],
+                "detection_summary": summary,
+                "pipeline_throughput": throughput,
+                "experiment_metadata_arrays": str(sidecar) if sidecar else None,
+            }
+        )
 
-    # Add the experiment metadata to the general metadata
-    metadata["experiment_metadata"] = experiment_metadata
-    metadata["temporal_data"] = video_file
-    metadata["temporal_prediction_data"] = prediction_path
+    # Add the experiment metadata to the general metadata (the first
+    # experiment is reported at the top level for the portal)
+    add_experiments(
+        metadata,
+        experiments,
+        [
+            "experiment_metadata",
+            "experiment_metadata_arrays",
+            "temporal_data",
+            "temporal_prediction_data",
+            "temporal_detections",
+            "detection_summary",
+        ],
+    )
 
     # Update the output data with the experiment metadata
     final_data = data["publishv2"]
     final_data["metadata"] = metadata
 
-    # Save the metadata to a file
-    metadata_file = experiment_file.with_suffix(".json")
-    with open(metadata_file, "w") as f:
-        f.write(json.dumps(final_data, indent=4))
+    # Save the metadata to a file (encoded once for every experiment file)
+    text = dumps(final_data, indent)
+    for experiment_file in experiment_files:
+        metadata_file = experiment_file.with_suffix(".json")
+        with open(metadata_file, "w") as f:
+            f.write(text)
 
     return final_data
 
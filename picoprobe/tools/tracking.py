@@ -0,0 +1,302 @@
+"""Link object detections across frames into tracks and summarize them.
+
+Detections are handled as columnar tables: dictionaries of equally long
+NumPy arrays (see `picoprobe.tools.detection.DETECTION_COLUMNS`). The
+tracker matches the boxes of each frame to the active tracks with an
+optimal assignment on a vectorized IoU cost matrix, so a whole frame is
+linked at once. The tables are stored as one compressed HDF5 dataset per
+column, which can be read (and queried) one column at a time.
+"""
+from pathlib import Path
+from typing import Any, Dict, Optional, Union
+
+import h5py
+import numpy as np
+
+PathLike = Union[str, Path]
+
+# The columns of the track tables
+TRACK_COLUMNS = (
+    "track",
+    "class",
+    "start_frame",
+    "end_frame",
+    "length",
+    "x_start",
+    "y_start",
+    "x_end",
+    "y_end",
+    "path_length",
+    "mean_speed",
+)
+
+
+def box_iou(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """Return the intersection over union of every pair of (x1, y1, x2, y2) boxes.
+
+    Parameters
+    ----------
+    a : np.ndarray
+        The boxes with shape (N, 4).
+    b : np.ndarray
+        The boxes with shape (M, 4).
+
+    Returns
+    -------
+    np.ndarray
+        The IoU matrix with shape (N, M).
+    """
+    a = np.asarray(a, dtype=np.float32).reshape(-1, 1, 4)
+    b = np.asarray(b, dtype=np.float32).reshape(1, -1, 4)
+    width = np.minimum(a[..., 2], b[..., 2]) - np.maximum(a[..., 0], b[..., 0])
+    height = np.minimum(a[..., 3], b[..., 3]) - np.maximum(a[..., 1], b[..., 1])
+    intersection = np.clip(width, 0, None) * np.clip(height, 0, None)
+    area_a = (a[..., 2] - a[..., 0]) * (a[..., 3] - a[..., 1])
+    area_b = (b[..., 2] - b[..., 0]) * (b[..., 3] - b[..., 1])
+    union = area_a + area_b - intersection
+    return np.divide(
+        intersection, union, out=np.zeros_like(intersection), where=union > 0
+    )
+
+
+class IoUTracker:
+    """Link the boxes of consecutive frames by optimal IoU assignment."""
+
+    def __init__(self, iou_threshold: float = 0.3, max_gap: int = 2) -> None:
+        """Initialize the tracker.
+
+        Parameters
+        ----------
+        iou_threshold : float, optional
+            The minimum IoU of a box with the last box of a track to extend
+            the track, by default 0.3
+        max_gap : int, optional
+            The number of frames a track may miss before it ends,
+            by default 2
+        """
+        self.iou_threshold = iou_threshold
+        self.max_gap = max_gap
+        self.boxes = np.zeros((0, 4), dtype=np.float32)
+        self.ids = np.zeros(0, dtype=np.int32)
+        self.last_frame = np.zeros(0, dtype=np.int64)
+        self.next_id = 0
+
+    def update(self, frame: int, boxes: np.ndarray) -> np.ndarray:
+        """Assign the boxes of a frame to tracks, returning their track ids.
+
+        Frames must be given in increasing order (frames without boxes
+        may be skipped).
+        """
+        from scipy.optimize import linear_sum_assignment
+
+        boxes = np.asarray(boxes, dtype=np.float32).reshape(-1, 4)
+
+        # End the tracks that were missed for too many frames
+        alive = frame - self.last_frame <= self.max_gap + 1
+        self.boxes, self.ids = self.boxes[alive], self.ids[alive]
+        self.last_frame = self.last_frame[alive]
+
+        ids = np.full(len(boxes), -1, dtype=np.int32)
+        if len(boxes) and len(self.ids):
+            iou = box_iou(self.boxes, boxes)
+            rows, cols = linear_sum_assignment(1.0 - iou)
+            matched = iou[rows, cols] >= self.iou_threshold
+            rows, cols = rows[matched], cols[matched]
+            ids[cols] = self.ids[rows]
+            self.boxes[rows] = boxes[cols]
+            self.last_frame[rows] = frame
+
+        # Start a track for every unmatched box
+        new = ids < 0
+        n_new = int(new.sum())
+        if n_new:
+            ids[new] = np.arange(self.next_id, self.next_id + n_new, dtype=np.int32)
+            self.next_id += n_new
+            self.boxes = np.concatenate([self.boxes, boxes[new]])
+            self.ids = np.concatenate([self.ids, ids[new]])
+            self.last_frame = np.concatenate(
+                [self.last_frame, np.full(n_new, frame, dtype=np.int64)]
+            )
+        return ids
+
+
+def track_detections(
+    detections: Dict[str, np.ndarray],
+    iou_threshold: float = 0.3,
+    max_gap: int = 2,
+) -> np.ndarray:
+    """Return the track id of every detection (see `IoUTracker`).
+
+    Parameters
+    ----------
+    detections : Dict[str, np.ndarray]
+        The detection table, sorted by frame.
+    iou_threshold : float, optional
+        The minimum IoU to link two boxes, by default 0.3
+    max_gap : int, optional
+        The number of frames a track may miss, by default 2
+
+    Returns
+    -------
+    np.ndarray
+        The track id of each detection.
+    """
+    tracker = IoUTracker(iou_threshold, max_gap)
+    frames = detections["frame"]
+    boxes = np.stack([detections[c] for c in ("x1", "y1", "x2", "y2")], axis=1)
+    tracks = np.zeros(len(frames), dtype=np.int32)
+
+    # Split the table into the (contiguous) detections of each frame
+    unique, starts = np.unique(frames, return_index=True)
+    stops = np.append(starts[1:], len(frames))
+    for frame, start, stop in zip(unique, starts, stops):
+        tracks[start:stop] = tracker.update(int(frame), boxes[start:stop])
+    return tracks
+
+
+def track_table(detections: Dict[str, np.ndarray]) -> Dict[str, np.ndarray]:
+    """Summarize each track of the detections (with a "track" column).
+
+    Returns
+    -------
+    Dict[str, np.ndarray]
+        The track table (see `TRACK_COLUMNS`): the first and last frame,
+        the number of detections, the first and last box center, the
+        length of the path of the center (in pixels) and its mean speed
+        (in pixels per frame).
+    """
+    tracks, frames = detections["track"], detections["frame"]
+    cx = (detections["x1"] + detections["x2"]) / 2
+    cy = (detections["y1"] + detections["y2"]) / 2
+
+    # Sort by track then frame, so each track is a contiguous run
+    order = np.lexsort((frames, tracks))
+    tracks, frames, cx, cy = tracks[order], frames[order], cx[order], cy[order]
+    classes = detections["class"][order]
+
+    ids, starts, lengths = np.unique(tracks, return_index=True, return_counts=True)
+    ends = starts + lengths - 1
+
+    # Steps between consecutive detections of the same track
+    step = np.hypot(np.diff(cx), np.diff(cy))
+    same_track = tracks[1:] == tracks[:-1]
+    step = np.where(same_track, step, 0)
+    cumulative = np.concatenate([[0.0], np.cumsum(step, dtype=np.float64)])
+    path_length = cumulative[ends] - cumulative[starts]
+    duration = frames[ends] - frames[starts]
+
+    return {
+        "track": ids.astype(np.int32),
+        "class": classes[starts].astype(np.int16),
+        "start_frame": frames[starts].astype(np.int32),
+        "end_frame": frames[ends].astype(np.int32),
+        "length": lengths.astype(np.int32),
+        "x_start": cx[starts].astype(np.float32),
+        "y_start": cy[starts].astype(np.float32),
+        "x_end": cx[ends].astype(np.float32),
+        "y_end": cy[ends].astype(np.float32),
+        "path_length": path_length.astype(np.float32),
+        "mean_speed": np.divide(
+            path_length,
+            duration,
+            out=np.zeros(len(ids)),
+            where=duration > 0,
+        ).astype(np.float32),
+    }
+
+
+def _stats(values: np.ndarray) -> Dict[str, Optional[float]]:
+    if len(values) == 0:
+        return {"mean": None, "median": None, "max": None}
+    return {
+        "mean": float(np.mean(values)),
+        "median": float(np.median(values)),
+        "max": float(np.max(values)),
+    }
+
+
+def summarize_tracks(
+    detections: Dict[str, np.ndarray],
+    tracks: Dict[str, np.ndarray],
+    n_frames: int,
+    fps: float,
+) -> Dict[str, Any]:
+    """Return summary statistics of the detections and tracks of an experiment.
+
+    Parameters
+    ----------
+    detections : Dict[str, np.ndarray]
+        The detection table.
+    tracks : Dict[str, np.ndarray]
+        The track table (see `track_table`).
+    n_frames : int
+        The number of frames of the experiment.
+    fps : float
+        The frame rate, used to convert speeds to pixels per second.
+
+    Returns
+    -------
+    Dict[str, Any]
+        The counts per frame, track lengths and speeds (JSON serializable).
+    """
+    counts = np.bincount(detections["frame"], minlength=n_frames)
+    classes, class_counts = np.unique(detections["class"], return_counts=True)
+    # Speeds are only defined for tracks spanning several frames
+    moving = tracks["end_frame"] > tracks["start_frame"]
+    return {
+        "num_frames": int(n_frames),
+        "num_detections": int(len(detections["frame"])),
+        "detections_per_frame": _stats(counts),
+        "detections_per_class": {
+            str(c): int(n) for c, n in zip(classes.tolist(), class_counts.tolist())
+        },
+        "num_tracks": int(len(tracks["track"])),
+        "track_length": _stats(tracks["length"]),
+        "speed_px_per_s": _stats(tracks["mean_speed"][moving] * fps),
+    }
+
+
+def write_tables(
+    path: PathLike,
+    tables: Dict[str, Dict[str, np.ndarray]],
+    attrs: Optional[Dict[str, Any]] = None,
+) -> Path:
+    """Write columnar tables to an HDF5 file, one compressed dataset per column.
+
+    Parameters
+    ----------
+    path : PathLike
+        The path of the HDF5 file.
+    tables : Dict[str, Dict[str, np.ndarray]]
+        The tables (e.g., "detections" and "tracks"), keyed by group name.
+    attrs : Optional[Dict[str, Any]], optional
+        Attributes of the file (e.g., the frame rate), by default None
+
+    Returns
+    -------
+    Path
+        The path of the HDF5 file.
+    """
+    with h5py.File(path, "w") as f:
+        for key, value in (attrs or {}).items():
+            f.attrs[key] = value
+        for name, table in tables.items():
+            group = f.create_group(name)
+            for column, values in table.items():
+                group.create_dataset(
+                    column,
+                    data=values,
+                    compression="gzip" if len(values) else None,
+                    shuffle=bool(len(values)),
+                    chunks=(min(len(values), 65536),) if len(values) else None,
+                )
+    return Path(path)
+
+
+def read_tables(path: PathLike) -> Dict[str, Dict[str, np.ndarray]]:
+    """Read the columnar tables written by `write_tables`."""
+    with h5py.File(path, "r") as f:
+        return {
+            name: {column: group[column][()] for column in group}
+            for name, group in f.items()
+        }
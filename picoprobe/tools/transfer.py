@@ -0,0 +1,36 @@
+from gladier import GladierBaseTool
+
+
+class TransferItems(GladierBaseTool):
+    """Transfer a list of files (or directories) in a single Globus task.
+
+    The `transfer_items` input is a list of dictionaries with the keys
+    `source_path`, `destination_path` and `recursive`, as expected by the
+    Globus Transfer action provider.
+    """
+
+    flow_definition = {
+        "Comment": "Transfer a list of files or directories in Globus",
+        "StartAt": "TransferItems",
+        "States": {
+            "TransferItems": {
+                "Comment": "Transfer a list of files or directories in Globus",
+                "Type": "Action",
+                "ActionUrl": "https://actions.automate.globus.org/transfer/transfer",
+                "Parameters": {
+                    "source_endpoint_id.$": "$.input.transfer_source_endpoint_id",
+                    "destination_endpoint_id.$": "$.input.transfer_destination_endpoint_id",
+                    "transfer_items.$": "$.input.transfer_items",
+                },
+                "ResultPath": "$.TransferItems",
+                "WaitTime": 600,
+                "End": True,
+            },
+        },
+    }
+
+    required_input = [
+        "transfer_source_endpoint_id",
+        "transfer_destination_endpoint_id",
+        "transfer_items",
+    ]
@@ -0,0 +1,212 @@
+"""Encode stacks of image frames as 8-bit videos.
+
+Frames are read lazily, a block at a time (see `iter_row_blocks`), and
+each block is normalized at once in float32 into reused buffers before
+being handed to the video writer. Three normalization modes are
+supported:
+
+- "frame": each frame is scaled from its own min to its max.
+- "global": every frame is scaled from the min to the max of the stack
+  (requires an extra pass over the data to find them).
+- "percentile": every frame is scaled between two percentiles of the
+  stack (estimated from a sample of frames), clipping outliers such as
+  hot pixels.
+
+Flat frames (or stacks) are encoded as black instead of dividing by zero.
+"""
+from pathlib import Path
+from typing import Any, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+from picoprobe.tools.streaming import iter_row_blocks
+
+PathLike = Union[str, Path]
+
+NORMALIZATION_MODES = ("frame", "global", "percentile")
+
+# Frame rate of the videos of stacks without a recorded frame time
+DEFAULT_FPS = 100.0
+
+# Seconds per time unit of the time axes
+_TIME_UNITS = {"s": 1.0, "ms": 1e-3, "µs": 1e-6, "us": 1e-6, "ns": 1e-9}
+
+# Default upper bound of the memory used by a block of frames
+DEFAULT_FRAME_BLOCK_BYTES = 64 * 1024**2
+
+# Number of frames sampled to estimate the percentiles of a stack
+_PERCENTILE_SAMPLES = 64
+
+
+def stack_range(
+    data: Any, max_block_bytes: int = DEFAULT_FRAME_BLOCK_BYTES
+) -> Tuple[float, float]:
+    """Return the min and max of a (T, Y, X) stack in a streaming pass."""
+    low, high = np.inf, -np.inf
+    for _, block in iter_row_blocks(data, max_block_bytes):
+        low = min(low, float(np.nanmin(block)))
+        high = max(high, float(np.nanmax(block)))
+    return low, high
+
+
+def stack_percentiles(
+    data: Any,
+    percentiles: Sequence[float] = (0.5, 99.5),
+    n_samples: int = _PERCENTILE_SAMPLES,
+) -> Tuple[float, float]:
+    """Estimate two percentiles of a (T, Y, X) stack from evenly spaced frames."""
+    n_frames = data.shape[0]
+    indices = np.unique(np.linspace(0, n_frames - 1, min(n_samples, n_frames)))
+    samples = []
+    for index in indices.astype(int):
+        frame = data[index]
+        frame = frame.compute() if hasattr(frame, "compute") else frame
+        samples.append(np.asarray(frame, dtype=np.float32).ravel())
+    low, high = np.nanpercentile(np.concatenate(samples), percentiles)
+    return float(low), float(high)
+
+
+class FrameNormalizer:
+    """Normalize blocks of frames to uint8 into reused buffers."""
+
+    def __init__(
+        self,
+        mode: str = "frame",
+        vmin: Optional[float] = None,
+        vmax: Optional[float] = None,
+    ) -> None:
+        """Initialize the normalizer.
+
+        Parameters
+        ----------
+        mode : str, optional
+            "frame" to scale each frame to its own range, or "global" and
+            "percentile" to scale every frame from `vmin` to `vmax`,
+            by default "frame"
+        vmin : Optional[float], optional
+            The value mapped to 0 (unless `mode` is "frame"), by default None
+        vmax : Optional[float], optional
+            The value mapped to 255 (unless `mode` is "frame"), by default None
+        """
+        if mode not in NORMALIZATION_MODES:
+            raise ValueError(
+                f"Unknown normalization mode {mode!r}, expected one of "
+                f"{NORMALIZATION_MODES}"
+            )
+        if mode != "frame" and (vmin is None or vmax is None):
+            raise ValueError(f"The {mode!r} normalization requires vmin and vmax")
+        self.mode = mode
+        self.vmin = vmin
+        self.vmax = vmax
+        self._scaled: Optional[np.ndarray] = None
+        self._frames: Optional[np.ndarray] = None
+
+    def _buffers(self, shape: Tuple[int, ...]) -> Tuple[np.ndarray, np.ndarray]:
+        if self._scaled is None or self._scaled.shape[0] < shape[0]:
+            self._scaled = np.empty(shape, dtype=np.float32)
+            self._frames = np.empty(shape, dtype=np.uint8)
+        assert self._frames is not None
+        return self._scaled[: shape[0]], self._frames[: shape[0]]
+
+    def __call__(self, block: np.ndarray) -> np.ndarray:
+        """Return the uint8 frames of a (T, Y, X) block.
+
+        The returned array is a reused buffer, valid until the next call.
+        """
+        scaled, frames = self._buffers(block.shape)
+        scaled[...] = block
+
+        if self.mode == "frame":
+            axes = tuple(range(1, block.ndim))
+            low = scaled.min(axis=axes, keepdims=True)
+            span = scaled.max(axis=axes, keepdims=True) - low
+        else:
+            assert self.vmin is not None and self.vmax is not None
+            low = np.float32(self.vmin)
+            span = np.float32(self.vmax - self.vmin)
+        # Flat frames have a scale of 0 (and are encoded as black)
+        scale = np.divide(
+            np.float32(255),
+            span,
+            out=np.zeros_like(span, dtype=np.float32),
+            where=span > 0,
+        )
+
+        scaled -= low
+        scaled *= scale
+        np.clip(scaled, 0, 255, out=scaled)
+        scaled += 0.5
+        np.copyto(frames, scaled, casting="unsafe")
+        return frames
+
+
+def stack_normalizer(
+    data: Any,
+    mode: str = "frame",
+    percentiles: Sequence[float] = (0.5, 99.5),
+    max_block_bytes: int = DEFAULT_FRAME_BLOCK_BYTES,
+) -> FrameNormalizer:
+    """Return the normalizer of a (T, Y, X) stack, finding its range if needed."""
+    vmin = vmax = None
+    if mode == "global":
+        vmin, vmax = stack_range(data, max_block_bytes)
+    elif mode == "percentile":
+        vmin, vmax = stack_percentiles(data, percentiles)
+    return FrameNormalizer(mode, vmin, vmax)
+
+
+def frame_rate(signal: Any, default: float = DEFAULT_FPS) -> float:
+    """Return the frame rate of a stack from the time axis of its HyperSpy signal.
+
+    The time axis is the navigation axis with time units (e.g., the frame
+    time of Velox image stacks), the `default` is returned if there is none.
+    """
+    for axis in signal.axes_manager.navigation_axes:
+        unit = _TIME_UNITS.get(str(axis.units).strip())
+        if unit is not None and axis.scale > 0:
+            return 1.0 / (float(axis.scale) * unit)
+    return default
+
+
+def write_video(
+    data: Any,
+    output_filename: PathLike,
+    fps: float = DEFAULT_FPS,
+    mode: str = "frame",
+    percentiles: Sequence[float] = (0.5, 99.5),
+    max_block_bytes: int = DEFAULT_FRAME_BLOCK_BYTES,
+) -> Path:
+    """Encode a (T, Y, X) stack of frames as a video.
+
+    Parameters
+    ----------
+    data : Any
+        The frames, as an h5py dataset, (lazy) dask array or NumPy array.
+    output_filename : PathLike
+        The path of the video file (e.g., an .mp4 file).
+    fps : float, optional
+        The frame rate of the video, by default 100
+    mode : str, optional
+        The normalization mode, "frame", "global" or "percentile",
+        by default "frame"
+    percentiles : Sequence[float], optional
+        The percentiles mapped to 0 and 255 in "percentile" mode,
+        by default (0.5, 99.5)
+    max_block_bytes : int, optional
+        Approximate upper bound of the size of a block of frames,
+        by default 64 MiB
+
+    Returns
+    -------
+    Path
+        The path of the video file.
+    """
+    import imageio
+
+    normalize = stack_normalizer(data, mode, percentiles, max_block_bytes)
+
+    with imageio.get_writer(output_filename, fps=fps) as writer:
+        for _, block in iter_row_blocks(data, max_block_bytes):
+            for frame in normalize(block):
+                writer.append_data(frame)
+    return Path(output_filename)
@@ -1,15 +1,50 @@
+import hashlib
 import json
+import logging
+import mmap
+import os
+import random
+import sqlite3
 import time
 from abc import ABC, abstractmethod
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime
+from fnmatch import fnmatch
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 from pathlib import Path
-from pprint import pprint
-from threading import Event
-from typing import Dict, Set, Type, TypeVar, Union
+from pprint import pformat
+from queue import Queue
+from threading import Event, Lock, Thread
+from typing import (
+    Any,
+    Deque,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+    Set,
+    Tuple,
+    Type,
+    TypeVar,
+    Union,
+)
 
 import yaml
 from gladier import GladierBaseClient
+from globus_sdk import NetworkError
 from pydantic import BaseModel as _BaseModel
-from watchdog.events import FileSystemEvent, FileSystemEventHandler
+from watchdog.events import (
+    DirCreatedEvent,
+    DirDeletedEvent,
+    FileCreatedEvent,
+    FileDeletedEvent,
+    FileModifiedEvent,
+    FileSystemEvent,
+    FileSystemEventHandler,
+)
 from watchdog.observers import Observer
 
 PathLike = Union[str, Path]
@@ -17,6 +52,8 @@ FlowInputType = Dict[str, Dict[str, Union[str, bool, int, float]]]
 
 _T = TypeVar("_T")
 
+logger = logging.getLogger(__name__)
+
 
 class BaseModel(_BaseModel):
     """Base model to provide an easier interface to read/write YAML files."""
@@ -77,15 +114,798 @@ class GlobusEndpoint(BaseModel):
         return (self.abs_path / subdir / Path(path).name).as_posix()
 
 
+def scan_directory(
+    directory: PathLike, pattern: str = "*"
+) -> Iterator[Tuple[str, os.stat_result]]:
+    """Recursively yield the files in `directory` matching `pattern`.
+
+    The walk uses `os.scandir` so that directory entries are typed without
+    an extra system call, and only files matching `pattern` are stat'ed
+    (once, through the cached `DirEntry.stat`).
+
+    Parameters
+    ----------
+    directory : PathLike
+        The directory to scan.
+    pattern : str, optional
+        Glob pattern matched against file names, by default "*"
+
+    Yields
+    ------
+    Tuple[str, os.stat_result]
+        The path of each matching file and its stat result.
+    """
+    stack = [os.fspath(directory)]
+    while stack:
+        try:
+            with os.scandir(stack.pop()) as it:
+                for entry in it:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            stack.append(entry.path)
+                        elif fnmatch(entry.name, pattern):
+                            yield entry.path, entry.stat()
+                    except OSError:
+                        # The entry was removed while scanning
+                        continue
+        except OSError:
+            continue
+
+
+def file_fingerprint(
+    path: PathLike,
+    full: bool = False,
+    samples: int = 16,
+    chunk_size: int = 64 * 1024,
+) -> str:
+    """Return a fingerprint identifying the contents of a file.
+
+    By default, the fingerprint combines the file size with a hash of
+    `samples` evenly spaced chunks (including the first and last bytes),
+    read through a memory map so that multi-GB files cost only a few
+    small reads. Set `full` to hash the entire file instead.
+
+    Parameters
+    ----------
+    path : PathLike
+        The path to the file.
+    full : bool, optional
+        Hash the entire file rather than sampled chunks, by default False
+    samples : int, optional
+        Number of chunks to sample, by default 16
+    chunk_size : int, optional
+        Size of each sampled chunk in bytes, by default 64 KiB
+
+    Returns
+    -------
+    str
+        The fingerprint (e.g., "sampled:1048576:9f86d081884c7d65...").
+
+    Raises
+    ------
+    ValueError
+        If fewer than 2 chunks are sampled (the first and last chunks).
+    """
+    if samples < 2:
+        raise ValueError(f"At least 2 chunks must be sampled, got {samples}")
+
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        if full or size <= samples * chunk_size:
+            # Stream the whole file through a reused buffer
+            buffer = bytearray(4 * 1024 * 1024)
+            view = memoryview(buffer)
+            while True:
+                n = f.readinto(buffer)
+                if not n:
+                    break
+                digest.update(view[:n])
+        else:
+            # The last chunk ends exactly at the end of the file
+            span = size - chunk_size
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+                with memoryview(m) as view:
+                    for i in range(samples):
+                        start = i * span // (samples - 1)
+                        digest.update(view[start : start + chunk_size])
+
+    kind = "full" if full else "sampled"
+    return f"{kind}:{size}:{digest.hexdigest()}"
+
+
+class FileLifecycle:
+    """Record timestamped lifecycle events of each file, from detection to publication.
+
+    Recording only appends to an in-memory queue (and does nothing until
+    `configure` is called), so it adds negligible overhead to the watcher.
+    A background thread writes the events to a JSON lines log and keeps a
+    counter of the files reaching each stage, along with a histogram of
+    the seconds elapsed since the file was detected. The metrics are
+    exported in the OpenMetrics text format to a file and/or served over
+    HTTP (e.g., to be scraped by Prometheus).
+    """
+
+    STAGES = (
+        "detected",
+        "stable",
+        "queued",
+        "submitted",
+        "transfer_done",
+        "compute_done",
+        "published",
+    )
+    # Terminal stages of files that are not published
+    FAILED = "failed"
+    SKIPPED = "skipped"
+    # The file stopped being tracked before it was complete (e.g., it was
+    # deleted, or stayed empty)
+    EXPIRED = "expired"
+
+    BUCKETS = (1, 5, 10, 30, 60, 120, 300, 600, 1800, 3600, 7200, 14400, 28800)
+    # Detection times kept for the latency of files that never reach a
+    # terminal stage (e.g., held back when the watcher stops)
+    MAX_TRACKED = 100_000
+
+    def __init__(self) -> None:
+        self.enabled = False
+        self.event_log: Optional[Path] = None
+        self.metrics_file: Optional[Path] = None
+        self.export_interval = 10.0
+
+        self._events: Deque[Tuple[str, Sequence[str], float, Dict[str, Any]]] = deque()
+        self._detected: Dict[str, float] = {}
+        self._lock = Lock()
+        self._counts: Dict[str, int] = {}
+        self._buckets: Dict[str, List[int]] = {}
+        self._totals: Dict[str, int] = {}
+        self._sums: Dict[str, float] = {}
+
+        self._done = Event()
+        self._thread: Optional[Thread] = None
+        self._server: Optional[ThreadingHTTPServer] = None
+
+    def configure(
+        self,
+        event_log: Optional[PathLike] = None,
+        metrics_file: Optional[PathLike] = None,
+        http_port: Optional[int] = None,
+        export_interval: float = 10.0,
+    ) -> None:
+        """Start recording lifecycle events.
+
+        Parameters
+        ----------
+        event_log : Optional[PathLike], optional
+            JSON lines file to append the events to, by default None
+        metrics_file : Optional[PathLike], optional
+            File to (atomically) rewrite with the OpenMetrics text every
+            `export_interval` seconds, by default None
+        http_port : Optional[int], optional
+            Serve the OpenMetrics text at http://localhost:<port>/metrics,
+            by default None
+        export_interval : float, optional
+            Number of seconds between writes of the event log and metrics
+            file, by default 10.0
+        """
+        self.event_log = Path(event_log) if event_log else None
+        self.metrics_file = Path(metrics_file) if metrics_file else None
+        self.export_interval = export_interval
+        self.enabled = True
+
+        if http_port is not None:
+            self._server = ThreadingHTTPServer(
+                ("", http_port), _metrics_request_handler(self)
+            )
+            Thread(
+                target=self._server.serve_forever, name="metrics-http", daemon=True
+            ).start()
+
+        self._done.clear()
+        self._thread = Thread(target=self._run, name="file-lifecycle", daemon=True)
+        self._thread.start()
+
+    def record(
+        self,
+        stage: str,
+        paths: Union[str, Sequence[str]],
+        timestamp: Optional[float] = None,
+        **fields: Any,
+    ) -> None:
+        """Record that the files at `paths` reached `stage`.
+
+        Parameters
+        ----------
+        stage : str
+            The lifecycle stage (see `STAGES`, `FAILED`, `SKIPPED` and `EXPIRED`).
+        paths : Union[str, Sequence[str]]
+            The file (or files, e.g., of a batched flow run).
+        timestamp : Optional[float], optional
+            UNIX time of the event, by default now
+        fields : Any
+            Additional fields of the event log entry (e.g., the run ID).
+        """
+        if not self.enabled:
+            return
+        if isinstance(paths, str):
+            paths = [paths]
+        self._events.append(
+            (stage, paths, time.time() if timestamp is None else timestamp, fields)
+        )
+
+    def close(self) -> None:
+        """Stop recording, flushing the pending events and metrics."""
+        if self._thread is not None:
+            self._done.set()
+            self._thread.join()
+            self._thread = None
+        if self._server is not None:
+            self._server.shutdown()
+            self._server = None
+        self._detected.clear()
+        self.enabled = False
+
+    def openmetrics(self) -> str:
+        """Return the metrics in the OpenMetrics text format."""
+        lines = [
+            "# TYPE picoprobe_files counter",
+            "# HELP picoprobe_files Number of files that reached each lifecycle stage.",
+        ]
+        with self._lock:
+            for stage, count in self._counts.items():
+                lines.append(f'picoprobe_files_total{{stage="{stage}"}} {count}')
+
+            lines.append("# TYPE picoprobe_file_latency_seconds histogram")
+            lines.append(
+                "# HELP picoprobe_file_latency_seconds Seconds from the detection of "
+                "a file until it reached each lifecycle stage."
+            )
+            for stage, buckets in self._buckets.items():
+                for bound, count in zip(self.BUCKETS, buckets):
+                    lines.append(
+                        f"picoprobe_file_latency_seconds_bucket"
+                        f'{{stage="{stage}",le="{float(bound)}"}} {count}'
+                    )
+                total = self._totals[stage]
+                lines.append(
+                    f"picoprobe_file_latency_seconds_bucket"
+                    f'{{stage="{stage}",le="+Inf"}} {total}'
+                )
+                lines.append(
+                    f'picoprobe_file_latency_seconds_count{{stage="{stage}"}} {total}'
+                )
+                lines.append(
+                    f'picoprobe_file_latency_seconds_sum{{stage="{stage}"}} '
+                    f"{self._sums[stage]}"
+                )
+        lines.append("# EOF")
+        return "\n".join(lines) + "\n"
+
+    def _run(self) -> None:
+        while not self._done.wait(self.export_interval):
+            self._flush()
+        self._flush()
+
+    def _flush(self) -> None:
+        entries = []
+        while self._events:
+            stage, paths, timestamp, fields = self._events.popleft()
+            for path in paths:
+                entries.append(self._update(stage, path, timestamp, fields))
+
+        if self.event_log is not None and entries:
+            with open(self.event_log, "a") as f:
+                f.writelines(json.dumps(entry, default=str) + "\n" for entry in entries)
+
+        if self.metrics_file is not None:
+            # Write a temporary file first, so a scraper never reads a partial file
+            tmp_file = self.metrics_file.with_name(self.metrics_file.name + ".tmp")
+            tmp_file.write_text(self.openmetrics())
+            os.replace(tmp_file, self.metrics_file)
+
+    def _update(
+        self, stage: str, path: str, timestamp: float, fields: Dict[str, Any]
+    ) -> Dict[str, Any]:
+        if stage == "detected":
+            self._detected.setdefault(path, timestamp)
+            if len(self._detected) > self.MAX_TRACKED:
+                # Forget the oldest file
+                del self._detected[next(iter(self._detected))]
+        detected = self._detected.get(path)
+        if stage in (self.STAGES[-1], self.FAILED, self.SKIPPED, self.EXPIRED):
+            self._detected.pop(path, None)
+
+        entry = {"time": timestamp, "stage": stage, "path": path, **fields}
+        with self._lock:
+            self._counts[stage] = self._counts.get(stage, 0) + 1
+            if detected is not None and stage != "detected":
+                latency = max(timestamp - detected, 0.0)
+                entry["latency"] = latency
+                # Histogram buckets count the observations up to each bound
+                buckets = self._buckets.setdefault(stage, [0] * len(self.BUCKETS))
+                for i, bound in enumerate(self.BUCKETS):
+                    if latency <= bound:
+                        buckets[i] += 1
+                self._totals[stage] = self._totals.get(stage, 0) + 1
+                self._sums[stage] = self._sums.get(stage, 0.0) + latency
+        return entry
+
+
+def _metrics_request_handler(
+    lifecycle: FileLifecycle,
+) -> Type[BaseHTTPRequestHandler]:
+    class MetricsRequestHandler(BaseHTTPRequestHandler):
+        def do_GET(self) -> None:
+            if self.path.rstrip("/") not in ("", "/metrics"):
+                self.send_error(404)
+                return
+            body = lifecycle.openmetrics().encode()
+            self.send_response(200)
+            self.send_header(
+                "Content-Type",
+                "application/openmetrics-text; version=1.0.0; charset=utf-8",
+            )
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format: str, *args: Any) -> None:
+            # Scrapes are too frequent to log
+            pass
+
+    return MetricsRequestHandler
+
+
+# Records the lifecycle of the watched files, once configured
+lifecycle = FileLifecycle()
+
+
+class _PendingFile:
+    """Write state of a file that has not been released yet."""
+
+    __slots__ = ("size", "mtime_ns", "since", "closed")
+
+    def __init__(self) -> None:
+        self.size = -1
+        self.mtime_ns = -1
+        self.since = 0.0
+        self.closed = False
+
+
+class FileStabilizer:
+    """Track files that are still being written and release them once complete.
+
+    A file is considered complete once its size and modification time have
+    not changed for `settle_time` seconds. On platforms that report
+    close-write events (e.g., inotify on Linux), a closed file is released
+    as soon as a single poll confirms that it is unchanged. Files that stay
+    empty are never released, and stop being tracked after `empty_timeout`
+    seconds (a later write tracks them again).
+    """
+
+    def __init__(self, settle_time: float = 5.0, empty_timeout: float = 300.0) -> None:
+        """Initialize the stabilizer.
+
+        Parameters
+        ----------
+        settle_time : float, optional
+            Number of seconds the size and modification time of a file
+            must remain unchanged before it is released, by default 5.0
+        empty_timeout : float, optional
+            Number of seconds an empty file is tracked while waiting for
+            its writer to start, by default 300.0
+        """
+        self.settle_time = settle_time
+        self.empty_timeout = empty_timeout
+
+        # Map from path to write state, guarded by a lock since events
+        # arrive on the observer thread while polling happens elsewhere
+        self._pending: Dict[str, _PendingFile] = {}
+        self._lock = Lock()
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    def track(self, path: str) -> bool:
+        """Start (or continue) tracking a file that is being written.
+
+        Returns
+        -------
+        bool
+            True if the file was not tracked yet.
+        """
+        with self._lock:
+            state = self._pending.get(path)
+            if state is None:
+                self._pending[path] = _PendingFile()
+                return True
+            # The file was written to again after being closed
+            state.closed = False
+            return False
+
+    def close(self, path: str) -> None:
+        """Record that the writer closed the file."""
+        with self._lock:
+            self._pending.setdefault(path, _PendingFile()).closed = True
+
+    def discard(self, path: str) -> None:
+        """Stop tracking a file (e.g., it was deleted or moved)."""
+        with self._lock:
+            state = self._pending.pop(path, None)
+        if state is not None:
+            lifecycle.record(FileLifecycle.EXPIRED, path)
+
+    def poll(self) -> List[str]:
+        """Check the tracked files and return those that are complete.
+
+        Returns
+        -------
+        List[str]
+            The paths of files that finished writing, in the order they
+            were first seen. Released files are no longer tracked.
+        """
+        now = time.monotonic()
+        with self._lock:
+            pending = list(self._pending.items())
+
+        ready, expired = [], []
+        for path, state in pending:
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                self.discard(path)
+                continue
+            except OSError:
+                # The file may be temporarily inaccessible (e.g., locked)
+                continue
+
+            # Any change restarts the settle timer
+            if stat.st_size != state.size or stat.st_mtime_ns != state.mtime_ns:
+                state.size = stat.st_size
+                state.mtime_ns = stat.st_mtime_ns
+                state.since = now
+                continue
+
+            # Empty files have not started writing yet (or never will)
+            if state.size == 0:
+                if now - state.since >= self.empty_timeout:
+                    expired.append(path)
+                continue
+
+            if state.closed or now - state.since >= self.settle_time:
+                ready.append(path)
+
+        with self._lock:
+            for path in ready + expired:
+                self._pending.pop(path, None)
+        for path in expired:
+            logger.warning(
+                f"Stopped tracking {path}: still empty after {self.empty_timeout}s"
+            )
+        if expired:
+            lifecycle.record(FileLifecycle.EXPIRED, expired)
+
+        return ready
+
+
+class StableFileEventHandler(FileSystemEventHandler, ABC):
+    """Event handler that reports files only after they are completely written.
+
+    File system events are used to track candidate files matching `pattern`,
+    and `poll` (called periodically by the `Watcher`) calls `on_file_ready`
+    for each file that has finished writing.
+    """
+
+    def __init__(
+        self, pattern: str = "*", settle_time: float = 5.0, backfill_rate: int = 16
+    ) -> None:
+        """Initialize the event handler.
+
+        Parameters
+        ----------
+        pattern : str, optional
+            Glob pattern matched against file names, by default "*"
+        settle_time : float, optional
+            Number of seconds a file must remain unchanged before it is
+            considered complete, by default 5.0
+        backfill_rate : int, optional
+            Maximum number of files found by `reconcile` to release on
+            each `poll`, by default 16
+        """
+        super().__init__()
+        self.pattern = pattern
+        self.stabilizer = FileStabilizer(settle_time)
+        self.backfill_rate = backfill_rate
+
+        # Complete files found by reconcile() which are waiting to be released
+        self._backlog: Deque[str] = deque()
+
+    def matches(self, path: str) -> bool:
+        """Returns True if the file name matches the handler `pattern`."""
+        return fnmatch(Path(path).name, self.pattern)
+
+    def on_any_event(self, event: FileSystemEvent) -> None:
+        if event.is_directory:
+            return
+
+        if event.event_type == "moved":
+            self.stabilizer.discard(event.src_path)
+            if self.matches(event.dest_path):
+                if self.stabilizer.track(event.dest_path):
+                    lifecycle.record("detected", event.dest_path)
+            return
+
+        if not self.matches(event.src_path):
+            return
+
+        if event.event_type in ("created", "modified"):
+            if self.stabilizer.track(event.src_path):
+                lifecycle.record("detected", event.src_path)
+        elif event.event_type == "closed":
+            self.stabilizer.close(event.src_path)
+        elif event.event_type == "deleted":
+            self.stabilizer.discard(event.src_path)
+
+    def poll(self) -> None:
+        """Release the files that have finished writing."""
+        for path in self.stabilizer.poll():
+            self._release(path)
+
+        # Backfill files missed while the watcher was down a few at a time
+        for _ in range(min(self.backfill_rate, len(self._backlog))):
+            self._release(self._backlog.popleft())
+
+    def _release(self, path: str) -> None:
+        lifecycle.record("stable", path)
+        try:
+            self.on_file_ready(path)
+        except Exception:
+            # The released files are no longer tracked, so a failing file
+            # must not lose the others (or stop the watcher)
+            logger.exception(f"Failed to process ready file: {path}")
+            lifecycle.record(FileLifecycle.FAILED, path)
+
+    def reconcile(self, directory: PathLike) -> int:
+        """Find files in `directory` that were never processed.
+
+        Files that have not been written to for `settle_time` seconds are
+        released by subsequent calls to `poll` (oldest first), while any
+        recently modified files go through the usual write-completion check.
+
+        Parameters
+        ----------
+        directory : PathLike
+            The directory to scan.
+
+        Returns
+        -------
+        int
+            The number of unprocessed files found.
+        """
+        now = time.time()
+        complete, found = [], 0
+        for path, stat in scan_directory(directory, self.pattern):
+            if self.is_known(path, stat):
+                continue
+            found += 1
+            lifecycle.record("detected", path)
+            if stat.st_size and now - stat.st_mtime >= self.stabilizer.settle_time:
+                complete.append((stat.st_mtime_ns, path))
+            else:
+                self.stabilizer.track(path)
+
+        complete.sort()
+        self._backlog.extend(path for _, path in complete)
+        return found
+
+    def is_known(self, src_path: str, stat: os.stat_result) -> bool:
+        """Returns True if the file was already processed. Child class may override."""
+        return False
+
+    def shutdown(self) -> None:
+        """Called once the watcher stops. Child class may override."""
+
+    @abstractmethod
+    def on_file_ready(self, src_path: str) -> None:
+        """Child class should implement."""
+
+
+class IncrementalPollingObserver(Thread):
+    """Polling observer for file systems without reliable native events.
+
+    Network shares (e.g., SMB) often drop or delay native file system
+    events. Rather than re-stat'ing the whole tree on every poll, this
+    observer keeps a snapshot of each directory and only rescans the
+    directories whose modification time changed (i.e., files were added,
+    removed or renamed). The poll interval shrinks to `min_interval`
+    while changes are detected and doubles up to `max_interval` when idle.
+
+    Directory modification times do not change while a file grows, so
+    only created, deleted and (for rescanned directories) modified events
+    are reported. Growing files are followed by the `FileStabilizer`.
+    """
+
+    def __init__(
+        self,
+        min_interval: float = 1.0,
+        max_interval: float = 30.0,
+        full_scan_interval: float = 600.0,
+        mtime_resolution: float = 2.0,
+    ) -> None:
+        """Initialize the observer.
+
+        Parameters
+        ----------
+        min_interval : float, optional
+            Poll interval (seconds) while changes are detected, by default 1.0
+        max_interval : float, optional
+            Largest poll interval (seconds) when idle, by default 30.0
+        full_scan_interval : float, optional
+            Seconds between rescans of every directory, as a safety net for
+            file systems with unreliable directory times, by default 600.0
+        mtime_resolution : float, optional
+            Directories modified within this many seconds are rescanned
+            again on the next poll, since changes made within the same
+            timestamp tick are otherwise invisible, by default 2.0
+        """
+        super().__init__(name="polling-observer", daemon=True)
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.full_scan_interval = full_scan_interval
+        self.mtime_resolution = mtime_resolution
+
+        self._handler = FileSystemEventHandler()
+        self._root = ""
+        self._stopped = Event()
+
+        # Directory path -> (mtime_ns, {file name: (size, mtime_ns)}, {subdir names})
+        self._dirs: Dict[str, Tuple[int, Dict[str, Tuple[int, int]], Set[str]]] = {}
+
+    def schedule(
+        self,
+        event_handler: FileSystemEventHandler,
+        path: PathLike,
+        recursive: bool = True,
+    ) -> None:
+        """Watch `path` (always recursively) and send events to `event_handler`."""
+        self._handler = event_handler
+        self._root = os.fspath(path)
+
+    def stop(self) -> None:
+        self._stopped.set()
+
+    def run(self) -> None:
+        # The initial snapshot does not report existing files as created
+        self._scan_tree(self._root, emit=False)
+        last_full_scan = time.monotonic()
+        interval = self.min_interval
+
+        while not self._stopped.wait(interval):
+            full_scan = time.monotonic() - last_full_scan >= self.full_scan_interval
+            if full_scan:
+                last_full_scan = time.monotonic()
+
+            try:
+                changed = self._poll(full_scan)
+            except Exception:
+                logger.exception("Polling observer failed to scan directories")
+                changed = False
+
+            # Poll quickly during bursts of activity and back off when idle
+            interval = (
+                self.min_interval if changed else min(2 * interval, self.max_interval)
+            )
+
+    def _poll(self, full_scan: bool) -> bool:
+        changed = False
+        now_ns = int(time.time() * 1e9)
+        resolution_ns = int(self.mtime_resolution * 1e9)
+        for path in list(self._dirs):
+            if path not in self._dirs:
+                continue  # Removed along with its parent
+            try:
+                mtime_ns = os.stat(path).st_mtime_ns
+            except OSError:
+                changed |= self._remove_tree(path)
+                continue
+            snapshot_mtime_ns = self._dirs[path][0]
+            recent = now_ns - snapshot_mtime_ns < resolution_ns
+            if full_scan or recent or mtime_ns != snapshot_mtime_ns:
+                changed |= self._scan_dir(path, mtime_ns, emit=True)
+        return changed
+
+    def _scan_tree(self, root: str, emit: bool) -> None:
+        stack = [root]
+        while stack:
+            path = stack.pop()
+            try:
+                mtime_ns = os.stat(path).st_mtime_ns
+            except OSError:
+                continue
+            self._scan_dir(path, mtime_ns, emit)
+            stack.extend(os.path.join(path, name) for name in self._dirs[path][2])
+
+    def _scan_dir(self, path: str, mtime_ns: int, emit: bool) -> bool:
+        """Rescan a single directory and report the differences."""
+        files: Dict[str, Tuple[int, int]] = {}
+        subdirs: Set[str] = set()
+        try:
+            with os.scandir(path) as it:
+                for entry in it:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            subdirs.add(entry.name)
+                        else:
+                            stat = entry.stat()
+                            files[entry.name] = (stat.st_size, stat.st_mtime_ns)
+                    except OSError:
+                        continue
+        except OSError:
+            return self._remove_tree(path)
+
+        _, old_files, old_subdirs = self._dirs.get(path, (0, {}, set()))
+        self._dirs[path] = (mtime_ns, files, subdirs)
+        if not emit:
+            return False
+
+        changed = False
+        for name, state in files.items():
+            old_state = old_files.get(name)
+            if old_state is None:
+                self._emit(FileCreatedEvent(os.path.join(path, name)))
+            elif old_state != state:
+                self._emit(FileModifiedEvent(os.path.join(path, name)))
+            else:
+                continue
+            changed = True
+        for name in old_files.keys() - files.keys():
+            self._emit(FileDeletedEvent(os.path.join(path, name)))
+            changed = True
+        for name in subdirs - old_subdirs:
+            subdir = os.path.join(path, name)
+            self._emit(DirCreatedEvent(subdir))
+            # New directories may already contain files
+            self._scan_dir(subdir, 0, emit=True)
+            changed = True
+        for name in old_subdirs - subdirs:
+            changed |= self._remove_tree(os.path.join(path, name))
+        return changed
+
+    def _remove_tree(self, path: str) -> bool:
+        """Forget a deleted directory (and its subdirectories)."""
+        snapshot = self._dirs.pop(path, None)
+        if snapshot is None:
+            return False
+        _, files, subdirs = snapshot
+        for name in files:
+            self._emit(FileDeletedEvent(os.path.join(path, name)))
+        for name in subdirs:
+            self._remove_tree(os.path.join(path, name))
+        self._emit(DirDeletedEvent(path))
+        return True
+
+    def _emit(self, event: FileSystemEvent) -> None:
+        try:
+            self._handler.dispatch(event)
+        except Exception:
+            logger.exception(f"Event handler failed on {event}")
+
+
 class Watcher:
     def __init__(
         self,
         directory: PathLike,
         handler: FileSystemEventHandler = FileSystemEventHandler(),
+        poll_interval: float = 1.0,
+        reconcile: bool = False,
+        polling: bool = False,
     ) -> None:
-        self.observer = Observer()
+        # Network shares may not deliver native events, so poll them instead
+        self.observer = IncrementalPollingObserver() if polling else Observer()
         self.handler = handler
         self.directory = directory
+        self.poll_interval = poll_interval
+        self.reconcile = reconcile
 
         # Provide a method to stop the watcher (w.done.set())
         self.done = Event()
@@ -95,78 +915,1292 @@ class Watcher:
         self.observer.start()  # type: ignore
         print(f"\nWatcher Running in {self.directory}/\n")
         try:
-            while not self.done.is_set():
-                time.sleep(1)
+            # Pick up files created while the watcher was not running (the
+            # observer is started first so that no new files are missed)
+            if self.reconcile and isinstance(self.handler, StableFileEventHandler):
+                found = self.handler.reconcile(self.directory)
+                print(f"Found {found} unprocessed files in {self.directory}/\n")
+
+            while not self.done.wait(self.poll_interval):
+                # Release files which have finished writing
+                if isinstance(self.handler, StableFileEventHandler):
+                    self.handler.poll()
         except Exception as e:
             print(f"Watcher caught exception: {e}")
         finally:
             self.observer.stop()  # type: ignore
 
         self.observer.join()
+
+        # Finish any work the handler has queued up
+        if isinstance(self.handler, StableFileEventHandler):
+            self.handler.shutdown()
+        # Write out the last lifecycle events and metrics
+        lifecycle.close()
         print("\nWatcher Terminated\n")
 
 
 class CheckPoint:
+    # Run states of checkpoint events
+    QUEUED = "queued"
+    SUBMITTED = "submitted"
+    RUNNING = "running"
+    SUCCEEDED = "succeeded"
+    FAILED = "failed"
+
     def __init__(self, checkpoint_file: PathLike) -> None:
         self.checkpoint_file = Path(checkpoint_file)
 
-        # Initialize a seen events set to not repeat past flows
+        # Initialize a seen events set to not repeat past flows, and the
+        # set of their file paths (events may be content fingerprints)
         self.seen_events: Set[str] = set()
+        self.seen_paths: Set[str] = set()
         if self.checkpoint_file.exists():
             self.load_checkpoint()
 
     def load_checkpoint(self) -> None:
-        self.seen_events = set(self.checkpoint_file.read_text().split("\n"))
+        # Each line is an event, followed by its path if it is not the path
+        for line in self.checkpoint_file.read_text().split("\n"):
+            if line:
+                event, _, path = line.partition("\t")
+                self.seen_events.add(event)
+                self.seen_paths.add(path or event)
 
-    def save_checkpoint(self, event: str) -> None:
+    def save_checkpoint(self, event: str, path: Optional[str] = None) -> None:
         self.seen_events.add(event)
+        self.seen_paths.add(path or event)
+        line = event if path is None or path == event else f"{event}\t{path}"
         with open(self.checkpoint_file, "a+") as f:
-            f.write(f"{event}\n")
+            f.write(f"{line}\n")
 
-    def seen(self, event: str) -> bool:
-        """Returns True if the `event` has been seen, otherwise returns False."""
+    def __contains__(self, event: str) -> bool:
+        return event in self.seen_events
+
+    def seen(self, event: str, path: Optional[str] = None) -> bool:
+        """Returns True if the `event` has been seen, otherwise returns False.
+
+        Parameters
+        ----------
+        event : str
+            The event key (e.g., the file path or its content fingerprint).
+        path : Optional[str], optional
+            The file the event refers to, if the event is not the path
+            itself, by default None
+        """
         if event in self.seen_events:
             return True
-        self.save_checkpoint(event)
+        self.save_checkpoint(event, path)
         return False
 
+    def known_file(self, path: str, stat: os.stat_result) -> bool:
+        """Returns True if the file at `path` (with `stat`) has already been seen."""
+        return path in self.seen_paths
 
-class BaseFlowHandler(FileSystemEventHandler, ABC):
-    def __init__(self, flow_client: GladierBaseClient, checkpoint: CheckPoint) -> None:
-        super().__init__()
+    def set_state(
+        self, events: Iterable[str], state: str, run_id: Optional[str] = None
+    ) -> None:
+        """Record the run state of `events` (the text checkpoint only records seen events)."""
+
+
+class SQLiteCheckPoint(CheckPoint):
+    """Checkpoint stored in an indexed SQLite database.
+
+    Each event (e.g., a file path or content fingerprint) is recorded with
+    its run state, the flow run ID, timestamps and the path, size and
+    modification time of the file. Lookups go through the primary key index,
+    so the checkpoint is never loaded into memory. Events whose flow
+    failed, or which were queued by a previous process that stopped
+    before submitting them, are not considered seen and will be retried.
+
+    When the database is created next to a text checkpoint of the same
+    name (e.g., "gladier-checkpoint.txt" for "gladier-checkpoint.db"), the
+    events of the text checkpoint are imported, so that upgrading does not
+    process the files again.
+    """
+
+    def __init__(self, checkpoint_file: PathLike) -> None:
+        self.checkpoint_file = Path(checkpoint_file)
+        created = not self.checkpoint_file.exists()
+
+        # Entries queued before this time were left behind by a previous process
+        self._session_start = time.time()
+
+        # A single connection is shared by the watcher and submit threads
+        self._lock = Lock()
+        self._conn = sqlite3.connect(self.checkpoint_file, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS checkpoint (
+                event TEXT PRIMARY KEY,
+                state TEXT NOT NULL,
+                run_id TEXT,
+                created REAL NOT NULL,
+                updated REAL NOT NULL
+            ) WITHOUT ROWID;
+            """
+        )
+
+        # Add the file columns to checkpoints created by older versions
+        columns = {
+            row[1] for row in self._conn.execute("PRAGMA table_info(checkpoint)")
+        }
+        for column in ("path TEXT", "size INTEGER", "mtime_ns INTEGER"):
+            if column.split()[0] not in columns:
+                self._conn.execute(f"ALTER TABLE checkpoint ADD COLUMN {column}")
+
+        self._conn.executescript(
+            """
+            CREATE INDEX IF NOT EXISTS checkpoint_state ON checkpoint (state);
+            CREATE INDEX IF NOT EXISTS checkpoint_run_id ON checkpoint (run_id);
+            CREATE INDEX IF NOT EXISTS checkpoint_path ON checkpoint (path);
+            """
+        )
+
+        text_file = self.checkpoint_file.with_suffix(".txt")
+        if created and text_file.exists():
+            self.import_text(text_file)
+            logger.info(
+                f"Imported the text checkpoint {text_file} into {checkpoint_file}"
+            )
+
+    def load_checkpoint(self) -> None:
+        """Entries are looked up on demand, so there is nothing to load."""
+
+    def save_checkpoint(self, event: str, path: Optional[str] = None) -> None:
+        # Record the file size and modification time for known_file()
+        path = path or event
+        try:
+            stat = os.stat(path)
+            size, mtime_ns = stat.st_size, stat.st_mtime_ns
+        except OSError:
+            size, mtime_ns = None, None
+
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO checkpoint "
+                "(event, state, run_id, created, updated, path, size, mtime_ns) "
+                "VALUES (?, ?, NULL, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (event) DO UPDATE SET "
+                "state = excluded.state, run_id = NULL, updated = excluded.updated, "
+                "path = excluded.path, size = excluded.size, "
+                "mtime_ns = excluded.mtime_ns",
+                (event, self.QUEUED, now, now, path, size, mtime_ns),
+            )
+
+    def _retry(self, state: str, updated: float) -> bool:
+        return state == self.FAILED or (
+            state == self.QUEUED and updated < self._session_start
+        )
+
+    def __contains__(self, event: str) -> bool:
+        record = self.get(event)
+        return record is not None and not self._retry(
+            record["state"], record["updated"]
+        )
+
+    def seen(self, event: str, path: Optional[str] = None) -> bool:
+        """Returns True if the `event` has been seen, otherwise returns False."""
+        if event in self:
+            return True
+        self.save_checkpoint(event, path)
+        return False
+
+    def known_file(self, path: str, stat: os.stat_result) -> bool:
+        """Returns True if the file at `path` (with `stat`) has already been seen.
+
+        The file size and modification time must match the recorded ones,
+        so a new file that reuses the name of an old one is not known.
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT state, updated FROM checkpoint "
+                "WHERE path = ? AND size = ? AND mtime_ns = ?",
+                (path, stat.st_size, stat.st_mtime_ns),
+            ).fetchall()
+        return any(not self._retry(state, updated) for state, updated in rows)
+
+    def get(self, event: str) -> Optional[Dict[str, Any]]:
+        """Return the checkpoint entry for `event`, or None if it was never seen."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT state, run_id, created, updated FROM checkpoint WHERE event = ?",
+                (event,),
+            ).fetchone()
+        if row is None:
+            return None
+        return dict(zip(("state", "run_id", "created", "updated"), row))
+
+    def set_state(
+        self, events: Iterable[str], state: str, run_id: Optional[str] = None
+    ) -> None:
+        """Record the run state of `events`.
+
+        Parameters
+        ----------
+        events : Iterable[str]
+            The events to update.
+        state : str
+            The new state (e.g., `CheckPoint.SUBMITTED`).
+        run_id : Optional[str], optional
+            The flow run ID, by default None (keeps the current run ID)
+        """
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "UPDATE checkpoint SET state = ?, run_id = COALESCE(?, run_id), "
+                "updated = ? WHERE event = ?",
+                [(state, run_id, now, event) for event in events],
+            )
+
+    def count(self, state: Optional[str] = None) -> int:
+        """Return the number of entries, optionally only those in `state`."""
+        with self._lock:
+            if state is None:
+                row = self._conn.execute("SELECT COUNT(*) FROM checkpoint").fetchone()
+            else:
+                row = self._conn.execute(
+                    "SELECT COUNT(*) FROM checkpoint WHERE state = ?", (state,)
+                ).fetchone()
+        return int(row[0])
+
+    def import_text(self, checkpoint_file: PathLike) -> None:
+        """Import the events of a text `CheckPoint` file as submitted.
+
+        The size and modification time of the files that still exist are
+        recorded, so that `known_file` recognizes them.
+        """
+        now = time.time()
+        events = []
+        with open(checkpoint_file) as f:
+            for line in f:
+                event, _, path = line.strip().partition("\t")
+                if not event:
+                    continue
+                path = path or event
+                try:
+                    stat = os.stat(path)
+                    size, mtime_ns = stat.st_size, stat.st_mtime_ns
+                except (OSError, ValueError):
+                    size, mtime_ns = None, None
+                events.append((event, now, now, path, size, mtime_ns))
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO checkpoint "
+                "(event, state, created, updated, path, size, mtime_ns) "
+                f"VALUES (?, '{self.SUBMITTED}', ?, ?, ?, ?, ?)",
+                events,
+            )
+
+    def compact(self, prune_before: Optional[float] = None) -> None:
+        """Shrink the database file.
+
+        Parameters
+        ----------
+        prune_before : Optional[float], optional
+            If set, also delete succeeded entries last updated before this
+            UNIX timestamp whose files no longer exist (so they cannot be
+            picked up again), by default None
+        """
+        with self._lock:
+            if prune_before is not None:
+                rows = self._conn.execute(
+                    "SELECT event, COALESCE(path, event) FROM checkpoint "
+                    "WHERE state = ? AND updated < ?",
+                    (self.SUCCEEDED, prune_before),
+                ).fetchall()
+                with self._conn:
+                    self._conn.executemany(
+                        "DELETE FROM checkpoint WHERE event = ?",
+                        [(event,) for event, path in rows if not os.path.exists(path)],
+                    )
+            self._conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            self._conn.execute("VACUUM")
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+class TokenBucket:
+    """Thread-safe token bucket rate limiter with adaptive rate.
+
+    Tokens refill at `rate` per second up to `capacity`. When the remote
+    service reports throttling, `decrease` halves the rate (down to
+    `min_rate`), and each success via `increase` recovers it additively
+    back up to the configured maximum.
+    """
+
+    def __init__(self, rate: float, capacity: int, min_rate: float = 0.05) -> None:
+        """Initialize the token bucket.
+
+        Parameters
+        ----------
+        rate : float
+            Maximum number of tokens added per second.
+        capacity : int
+            Maximum number of tokens (i.e., the largest burst).
+        min_rate : float, optional
+            Lower bound of the adapted rate, by default 0.05
+        """
+        self.max_rate = rate
+        self.min_rate = min(min_rate, rate)
+        self.rate = rate
+        self.capacity = capacity
+
+        self._lock = Lock()
+        self._tokens = float(capacity)
+        self._updated = time.monotonic()
+
+    def acquire(self) -> float:
+        """Take a token, blocking until one is available.
+
+        Returns
+        -------
+        float
+            The number of seconds spent waiting for the token.
+        """
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(
+                    self.capacity, self._tokens + (now - self._updated) * self.rate
+                )
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return waited
+                delay = (1 - self._tokens) / self.rate
+            time.sleep(delay)
+            waited += delay
+
+    def decrease(self) -> None:
+        """Halve the rate after the service throttled a request."""
+        with self._lock:
+            self.rate = max(self.min_rate, self.rate / 2)
+
+    def increase(self) -> None:
+        """Recover the rate after a successful request."""
+        with self._lock:
+            self.rate = min(self.max_rate, self.rate + 0.1 * self.max_rate)
+
+
+class DeadLetterLog:
+    """Persistent JSON lines log of flow runs that could not be started."""
+
+    def __init__(self, filename: PathLike) -> None:
+        self.filename = Path(filename)
+        self._lock = Lock()
+
+    def append(self, record: Dict[str, Any]) -> None:
+        """Add a record to the log."""
+        line = json.dumps(record, default=str)
+        with self._lock, open(self.filename, "a") as f:
+            f.write(line + "\n")
+
+    def records(self) -> List[Dict[str, Any]]:
+        """Return every record in the log."""
+        if not self.filename.exists():
+            return []
+        with open(self.filename) as f:
+            return [json.loads(line) for line in f if line.strip()]
+
+
+def _parse_time(value: Optional[str]) -> Optional[float]:
+    """Convert an ISO 8601 time reported by the Globus services to a UNIX time."""
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value.replace("Z", "+00:00")).timestamp()
+    except ValueError:
+        return None
+
+
+class _TrackedRun:
+    __slots__ = (
+        "flow_client",
+        "run_label",
+        "checkpoint",
+        "events",
+        "paths",
+        "started",
+        "state",
+    )
+
+    def __init__(
+        self,
+        flow_client: GladierBaseClient,
+        run_label: str,
+        checkpoint: Optional[CheckPoint],
+        events: List[str],
+        paths: List[str],
+    ) -> None:
         self.flow_client = flow_client
+        self.run_label = run_label
         self.checkpoint = checkpoint
+        self.events = events
+        self.paths = paths
+        self.started = time.monotonic()
+        self.state = CheckPoint.SUBMITTED
+
+
+class RunTracker:
+    """Track the flow runs in flight and limit how many run at once.
+
+    A background thread polls the status of the in-flight runs, at most
+    `batch_size` runs every `poll_interval` seconds (least recently checked
+    first), and records their completion in the checkpoint. A slot must be
+    reserved before a flow is submitted; it is released when the run
+    completes or fails to start, so that at most `max_in_flight` flows are
+    waiting to be submitted or running at any time.
+    """
+
+    # Flow run statuses reported by the Globus Flows service
+    _STATES = {
+        "ACTIVE": CheckPoint.RUNNING,
+        "INACTIVE": CheckPoint.RUNNING,
+        "SUCCEEDED": CheckPoint.SUCCEEDED,
+        "FAILED": CheckPoint.FAILED,
+        "ENDED": CheckPoint.FAILED,
+    }
+
+    def __init__(
+        self,
+        max_in_flight: Optional[int] = None,
+        poll_interval: float = 30.0,
+        batch_size: int = 20,
+    ) -> None:
+        """Initialize the tracker and start the polling thread.
+
+        Parameters
+        ----------
+        max_in_flight : Optional[int], optional
+            Maximum number of flows submitted or running concurrently,
+            by default None (unlimited)
+        poll_interval : float, optional
+            Number of seconds between status checks, by default 30.0
+        batch_size : int, optional
+            Maximum number of runs whose status is checked each poll,
+            by default 20
+        """
+        self.max_in_flight = max_in_flight
+        self.poll_interval = poll_interval
+        self.batch_size = batch_size
+
+        self.succeeded = 0
+        self.failed = 0
+
+        self._lock = Lock()
+        self._reserved = 0
+        # Ordered from the least to the most recently checked run
+        self._runs: Dict[str, _TrackedRun] = {}
+
+        self._done = Event()
+        self._thread = Thread(target=self._run, name="flow-tracker", daemon=True)
+        self._thread.start()
 
-    def start_flow(self, flow_input: FlowInputType, run_label: str = "Run") -> None:
-        """Start a new Globus flow.
+    def __len__(self) -> int:
+        """The number of submitted runs which have not completed."""
+        with self._lock:
+            return len(self._runs)
+
+    @property
+    def in_flight(self) -> int:
+        """The number of flows waiting to be submitted or running."""
+        with self._lock:
+            return self._reserved
+
+    def reserve(self) -> bool:
+        """Reserve a slot for a new flow, returns False if at capacity."""
+        with self._lock:
+            if self.max_in_flight is not None and self._reserved >= self.max_in_flight:
+                return False
+            self._reserved += 1
+            return True
+
+    def release(self) -> None:
+        """Release a slot (e.g., when a flow could not be started)."""
+        with self._lock:
+            self._reserved = max(self._reserved - 1, 0)
+
+    def add(
+        self,
+        flow_client: GladierBaseClient,
+        run_id: str,
+        run_label: str = "Run",
+        checkpoint: Optional[CheckPoint] = None,
+        events: Sequence[str] = (),
+        paths: Sequence[str] = (),
+    ) -> None:
+        """Track a submitted flow run until it completes.
 
         Parameters
         ----------
+        flow_client : GladierBaseClient
+            The client which started the run.
+        run_id : str
+            The flow run ID.
+        run_label : str, optional
+            Label of the flow run, by default "Run"
+        checkpoint : Optional[CheckPoint], optional
+            Checkpoint to record the run state of `events` in, by default None
+        events : Sequence[str], optional
+            The checkpoint events processed by the flow run, by default ()
+        paths : Sequence[str], optional
+            The files processed by the flow run, by default ()
+        """
+        with self._lock:
+            self._runs[run_id] = _TrackedRun(
+                flow_client, run_label, checkpoint, list(events), list(paths)
+            )
+
+    def poll(self) -> int:
+        """Check the status of the next batch of runs.
+
+        Returns
+        -------
+        int
+            The number of runs that completed.
+        """
+        with self._lock:
+            batch = list(self._runs)[: self.batch_size]
+
+        completed = 0
+        for run_id in batch:
+            run = self._runs[run_id]
+            try:
+                run_status = run.flow_client.get_status(run_id)
+            except Exception as e:
+                logger.warning(f"Could not get the status of flow run {run_id}: {e}")
+                state = run.state
+            else:
+                status = run_status["status"]
+                state = self._STATES.get(status, CheckPoint.RUNNING)
+
+            if state != run.state and run.checkpoint is not None:
+                run.checkpoint.set_state(run.events, state)
+            run.state = state
+
+            with self._lock:
+                # Move the run to the back of the line, or stop tracking it
+                del self._runs[run_id]
+                if state in (CheckPoint.SUBMITTED, CheckPoint.RUNNING):
+                    self._runs[run_id] = run
+                    continue
+                self._reserved = max(self._reserved - 1, 0)
+                if state == CheckPoint.SUCCEEDED:
+                    self.succeeded += 1
+                else:
+                    self.failed += 1
+
+            completed += 1
+            self._record_lifecycle(run_id, run, run_status)
+            elapsed = time.monotonic() - run.started
+            logger.info(
+                f"Flow run {run_id} ({run.run_label}) {status.lower()} after "
+                f"{elapsed:.0f}s: {self.as_dict()}"
+            )
+        return completed
+
+    @staticmethod
+    def _record_lifecycle(
+        run_id: str, run: _TrackedRun, run_status: Dict[str, Any]
+    ) -> None:
+        """Record the completion time of the flow steps processing the files."""
+        if run.state != CheckPoint.SUCCEEDED:
+            lifecycle.record(FileLifecycle.FAILED, run.paths, run_id=run_id)
+            return
+
+        # The steps are recognized by the details the Transfer and Search
+        # action providers report (the analysis precedes the search ingest)
+        stages = {}
+        output = (run_status.get("details") or {}).get("output") or {}
+        for step in output.values():
+            details = step.get("details") if isinstance(step, dict) else None
+            if not isinstance(details, dict):
+                continue
+            if "bytes_transferred" in details:
+                stages["transfer_done"] = details.get("completion_time")
+            if "index_id" in details:
+                stages["compute_done"] = details.get("creation_date")
+                stages["published"] = details.get("completion_date")
+        stages.setdefault("published", run_status.get("completion_time"))
+
+        for stage in ("transfer_done", "compute_done", "published"):
+            timestamp = _parse_time(stages.get(stage))
+            if timestamp is not None or stage == "published":
+                lifecycle.record(stage, run.paths, timestamp, run_id=run_id)
+
+    def stop(self) -> None:
+        """Stop polling the status of the runs."""
+        self._done.set()
+        self._thread.join()
+
+    def as_dict(self) -> Dict[str, int]:
+        """Return a snapshot of the run counts."""
+        with self._lock:
+            return {
+                "in_flight": self._reserved,
+                "running": len(self._runs),
+                "succeeded": self.succeeded,
+                "failed": self.failed,
+            }
+
+    def _run(self) -> None:
+        while not self._done.wait(self.poll_interval):
+            try:
+                self.poll()
+            except Exception:
+                logger.exception("Failed to poll the flow runs")
+
+
+class _FlowRequest:
+    """A flow run waiting in the submission queue."""
+
+    __slots__ = (
+        "flow_client",
+        "flow_input",
+        "run_label",
+        "checkpoint",
+        "events",
+        "paths",
+        "enqueued",
+    )
+
+    def __init__(
+        self,
+        flow_client: GladierBaseClient,
+        flow_input: FlowInputType,
+        run_label: str,
+        checkpoint: Optional[CheckPoint],
+        events: List[str],
+        paths: List[str],
+    ) -> None:
+        self.flow_client = flow_client
+        self.flow_input = flow_input
+        self.run_label = run_label
+        self.checkpoint = checkpoint
+        self.events = events
+        self.paths = paths
+        self.enqueued = time.monotonic()
+
+
+class SubmitMetrics:
+    """Thread-safe counters describing the flow submission queue.
+
+    The queue depth counts every flow run that has been handed to the
+    submitter but not yet picked up by a worker, including callers that
+    are blocked waiting for space in the queue.
+    """
+
+    def __init__(self) -> None:
+        self._lock = Lock()
+        self.enqueued = 0
+        self.submitted = 0
+        self.failed = 0
+        self.retries = 0
+        self.throttled = 0
+        self.throttle_wait_time = 0.0
+        self.queue_depth = 0
+        self.max_queue_depth = 0
+        self.total_wait_time = 0.0
+
+    def record_enqueued(self) -> None:
+        with self._lock:
+            self.enqueued += 1
+            self.queue_depth += 1
+            self.max_queue_depth = max(self.max_queue_depth, self.queue_depth)
+
+    def record_dequeued(self, wait_time: float) -> None:
+        with self._lock:
+            self.queue_depth -= 1
+            self.total_wait_time += wait_time
+
+    def record_retry(self, throttled: bool) -> None:
+        with self._lock:
+            self.retries += 1
+            self.throttled += throttled
+
+    def record_rate_limit(self, wait_time: float) -> None:
+        with self._lock:
+            self.throttle_wait_time += wait_time
+
+    def record_result(self, success: bool) -> None:
+        with self._lock:
+            if success:
+                self.submitted += 1
+            else:
+                self.failed += 1
+
+    def as_dict(self) -> Dict[str, float]:
+        """Return a snapshot of the metrics."""
+        with self._lock:
+            dequeued = self.enqueued - self.queue_depth
+            return {
+                "enqueued": self.enqueued,
+                "submitted": self.submitted,
+                "failed": self.failed,
+                "retries": self.retries,
+                "throttled": self.throttled,
+                "throttle_wait_time": self.throttle_wait_time,
+                "queue_depth": self.queue_depth,
+                "max_queue_depth": self.max_queue_depth,
+                "mean_wait_time": self.total_wait_time / max(dequeued, 1),
+            }
+
+
+class FlowSubmitter:
+    """Submit flow runs from a bounded queue using a pool of worker threads.
+
+    Submitting a flow requires several round trips to the Globus services,
+    so it is kept off the observer thread. When the queue is full, `submit`
+    blocks the caller, which applies backpressure to the file watcher.
+
+    Submissions are rate limited by an adaptive token bucket. Transient
+    failures (throttling, server errors and network errors) are retried
+    with jittered exponential backoff, and runs that still fail are
+    recorded in the dead-letter log.
+
+    If a `RunTracker` is given, callers must `reserve` a slot before each
+    `submit`, and the submitted runs are tracked until they complete.
+    """
+
+    def __init__(
+        self,
+        num_workers: int = 2,
+        queue_size: int = 64,
+        rate: float = 2.0,
+        burst: int = 10,
+        max_retries: int = 5,
+        base_delay: float = 1.0,
+        max_delay: float = 60.0,
+        dead_letter_file: Optional[PathLike] = None,
+        tracker: Optional[RunTracker] = None,
+    ) -> None:
+        """Initialize the submitter and start the worker threads.
+
+        Parameters
+        ----------
+        num_workers : int, optional
+            Number of threads submitting flows concurrently, by default 2
+        queue_size : int, optional
+            Maximum number of flow runs waiting to be submitted, by default 64
+        rate : float, optional
+            Maximum number of flow runs started per second, by default 2.0
+        burst : int, optional
+            Maximum number of flow runs started in a burst, by default 10
+        max_retries : int, optional
+            Number of times a failed submission is retried, by default 5
+        base_delay : float, optional
+            Backoff delay (seconds) of the first retry, by default 1.0
+        max_delay : float, optional
+            Largest backoff delay (seconds), by default 60.0
+        dead_letter_file : Optional[PathLike], optional
+            JSON lines file recording flow runs that could not be started,
+            by default None (only logged)
+        tracker : Optional[RunTracker], optional
+            Tracker of the submitted runs, limiting the number of flows in
+            flight, by default None (runs are not tracked)
+        """
+        self.metrics = SubmitMetrics()
+        self.tracker = tracker
+        self.rate_limiter = TokenBucket(rate, burst)
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.dead_letters = (
+            DeadLetterLog(dead_letter_file) if dead_letter_file else None
+        )
+        self._queue: "Queue[Optional[_FlowRequest]]" = Queue(maxsize=queue_size)
+        self._stopped = False
+
+        # Flows are deployed lazily by the first run_flow() call of each
+        # client, so the first submission per client is serialized
+        self._deploy_lock = Lock()
+        self._deployed: Set[int] = set()
+
+        self._workers = [
+            Thread(target=self._work, name=f"flow-submit-{i}", daemon=True)
+            for i in range(num_workers)
+        ]
+        for worker in self._workers:
+            worker.start()
+
+    def reserve(self) -> bool:
+        """Returns True if another flow may be submitted, reserving a slot for it."""
+        return self.tracker is None or self.tracker.reserve()
+
+    def submit(
+        self,
+        flow_client: GladierBaseClient,
+        flow_input: FlowInputType,
+        run_label: str = "Run",
+        checkpoint: Optional[CheckPoint] = None,
+        events: Sequence[str] = (),
+        paths: Sequence[str] = (),
+    ) -> None:
+        """Queue a flow run, blocking while the queue is full.
+
+        Parameters
+        ----------
+        flow_client : GladierBaseClient
+            The client used to run the flow.
         flow_input : FlowInputType
             The input arguments to the flow.
         run_label : str, optional
-            Label for the current run (This is the label that will be
-            presented on the globus webApp), by default "Run"
+            Label for the flow run, by default "Run"
+        checkpoint : Optional[CheckPoint], optional
+            Checkpoint to record the run state of `events` in, by default None
+        events : Sequence[str], optional
+            The checkpoint events processed by the flow run, by default ()
+        paths : Sequence[str], optional
+            The files processed by the flow run, by default ()
         """
-        # Run the flow
-        flow = self.flow_client.run_flow(flow_input=flow_input, label=run_label)
+        if self._stopped:
+            raise RuntimeError("Cannot submit a flow after the submitter is shut down")
+
+        request = _FlowRequest(
+            flow_client, flow_input, run_label, checkpoint, list(events), list(paths)
+        )
+        self.metrics.record_enqueued()
+        self._queue.put(request)
+
+    def shutdown(self) -> None:
+        """Submit every queued flow run and stop the worker threads."""
+        # The submitter may be shared by several flow handlers
+        if self._stopped:
+            return
+        self._stopped = True
+
+        for _ in self._workers:
+            self._queue.put(None)
+        for worker in self._workers:
+            worker.join()
+        logger.info(f"Flow submitter stopped: {self.metrics.as_dict()}")
+
+        if self.tracker is not None:
+            self.tracker.stop()
+            logger.info(f"Flow run tracker stopped: {self.tracker.as_dict()}")
+
+    def _work(self) -> None:
+        while True:
+            request = self._queue.get()
+            if request is None:
+                return
+
+            self.metrics.record_dequeued(time.monotonic() - request.enqueued)
+            try:
+                run_id = self._submit_with_retry(request)
+            except Exception as e:
+                self.metrics.record_result(False)
+                logger.exception(f"Failed to start flow: {request.run_label}")
+                self._dead_letter(request, e)
+                lifecycle.record(FileLifecycle.FAILED, request.paths)
+                if request.checkpoint is not None:
+                    request.checkpoint.set_state(request.events, CheckPoint.FAILED)
+                if self.tracker is not None:
+                    self.tracker.release()
+            else:
+                self.metrics.record_result(True)
+                lifecycle.record("submitted", request.paths, run_id=run_id)
+                if request.checkpoint is not None:
+                    request.checkpoint.set_state(
+                        request.events, CheckPoint.SUBMITTED, run_id
+                    )
+                if self.tracker is not None:
+                    self.tracker.add(
+                        request.flow_client,
+                        run_id,
+                        request.run_label,
+                        request.checkpoint,
+                        request.events,
+                        request.paths,
+                    )
+
+    @staticmethod
+    def _is_transient(error: Exception) -> Tuple[bool, bool]:
+        """Return whether the error is worth retrying, and whether it was throttling."""
+        if isinstance(error, (NetworkError, ConnectionError, TimeoutError)):
+            return True, False
+        # Globus SDK API errors carry the HTTP status of the failed request
+        status = getattr(error, "http_status", None)
+        if status is None:
+            return False, False
+        return status == 429 or status >= 500, status == 429
+
+    def _submit_with_retry(self, request: _FlowRequest) -> str:
+        for attempt in range(self.max_retries + 1):
+            self.metrics.record_rate_limit(self.rate_limiter.acquire())
+            try:
+                run_id = self._submit(request)
+            except Exception as e:
+                transient, throttled = self._is_transient(e)
+                if not transient or attempt == self.max_retries:
+                    raise
+                if throttled:
+                    self.rate_limiter.decrease()
+                self.metrics.record_retry(throttled)
+
+                # Full jitter spreads out the retries of concurrent workers
+                delay = random.uniform(
+                    0, min(self.max_delay, self.base_delay * 2**attempt)
+                )
+                logger.warning(
+                    f"Retrying flow {request.run_label} in {delay:.1f}s "
+                    f"(attempt {attempt + 1}/{self.max_retries}): {e}"
+                )
+                time.sleep(delay)
+            else:
+                self.rate_limiter.increase()
+                return run_id
+        raise AssertionError("unreachable")
 
-        # Log the flow information
-        # DEV Note: get_flow_id() must be called after run_flow(), otherwise it will be None
-        flow_id = self.flow_client.get_flow_id()
-        print("Flow created with ID: " + flow_id)
-        print("https://app.globus.org/flows/" + flow_id)
-        print("")
-        pprint(self.flow_client.get_flow_definition())
-        print("Flow Input:")
-        pprint(flow_input)
+    def _dead_letter(self, request: _FlowRequest, error: Exception) -> None:
+        if self.dead_letters is None:
+            return
+        self.dead_letters.append(
+            {
+                "time": time.time(),
+                "run_label": request.run_label,
+                "events": request.events,
+                "flow_input": request.flow_input,
+                "error": repr(error),
+            }
+        )
+
+    def _submit(self, request: _FlowRequest) -> str:
+        flow_client = request.flow_client
+
+        if id(flow_client) in self._deployed:
+            flow = flow_client.run_flow(
+                flow_input=request.flow_input, label=request.run_label
+            )
+        else:
+            with self._deploy_lock:
+                flow = flow_client.run_flow(
+                    flow_input=request.flow_input, label=request.run_label
+                )
+                first_run = id(flow_client) not in self._deployed
+                self._deployed.add(id(flow_client))
+
+            # Log the flow information once per flow client
+            # DEV Note: get_flow_id() must be called after run_flow(), otherwise it will be None
+            if first_run:
+                flow_id = flow_client.get_flow_id()
+                logger.info(
+                    f"Flow created with ID: {flow_id}\n"
+                    f"https://app.globus.org/flows/{flow_id}\n"
+                    f"{pformat(flow_client.get_flow_definition())}"
+                )
 
         # Log the flow run information
         run_id = flow["action_id"]
-        print("Flow started with run ID: " + run_id)
-        print("https://app.globus.org/runs/" + run_id)
-        print("=" * 100)
+        logger.info(
+            f"Flow started with run ID: {run_id} ({request.run_label})\n"
+            f"https://app.globus.org/runs/{run_id}\n"
+            f"Flow Input:\n{pformat(request.flow_input)}\n"
+            f"Submit queue: {self.metrics.as_dict()}"
+        )
+        return run_id
+
+
+class FlowBatcher:
+    """Group files that arrive close together into a single flow run.
+
+    A batch is opened by the first file added to it and is released once
+    `window` seconds have passed, or once it holds `max_count` files or at
+    least `max_bytes` bytes, whichever comes first. A `window` of zero
+    disables batching so that every file is released on its own.
+    """
+
+    def __init__(
+        self,
+        window: float = 0.0,
+        max_bytes: int = 8 * 1024**3,
+        max_count: int = 32,
+    ) -> None:
+        """Initialize the batcher.
+
+        Parameters
+        ----------
+        window : float, optional
+            Maximum number of seconds to wait for more files after the
+            first file of a batch arrives, by default 0.0
+        max_bytes : int, optional
+            Release the batch once its files total this many bytes,
+            by default 8 GiB
+        max_count : int, optional
+            Release the batch once it holds this many files, by default 32
+        """
+        self.window = window
+        self.max_bytes = max_bytes
+        self.max_count = max_count
+
+        self._paths: List[str] = []
+        self._bytes = 0
+        self._opened = 0.0
+
+    def __len__(self) -> int:
+        return len(self._paths)
+
+    def add(self, path: str) -> List[List[str]]:
+        """Add a file to the current batch.
+
+        Returns
+        -------
+        List[List[str]]
+            The batches that are ready to be submitted (possibly none).
+        """
+        if self.window <= 0:
+            return [[path]]
+
+        size = os.path.getsize(path)
+        batches = []
+
+        # Keep the batch under the byte limit where possible
+        if self._paths and self._bytes + size > self.max_bytes:
+            batches.append(self.flush())
+
+        if not self._paths:
+            self._opened = time.monotonic()
+        self._paths.append(path)
+        self._bytes += size
+
+        if len(self._paths) >= self.max_count or self._bytes >= self.max_bytes:
+            batches.append(self.flush())
+
+        return batches
+
+    def poll(self) -> List[List[str]]:
+        """Return the current batch if its time window has elapsed."""
+        if self._paths and time.monotonic() - self._opened >= self.window:
+            return [self.flush()]
+        return []
+
+    def flush(self) -> List[str]:
+        """Release the current batch, regardless of its size or age."""
+        paths, self._paths, self._bytes = self._paths, [], 0
+        return paths
+
+
+class BaseFlowHandler(StableFileEventHandler):
+    def __init__(
+        self,
+        flow_client: GladierBaseClient,
+        checkpoint: CheckPoint,
+        pattern: str = "*",
+        settle_time: float = 5.0,
+        submitter: Optional[FlowSubmitter] = None,
+        batcher: Optional[FlowBatcher] = None,
+        backfill_rate: int = 16,
+        fingerprint: str = "sampled",
+        fingerprint_workers: int = 2,
+    ) -> None:
+        """Initialize the flow handler.
+
+        Parameters
+        ----------
+        flow_client : GladierBaseClient
+            The client used to run the flow.
+        checkpoint : CheckPoint
+            Checkpoint recording the files that have been processed.
+        pattern : str, optional
+            Glob pattern matched against file names, by default "*"
+        settle_time : float, optional
+            Number of seconds a file must remain unchanged before it is
+            considered complete, by default 5.0
+        submitter : Optional[FlowSubmitter], optional
+            Submitter used to start the flows, by default a new FlowSubmitter
+        batcher : Optional[FlowBatcher], optional
+            Batcher grouping files into flow runs, by default one run per file
+        backfill_rate : int, optional
+            Maximum number of missed files to release on each poll, by default 16
+        fingerprint : str, optional
+            How files are identified in the checkpoint: "sampled" (size and
+            sampled chunk hashes), "full" (hash of the whole file) or "path"
+            (path, size and modification time), by default "sampled".
+            Content fingerprints skip copies of processed files, and
+            "sampled" ones may also skip distinct files whose sampled chunks
+            are identical.
+        fingerprint_workers : int, optional
+            Number of threads computing the content fingerprints, by default 2
+        """
+        if fingerprint not in ("path", "sampled", "full"):
+            raise ValueError(f"Unknown fingerprint: {fingerprint}")
+
+        super().__init__(pattern, settle_time, backfill_rate)
+        self.flow_client = flow_client
+        self.checkpoint = checkpoint
+        self.submitter = submitter or FlowSubmitter()
+        self.batcher = batcher or FlowBatcher()
+        self.fingerprint = fingerprint
+
+        # Hashing large files takes a while, so the content fingerprints are
+        # computed off the watcher thread and collected by poll()
+        self._fingerprinter = (
+            None
+            if fingerprint == "path"
+            else ThreadPoolExecutor(
+                fingerprint_workers, thread_name_prefix="fingerprint"
+            )
+        )
+        self._fingerprints: Dict[str, "Future[str]"] = {}
+        # Checkpoint event of each file waiting in the batcher
+        self._events: Dict[str, str] = {}
+        # Batches held back while the maximum number of flows are in flight
+        self._held: Deque[List[str]] = deque()
 
     @abstractmethod
-    def on_any_event(self, event: FileSystemEvent) -> None:
+    def create_flow_input(self, src_paths: List[str]) -> FlowInputType:
         """Child class should implement."""
+
+    def run_label(self, src_paths: List[str]) -> str:
+        """Return the label presented on the globus webApp for a batch of files."""
+        label = Path(src_paths[0]).name
+        if len(src_paths) > 1:
+            label += f" (+{len(src_paths) - 1} more)"
+        return label
+
+    def is_known(self, src_path: str, stat: os.stat_result) -> bool:
+        return self.checkpoint.known_file(src_path, stat)
+
+    def checkpoint_event(self, src_path: str) -> str:
+        """Return the checkpoint event identifying the file at `src_path`."""
+        if self.fingerprint == "path":
+            # A new file reusing the name of an old one is a different event
+            stat = os.stat(src_path)
+            return f"path:{stat.st_size}:{stat.st_mtime_ns}:{src_path}"
+        return file_fingerprint(src_path, full=self.fingerprint == "full")
+
+    def on_file_ready(self, src_path: str) -> None:
+        if self._fingerprinter is not None:
+            self._fingerprints[src_path] = self._fingerprinter.submit(
+                self.checkpoint_event, src_path
+            )
+            return
+
+        try:
+            event = self.checkpoint_event(src_path)
+        except OSError as e:
+            logger.warning(f"Skipping unreadable file {src_path}: {e}")
+            lifecycle.record(FileLifecycle.FAILED, src_path)
+            return
+        self.add_file(src_path, event)
+
+    def collect_fingerprints(self, wait: bool = False) -> None:
+        """Add the files whose content fingerprint has been computed.
+
+        Parameters
+        ----------
+        wait : bool, optional
+            Wait for every pending fingerprint, by default False
+        """
+        for src_path, future in list(self._fingerprints.items()):
+            if not (wait or future.done()):
+                continue
+            del self._fingerprints[src_path]
+            try:
+                event = future.result()
+            except OSError as e:
+                logger.warning(f"Skipping unreadable file {src_path}: {e}")
+                lifecycle.record(FileLifecycle.FAILED, src_path)
+                continue
+            except Exception:
+                logger.exception(f"Failed to fingerprint {src_path}")
+                lifecycle.record(FileLifecycle.FAILED, src_path)
+                continue
+            self.add_file(src_path, event)
+
+    def add_file(self, src_path: str, event: str) -> None:
+        """Batch the file at `src_path`, identified by the checkpoint `event`."""
+        # Check to see if the file (or a copy of it) has been seen before
+        # and, if so, skip it
+        if self.checkpoint.seen(event, src_path):
+            lifecycle.record(FileLifecycle.SKIPPED, src_path)
+            return
+
+        self._events[src_path] = event
+        for batch in self.batcher.add(src_path):
+            self.start_batch(batch)
+
+    @property
+    def backlog(self) -> int:
+        """The number of files waiting to be fingerprinted, batched or for a free flow slot."""
+        return (
+            len(self._fingerprints)
+            + len(self.batcher)
+            + sum(len(batch) for batch in self._held)
+        )
+
+    def poll(self) -> None:
+        super().poll()
+        self.collect_fingerprints()
+        for batch in self.batcher.poll():
+            self.start_batch(batch)
+        self.admit()
+
+    def start_batch(self, src_paths: List[str]) -> None:
+        """Start a single flow processing each of the `src_paths`.
+
+        The batch is held locally until the submitter has a free slot.
+        """
+        self._held.append(src_paths)
+        self.admit()
+
+    def admit(self) -> None:
+        """Start the held batches while the submitter has free slots."""
+        while self._held and self.submitter.reserve():
+            src_paths = self._held.popleft()
+            flow_input = self.create_flow_input(src_paths)
+            events = [self._events.pop(path, path) for path in src_paths]
+            self.start_flow(flow_input, self.run_label(src_paths), events, src_paths)
+
+    def start_flow(
+        self,
+        flow_input: FlowInputType,
+        run_label: str = "Run",
+        events: Sequence[str] = (),
+        paths: Sequence[str] = (),
+    ) -> None:
+        """Queue a new Globus flow to be started by the submitter.
+
+        Parameters
+        ----------
+        flow_input : FlowInputType
+            The input arguments to the flow.
+        run_label : str, optional
+            Label for the current run (This is the label that will be
+            presented on the globus webApp), by default "Run"
+        events : Sequence[str], optional
+            The checkpoint events of the files processed by the flow, whose
+            run state is recorded in the checkpoint, by default ()
+        paths : Sequence[str], optional
+            The files processed by the flow, whose lifecycle is recorded,
+            by default ()
+        """
+        lifecycle.record("queued", paths)
+        self.submitter.submit(
+            self.flow_client, flow_input, run_label, self.checkpoint, events, paths
+        )
+
+    def flush(self) -> None:
+        """Start a flow for the pending batch, if any."""
+        self.collect_fingerprints(wait=True)
+        if len(self.batcher):
+            self.start_batch(self.batcher.flush())
+        if self._held:
+            # They remain queued, so a SQLiteCheckPoint retries them on the next start
+            logger.warning(
+                f"{self.backlog} files held back by the in-flight flow limit "
+                "were not started"
+            )
+
+    def shutdown(self) -> None:
+        """Submit the pending batch and wait for the queued flows to be submitted."""
+        self.flush()
+        if self._fingerprinter is not None:
+            self._fingerprinter.shutdown()
+        self.submitter.shutdown()
@@ -0,0 +1,55 @@
+import time
+from pathlib import Path
+
+from picoprobe.utils import FlowBatcher
+
+
+def _file(tmp_path: Path, name: str, size: int) -> str:
+    path = tmp_path / name
+    path.write_bytes(b"x" * size)
+    return str(path)
+
+
+def test_no_window_releases_every_file(tmp_path: Path) -> None:
+    batcher = FlowBatcher(window=0)
+    path = _file(tmp_path, "a.emd", 10)
+    assert batcher.add(path) == [[path]]
+    assert len(batcher) == 0
+
+
+def test_count_limit(tmp_path: Path) -> None:
+    batcher = FlowBatcher(window=60, max_count=3)
+    paths = [_file(tmp_path, f"{i}.emd", 10) for i in range(4)]
+
+    assert batcher.add(paths[0]) == []
+    assert batcher.add(paths[1]) == []
+    assert batcher.add(paths[2]) == [paths[:3]]
+    assert batcher.add(paths[3]) == []
+    assert batcher.flush() == paths[3:]
+
+
+def test_byte_limit(tmp_path: Path) -> None:
+    batcher = FlowBatcher(window=60, max_bytes=100)
+    a = _file(tmp_path, "a.emd", 60)
+    b = _file(tmp_path, "b.emd", 60)
+    c = _file(tmp_path, "c.emd", 100)
+
+    assert batcher.add(a) == []
+    # b would overflow the batch, so a is released on its own
+    assert batcher.add(b) == [[a]]
+    # c overflows the batch of b, and fills its own batch
+    assert batcher.add(c) == [[b], [c]]
+    assert len(batcher) == 0
+
+
+def test_window_elapses(tmp_path: Path) -> None:
+    batcher = FlowBatcher(window=0.1)
+    a = _file(tmp_path, "a.emd", 10)
+    b = _file(tmp_path, "b.emd", 10)
+
+    batcher.add(a)
+    batcher.add(b)
+    assert batcher.poll() == []
+    time.sleep(0.15)
+    assert batcher.poll() == [[a, b]]
+    assert batcher.poll() == []
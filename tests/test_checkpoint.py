@@ -0,0 +1,112 @@
+import os
+import time
+from pathlib import Path
+
+from picoprobe.utils import CheckPoint, SQLiteCheckPoint
+
+
+def test_new_event_is_queued(tmp_path: Path) -> None:
+    checkpoint = SQLiteCheckPoint(tmp_path / "checkpoint.db")
+    assert not checkpoint.seen("a.emd")
+    assert checkpoint.seen("a.emd")
+    assert checkpoint.get("a.emd")["state"] == CheckPoint.QUEUED
+    assert checkpoint.count() == 1
+
+
+def test_state_transitions(tmp_path: Path) -> None:
+    checkpoint = SQLiteCheckPoint(tmp_path / "checkpoint.db")
+    checkpoint.seen("a.emd")
+
+    checkpoint.set_state(["a.emd"], CheckPoint.SUBMITTED, "run-1")
+    assert checkpoint.get("a.emd")["run_id"] == "run-1"
+    # The run ID is kept when it is not given
+    checkpoint.set_state(["a.emd"], CheckPoint.RUNNING)
+    checkpoint.set_state(["a.emd"], CheckPoint.SUCCEEDED)
+    record = checkpoint.get("a.emd")
+    assert record["state"] == CheckPoint.SUCCEEDED
+    assert record["run_id"] == "run-1"
+    assert "a.emd" in checkpoint
+    assert checkpoint.count(CheckPoint.SUCCEEDED) == 1
+
+
+def test_failed_event_is_retried(tmp_path: Path) -> None:
+    checkpoint = SQLiteCheckPoint(tmp_path / "checkpoint.db")
+    checkpoint.seen("a.emd")
+    checkpoint.set_state(["a.emd"], CheckPoint.FAILED, "run-1")
+
+    assert "a.emd" not in checkpoint
+    # Seeing it again queues a new run
+    assert not checkpoint.seen("a.emd")
+    record = checkpoint.get("a.emd")
+    assert record["state"] == CheckPoint.QUEUED
+    assert record["run_id"] is None
+
+
+def test_queued_by_previous_process_is_retried(tmp_path: Path) -> None:
+    checkpoint = SQLiteCheckPoint(tmp_path / "checkpoint.db")
+    checkpoint.seen("a.emd")
+    checkpoint.seen("b.emd")
+    checkpoint.set_state(["b.emd"], CheckPoint.SUBMITTED, "run-1")
+    checkpoint.close()
+
+    time.sleep(0.01)
+    checkpoint = SQLiteCheckPoint(tmp_path / "checkpoint.db")
+    assert "a.emd" not in checkpoint
+    assert "b.emd" in checkpoint
+
+
+def test_known_file_matches_size_and_mtime(tmp_path: Path) -> None:
+    path = tmp_path / "a.emd"
+    path.write_bytes(b"data")
+    checkpoint = SQLiteCheckPoint(tmp_path / "checkpoint.db")
+    checkpoint.seen(str(path))
+    checkpoint.set_state([str(path)], CheckPoint.SUBMITTED)
+    assert checkpoint.known_file(str(path), os.stat(path))
+
+    # A new file with the same name is not known
+    path.write_bytes(b"other data")
+    assert not checkpoint.known_file(str(path), os.stat(path))
+
+
+def test_import_text(tmp_path: Path) -> None:
+    text_file = tmp_path / "checkpoint.txt"
+    text = CheckPoint(text_file)
+    text.seen("a.emd")
+    text.seen("b.emd")
+
+    checkpoint = SQLiteCheckPoint(tmp_path / "checkpoint.db")
+    checkpoint.import_text(text_file)
+    assert "a.emd" in checkpoint
+    assert checkpoint.count(CheckPoint.SUBMITTED) == 2
+
+
+def test_text_checkpoint_knows_fingerprinted_paths(tmp_path: Path) -> None:
+    path = tmp_path / "a.emd"
+    path.write_bytes(b"data")
+    checkpoint = CheckPoint(tmp_path / "checkpoint.txt")
+    assert not checkpoint.seen("sampled:4:abc", str(path))
+    assert checkpoint.known_file(str(path), os.stat(path))
+
+    # The paths are reloaded along with the fingerprints
+    checkpoint = CheckPoint(tmp_path / "checkpoint.txt")
+    assert "sampled:4:abc" in checkpoint
+    assert checkpoint.known_file(str(path), os.stat(path))
+    assert not checkpoint.known_file(str(tmp_path / "b.emd"), os.stat(path))
+
+
+def test_text_checkpoint_is_imported_on_creation(tmp_path: Path) -> None:
+    path = tmp_path / "a.emd"
+    path.write_bytes(b"data")
+    CheckPoint(tmp_path / "checkpoint.txt").seen(str(path))
+
+    checkpoint = SQLiteCheckPoint(tmp_path / "checkpoint.db")
+    assert str(path) in checkpoint
+    # The files processed before the upgrade are not backfilled
+    assert checkpoint.known_file(str(path), os.stat(path))
+    checkpoint.close()
+
+    # An existing database is not imported into again
+    CheckPoint(tmp_path / "checkpoint.txt").seen("b.emd")
+    checkpoint = SQLiteCheckPoint(tmp_path / "checkpoint.db")
+    assert "b.emd" not in checkpoint
+    assert checkpoint.count() == 1
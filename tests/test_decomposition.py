@@ -0,0 +1,74 @@
+from typing import Tuple
+
+import numpy as np
+import pytest
+
+from picoprobe.tools.decomposition import nmf, pca
+
+
+def _spectrum_image(n_components: int = 3) -> Tuple[np.ndarray, np.ndarray]:
+    """Return a low-rank spectrum image of Gaussian peaks and its Poisson counts."""
+    rng = np.random.default_rng(1)
+    channels = np.arange(128)
+    centers = np.linspace(20, 110, n_components)
+    spectra = np.exp(-0.5 * ((channels - centers[:, None]) / 4) ** 2) + 0.05
+    abundances = rng.gamma(2.0, 1.0, size=(24, 24, n_components))
+    signal = 20 * abundances @ spectra
+    return signal, rng.poisson(signal).astype(np.uint16)
+
+
+def _error(model: np.ndarray, reference: np.ndarray) -> float:
+    return float(np.linalg.norm(model - reference) / np.linalg.norm(reference))
+
+
+@pytest.mark.parametrize("max_block_bytes", [4096, 2**30])
+def test_pca_matches_svd(max_block_bytes: int) -> None:
+    signal, _ = _spectrum_image()
+    data = signal.astype(np.float32)
+    result = pca(data, n_components=3, max_block_bytes=max_block_bytes)
+
+    pixels = data.reshape(-1, data.shape[2]).astype(np.float64)
+    centered = pixels - pixels.mean(axis=0)
+    _, singular_values, components = np.linalg.svd(centered, full_matrices=False)
+    variance = singular_values**2 / (len(pixels) - 1)
+
+    np.testing.assert_allclose(result.explained_variance, variance[:3], rtol=1e-6)
+    assert result.total_variance == pytest.approx(variance.sum())
+    # The components are the same up to their sign
+    overlaps = np.abs(np.sum(result.components * components[:3], axis=1))
+    np.testing.assert_allclose(overlaps, 1.0, rtol=1e-6)
+    assert _error(result.reconstruct(), data) < 1e-5
+
+
+def test_pca_of_poisson_weighted_data() -> None:
+    signal, counts = _spectrum_image()
+    result = pca(
+        counts, n_components=3, image=counts.sum(2), spectrum=counts.sum((0, 1))
+    )
+    assert result.explained_variance_ratio is not None
+    assert np.all(np.diff(result.explained_variance_ratio) <= 0)
+    assert result.explained_variance_ratio.sum() < 1
+    # The low-rank model removes most of the noise
+    assert _error(result.reconstruct(), signal) < 0.5 * _error(counts, signal)
+
+
+@pytest.mark.parametrize("init", [False, True])
+def test_nmf_reconstruction_error(init: bool) -> None:
+    signal, counts = _spectrum_image()
+    image, spectrum = counts.sum(axis=2), counts.sum(axis=(0, 1))
+    reference = pca(counts, 3, image, spectrum)
+    result = nmf(
+        counts,
+        3,
+        image,
+        spectrum,
+        init=reference.components if init else None,
+        max_block_bytes=4096,
+    )
+
+    assert result.components.min() >= 0
+    assert result.loadings.min() >= 0
+    assert result.loading_maps.shape == (3, 24, 24)
+    # With the default epochs the error is close to the noise level of PCA
+    pca_error = _error(reference.reconstruct(), signal)
+    assert _error(result.reconstruct(), signal) < 1.2 * pca_error
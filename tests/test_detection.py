@@ -0,0 +1,120 @@
+from typing import Any, Iterator, List
+
+import numpy as np
+import pytest
+
+from picoprobe.tools import detection
+from picoprobe.tools.detection import (
+    DETECTION_COLUMNS,
+    Detector,
+    empty_detections,
+    iter_frame_batches,
+)
+from picoprobe.tools.pipeline import Pipeline
+
+
+class _Tensor:
+    def __init__(self, values: Any) -> None:
+        self.values = np.asarray(values, dtype=np.float64)
+
+    def cpu(self) -> "_Tensor":
+        return self
+
+    def numpy(self) -> np.ndarray:
+        return self.values
+
+
+class _Boxes:
+    def __init__(self, n: int, frame: int) -> None:
+        self.xyxy = _Tensor([[frame, 0, frame + 1, 1]] * n)
+        self.conf = _Tensor([0.5] * n)
+        self.cls = _Tensor([frame % 2] * n)
+
+
+class _Result:
+    def __init__(self, n: int, frame: int) -> None:
+        self.boxes = _Boxes(n, frame)
+
+
+class _Model:
+    """Stand-in for a YOLO model detecting `frame % 3` boxes in each frame.
+
+    The frames are filled with their index, which gives the box coordinates.
+    """
+
+    def __init__(self) -> None:
+        self.batches: List[int] = []
+
+    def predict(self, source: List[np.ndarray], **kwargs: Any) -> List[_Result]:
+        self.batches.append(len(source))
+        frames = [int(image[0, 0, 0]) for image in source]
+        return [_Result(frame % 3, frame) for frame in frames]
+
+
+@pytest.fixture
+def model(monkeypatch: pytest.MonkeyPatch) -> _Model:
+    model = _Model()
+    monkeypatch.setitem(detection._models, "model.pt", model)
+    return model
+
+
+def _blocks(n_frames: int, block_size: int) -> Iterator[np.ndarray]:
+    frames = np.arange(n_frames, dtype=np.uint8)[:, None, None]
+    frames = np.broadcast_to(frames, (n_frames, 4, 5))
+    for start in range(0, n_frames, block_size):
+        yield frames[start : start + block_size]
+
+
+def test_frames_are_regrouped_in_batches() -> None:
+    batches = list(iter_frame_batches(_blocks(10, 3), batch_size=4))
+    assert [len(batch) for batch in batches] == [4, 4, 2]
+    assert all(image.shape == (4, 5, 3) for batch in batches for image in batch)
+    frames = [int(image[0, 0, 1]) for batch in batches for image in batch]
+    assert frames == list(range(10))
+    assert list(iter_frame_batches([], batch_size=4)) == []
+
+
+def test_models_are_loaded_once(model: _Model) -> None:
+    assert detection.load_model("model.pt") is model
+    assert Detector("model.pt").model is model
+
+
+def test_detections_are_numbered_across_batches(model: _Model) -> None:
+    detector = Detector("model.pt")
+    for batch in iter_frame_batches(_blocks(7, 2), batch_size=3):
+        detector.predict(batch)
+    detector.close()
+    result = detector.result()
+
+    assert model.batches == [3, 3, 1]
+    assert tuple(result) == DETECTION_COLUMNS
+    # Frame i has i % 3 detections
+    np.testing.assert_array_equal(result["frame"], [1, 2, 2, 4, 5, 5])
+    np.testing.assert_array_equal(result["x1"], result["frame"])
+    np.testing.assert_array_equal(result["class"], result["frame"] % 2)
+    for name, column in empty_detections().items():
+        assert result[name].dtype == column.dtype
+
+
+def test_no_detections(model: _Model) -> None:
+    detector = Detector("model.pt")
+    result = detector.result()
+    assert all(len(column) == 0 for column in result.values())
+
+
+def test_detect_stage_of_a_pipeline(model: _Model) -> None:
+    detector = Detector("model.pt")
+
+    def detect_blocks(blocks: Iterator[np.ndarray]) -> None:
+        for batch in iter_frame_batches(blocks, batch_size=4):
+            detector.predict(batch)
+
+    pipeline = Pipeline(queue_size=1)
+    pipeline.add_source("read", _blocks(30, 7))
+    pipeline.add_stage("detect", detect_blocks, upstream="read")
+    stats = pipeline.run()
+
+    assert stats["detect"].units == 30
+    assert detector.next_frame == 30
+    expected = [i for i in range(30) for _ in range(i % 3)]
+    np.testing.assert_array_equal(detector.result()["frame"], expected)
@@ -0,0 +1,119 @@
+import json
+import os
+from pathlib import Path
+from typing import Any, Dict
+
+import h5py
+import numpy as np
+import pytest
+
+from picoprobe.tools.emd import (
+    file_metadata,
+    hyperspy_metadata,
+    merge_metadata,
+    probe,
+    signal_type,
+)
+
+VELOX_METADATA = {
+    "BinaryResult": {"Detector": "HAADF"},
+    "Acquisition": {"AcquisitionStartDatetime": {"DateTime": "1690000000"}},
+    "Optics": {
+        "AccelerationVoltage": "300000",
+        "CameraLength": "0.115",
+        "NominalMagnification": "1000000",
+    },
+    "Instrument": {"InstrumentModel": "PicoProbe"},
+    "Stage": {"AlphaTilt": "0", "Position": {"x": "1e-6", "y": "0", "z": "0"}},
+}
+
+
+def _velox_file(path: Path, frames: int = 1) -> Path:
+    """Write a Velox-like EMD file holding a single image (stack)."""
+    with h5py.File(path, "w") as f:
+        group = f.create_group("Data/Image/0123")
+        group.create_dataset("Data", data=np.zeros((8, 8, frames), dtype=np.uint16))
+        raw = np.frombuffer(json.dumps(VELOX_METADATA).encode(), dtype=np.uint8)
+        group.create_dataset("Metadata", data=np.tile(raw[:, None], (1, frames)))
+    return path
+
+
+def test_velox_signal_metadata(tmp_path: Path) -> None:
+    path = _velox_file(tmp_path / "image.emd")
+    [info] = probe(path)
+    assert info.kind == "image"
+    assert signal_type(path) == "image"
+
+    metadata = file_metadata(path)["HAADF"]
+    assert metadata["General"]["original_filename"] == "image.emd"
+    assert metadata["General"]["date"] == "2023-07-22"
+    tem = metadata["Acquisition_instrument"]["TEM"]
+    assert tem["beam_energy"] == 300.0
+    assert tem["camera_length"] == pytest.approx(115.0)
+    assert tem["Stage"]["x"] == pytest.approx(1e-3)
+
+
+def test_velox_stack_is_time_series(tmp_path: Path) -> None:
+    path = _velox_file(tmp_path / "stack.emd", frames=4)
+    assert signal_type(path) == "time_series"
+
+
+def test_merge_metadata_prefers_reference() -> None:
+    metadata: Dict[str, Any] = {
+        "EDS": {
+            "General": {"title": "EDS", "time_zone": "UTC"},
+            "Signal": {"signal_type": "EDS_TEM"},
+        }
+    }
+    reference = {
+        "EDS": {
+            "General": {"title": "EDS", "time_zone": "CDT"},
+            "Acquisition_instrument": {"TEM": {"Detector": {"EDS": {"live_time": 1}}}},
+        }
+    }
+    merged = merge_metadata(metadata, reference)
+    assert merged["EDS"]["General"]["time_zone"] == "CDT"
+    assert merged["EDS"]["Signal"]["signal_type"] == "EDS_TEM"
+    assert merged["EDS"]["Acquisition_instrument"]["TEM"]["Detector"]["EDS"] == {
+        "live_time": 1
+    }
+    # The inputs are not modified
+    assert "Acquisition_instrument" not in metadata["EDS"]
+
+
+def _leaves(metadata: Dict[str, Any], prefix: str = "") -> Dict[str, Any]:
+    leaves = {}
+    for key, value in metadata.items():
+        if isinstance(value, dict):
+            leaves.update(_leaves(value, f"{prefix}{key}."))
+        else:
+            leaves[f"{prefix}{key}"] = value
+    return leaves
+
+
+@pytest.mark.skipif(
+    "PICOPROBE_VELOX_SAMPLE" not in os.environ,
+    reason="Set PICOPROBE_VELOX_SAMPLE to the path of a Velox EMD file",
+)
+def test_metadata_parity_with_hyperspy() -> None:
+    pytest.importorskip("hyperspy.api")
+    path = os.environ["PICOPROBE_VELOX_SAMPLE"]
+    reference = hyperspy_metadata(path)
+    metadata = file_metadata(path)
+
+    # Every signal loaded by HyperSpy is found from the headers
+    assert set(reference) <= set(metadata)
+
+    # The fields reconstructed from the headers match the HyperSpy ones
+    # (except for the time, HyperSpy reports it in the local time zone)
+    for title, signal in metadata.items():
+        if title not in reference:
+            continue
+        expected = _leaves(reference[title])
+        for key, value in _leaves(signal).items():
+            if key in expected and not key.startswith(("General.time", "General.date")):
+                assert value == pytest.approx(expected[key]), key
+
+        # Completing the metadata drops none of the HyperSpy fields
+        merged = _leaves(merge_metadata(signal, reference[title]))
+        assert set(expected) <= set(merged)
@@ -0,0 +1,135 @@
+import os
+import shutil
+import threading
+from pathlib import Path
+from typing import Any, List, Sequence
+
+import pytest
+
+from picoprobe.utils import (
+    BaseFlowHandler,
+    FlowInputType,
+    SQLiteCheckPoint,
+    file_fingerprint,
+)
+
+
+class _Submitter:
+    """Submitter recording the files of each flow run."""
+
+    def __init__(self) -> None:
+        self.runs: List[List[str]] = []
+
+    def reserve(self) -> bool:
+        return True
+
+    def submit(
+        self,
+        flow_client: Any,
+        flow_input: FlowInputType,
+        run_label: str = "Run",
+        checkpoint: Any = None,
+        events: Sequence[str] = (),
+        paths: Sequence[str] = (),
+    ) -> None:
+        self.runs.append(list(paths))
+
+    def shutdown(self) -> None:
+        pass
+
+
+class _Handler(BaseFlowHandler):
+    def __init__(self, tmp_path: Path, fingerprint: str) -> None:
+        self.fingerprinted = threading.Event()
+        self.threads: List[str] = []
+        super().__init__(
+            flow_client=None,
+            checkpoint=SQLiteCheckPoint(tmp_path / "checkpoint.db"),
+            pattern="*.emd",
+            submitter=_Submitter(),  # type: ignore[arg-type]
+            fingerprint=fingerprint,
+        )
+
+    def create_flow_input(self, src_paths: List[str]) -> FlowInputType:
+        return {"input": {"num_files": len(src_paths)}}
+
+    def checkpoint_event(self, src_path: str) -> str:
+        self.threads.append(threading.current_thread().name)
+        self.fingerprinted.wait(5)
+        return super().checkpoint_event(src_path)
+
+    @property
+    def runs(self) -> List[List[str]]:
+        return self.submitter.runs  # type: ignore[attr-defined, no-any-return]
+
+
+def _file(path: Path, data: bytes) -> str:
+    path.write_bytes(data)
+    return str(path)
+
+
+def test_sampled_fingerprint_identifies_copies(tmp_path: Path) -> None:
+    data = os.urandom(4 * 1024 * 1024)
+    a = _file(tmp_path / "a.emd", data)
+    b = str(shutil.copy(a, tmp_path / "b.emd"))
+    assert file_fingerprint(a) == file_fingerprint(b)
+    assert file_fingerprint(a).startswith(f"sampled:{len(data)}:")
+    assert file_fingerprint(a, full=True).startswith(f"full:{len(data)}:")
+
+    # The last bytes are always sampled
+    _file(tmp_path / "b.emd", data[:-1] + bytes([data[-1] ^ 1]))
+    assert file_fingerprint(a) != file_fingerprint(b)
+
+
+def test_fingerprint_requires_two_samples(tmp_path: Path) -> None:
+    a = _file(tmp_path / "a.emd", b"data")
+    with pytest.raises(ValueError):
+        file_fingerprint(a, samples=1)
+
+
+def test_copies_are_skipped(tmp_path: Path) -> None:
+    handler = _Handler(tmp_path, "sampled")
+    handler.fingerprinted.set()
+    a = _file(tmp_path / "a.emd", b"data")
+    b = str(shutil.copy(a, tmp_path / "b.emd"))
+    c = _file(tmp_path / "c.emd", b"other data")
+
+    for path in (a, b, c):
+        handler.on_file_ready(path)
+    handler.shutdown()
+    assert handler.runs == [[a], [c]]
+
+
+def test_fingerprints_are_computed_off_the_watcher_thread(tmp_path: Path) -> None:
+    handler = _Handler(tmp_path, "full")
+    a = _file(tmp_path / "a.emd", b"data")
+
+    # The watcher thread does not wait for the fingerprint
+    handler.on_file_ready(a)
+    handler.poll()
+    assert handler.runs == []
+    assert handler.backlog == 1
+
+    handler.fingerprinted.set()
+    handler.flush()
+    assert handler.runs == [[a]]
+    assert handler.threads[0].startswith("fingerprint")
+    handler.shutdown()
+
+
+def test_path_events_include_size_and_mtime(tmp_path: Path) -> None:
+    handler = _Handler(tmp_path, "path")
+    handler.fingerprinted.set()
+    a = _file(tmp_path / "a.emd", b"data")
+
+    handler.on_file_ready(a)
+    handler.on_file_ready(a)
+    assert handler.runs == [[a]]
+
+    # A new acquisition reusing the name of an old file is not skipped
+    _file(tmp_path / "a.emd", b"new data")
+    handler.on_file_ready(a)
+    assert handler.runs == [[a], [a]]
+    # The file is fingerprinted on the watcher thread
+    assert handler.threads == [threading.current_thread().name] * 3
+    handler.shutdown()
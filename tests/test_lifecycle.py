@@ -0,0 +1,143 @@
+import json
+import os
+import time
+from pathlib import Path
+from typing import Any, Iterator, List, Tuple
+
+import pytest
+
+from picoprobe import utils
+from picoprobe.utils import FileLifecycle, FileStabilizer
+
+
+@pytest.fixture
+def lifecycle(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> Iterator[FileLifecycle]:
+    """A lifecycle recorder (also used by the watcher classes) exporting to `tmp_path`."""
+    recorder = FileLifecycle()
+    recorder.configure(
+        tmp_path / "events.jsonl", tmp_path / "metrics.prom", export_interval=60
+    )
+    monkeypatch.setattr(utils, "lifecycle", recorder)
+    yield recorder
+    recorder.close()
+
+
+def test_stage_counters_and_latency(tmp_path: Path, lifecycle: FileLifecycle) -> None:
+    lifecycle.record("detected", ["a.emd", "b.emd"], timestamp=100.0)
+    lifecycle.record("stable", "a.emd", timestamp=103.0)
+    lifecycle.record("stable", "b.emd", timestamp=140.0)
+    lifecycle.record("published", "a.emd", timestamp=700.0, run_id="run-1")
+    lifecycle.close()
+
+    events = [json.loads(line) for line in open(tmp_path / "events.jsonl")]
+    assert [event["stage"] for event in events] == [
+        "detected",
+        "detected",
+        "stable",
+        "stable",
+        "published",
+    ]
+    assert events[2]["latency"] == 3.0
+    assert events[4]["latency"] == 600.0
+    assert events[4]["run_id"] == "run-1"
+    assert "latency" not in events[0]
+
+    metrics = (tmp_path / "metrics.prom").read_text()
+    lines = metrics.splitlines()
+    assert 'picoprobe_files_total{stage="detected"} 2' in lines
+    assert 'picoprobe_files_total{stage="stable"} 2' in lines
+    # The buckets are cumulative
+    assert 'picoprobe_file_latency_seconds_bucket{stage="stable",le="5.0"} 1' in lines
+    assert 'picoprobe_file_latency_seconds_bucket{stage="stable",le="60.0"} 2' in lines
+    assert 'picoprobe_file_latency_seconds_bucket{stage="stable",le="+Inf"} 2' in lines
+    assert 'picoprobe_file_latency_seconds_count{stage="stable"} 2' in lines
+    assert 'picoprobe_file_latency_seconds_sum{stage="stable"} 43.0' in lines
+    assert (
+        'picoprobe_file_latency_seconds_bucket{stage="published",le="300.0"} 0' in lines
+    )
+    assert metrics.endswith("# EOF\n")
+
+
+def test_openmetrics_format(lifecycle: FileLifecycle) -> None:
+    lifecycle.record("detected", "a.emd", timestamp=0.0)
+    lifecycle.record("queued", "a.emd", timestamp=1.0)
+    lifecycle._flush()
+
+    families = {}
+    for line in lifecycle.openmetrics().splitlines():
+        if line.startswith("# TYPE"):
+            _, _, name, kind = line.split()
+            families[name] = kind
+        elif not line.startswith("#"):
+            # Each sample is a metric name, its labels and a value
+            name, value = line.rsplit(" ", 1)
+            float(value)
+            assert any(name.startswith(family) for family in families)
+    assert families == {
+        "picoprobe_files": "counter",
+        "picoprobe_file_latency_seconds": "histogram",
+    }
+
+
+def test_metrics_file_is_replaced_atomically(
+    tmp_path: Path, lifecycle: FileLifecycle, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    metrics_file = tmp_path / "metrics.prom"
+    metrics_file.write_text("previous\n")
+    replaced: List[Tuple[str, str, str]] = []
+
+    def replace(src: Any, dst: Any) -> None:
+        replaced.append((str(src), Path(src).read_text(), Path(dst).read_text()))
+        os.rename(src, dst)
+
+    monkeypatch.setattr(utils.os, "replace", replace)
+    lifecycle.record("detected", "a.emd")
+    lifecycle._flush()
+
+    # The complete text is written to another file before it replaces the metrics
+    [(src, text, previous)] = replaced
+    assert previous == "previous\n"
+    assert text.endswith("# EOF\n")
+    assert metrics_file.read_text() == text
+    assert not Path(src).exists()
+
+
+def test_terminal_stages_forget_files(lifecycle: FileLifecycle) -> None:
+    stages = ("published", FileLifecycle.FAILED, FileLifecycle.SKIPPED)
+    for i, stage in enumerate(stages + (FileLifecycle.EXPIRED,)):
+        lifecycle.record("detected", f"{i}.emd")
+        lifecycle.record(stage, f"{i}.emd")
+    lifecycle._flush()
+    assert lifecycle._detected == {}
+
+
+def test_detection_times_are_bounded(
+    lifecycle: FileLifecycle, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.setattr(FileLifecycle, "MAX_TRACKED", 2)
+    for name in ("a.emd", "b.emd", "c.emd"):
+        lifecycle.record("detected", name)
+    lifecycle._flush()
+    assert list(lifecycle._detected) == ["b.emd", "c.emd"]
+
+
+def test_untracked_files_expire(tmp_path: Path, lifecycle: FileLifecycle) -> None:
+    empty = tmp_path / "empty.emd"
+    empty.touch()
+    deleted = tmp_path / "deleted.emd"
+    deleted.write_bytes(b"data")
+
+    stabilizer = FileStabilizer(settle_time=60, empty_timeout=0.05)
+    for path in (empty, deleted):
+        lifecycle.record("detected", str(path))
+        stabilizer.track(str(path))
+    stabilizer.poll()
+    deleted.unlink()
+    time.sleep(0.1)
+    assert stabilizer.poll() == []
+
+    lifecycle._flush()
+    assert lifecycle._detected == {}
+    assert 'picoprobe_files_total{stage="expired"} 2' in lifecycle.openmetrics()
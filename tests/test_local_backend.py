@@ -0,0 +1,22 @@
+from pathlib import Path
+
+from picoprobe.flows import (
+    PicoProbeMetadataFlow_Production_v5,
+    PicoProbeTemporalImaging_Production_v2,
+)
+from picoprobe.local_backend import LocalBackend
+
+
+def test_flow_id_is_stable_across_restarts(tmp_path: Path) -> None:
+    flow_id = LocalBackend(tmp_path).client(PicoProbeMetadataFlow_Production_v5).flow_id
+    restarted = LocalBackend(tmp_path)
+    assert restarted.client(PicoProbeMetadataFlow_Production_v5).flow_id == flow_id
+    # The flow is only recorded once
+    assert len((tmp_path / "flows.jsonl").read_text().splitlines()) == 1
+
+
+def test_flow_id_depends_on_definition(tmp_path: Path) -> None:
+    backend = LocalBackend(tmp_path)
+    hyperspectral = backend.client(PicoProbeMetadataFlow_Production_v5)
+    temporal = backend.client(PicoProbeTemporalImaging_Production_v2)
+    assert hyperspectral.flow_id != temporal.flow_id
@@ -0,0 +1,160 @@
+import os
+from pathlib import Path
+from typing import Any, List, Tuple
+
+import pytest
+from watchdog.events import FileSystemEvent, FileSystemEventHandler
+
+from picoprobe import utils
+from picoprobe.utils import IncrementalPollingObserver
+
+
+class _Recorder(FileSystemEventHandler):
+    def __init__(self) -> None:
+        self.events: List[Tuple[str, str]] = []
+
+    def on_any_event(self, event: FileSystemEvent) -> None:
+        self.events.append((event.event_type, event.src_path))
+
+
+def _observer(root: Path) -> Tuple[IncrementalPollingObserver, _Recorder]:
+    """Return an observer of `root` that has taken its initial snapshot."""
+    recorder = _Recorder()
+    # Directory times have a nanosecond resolution on the test file systems
+    observer = IncrementalPollingObserver(mtime_resolution=0)
+    observer.schedule(recorder, root)
+    observer._scan_tree(str(root), emit=False)
+    return observer, recorder
+
+
+def _touch_dir(path: Path, seconds: int) -> None:
+    """Move the modification time of the directory `seconds` into the past."""
+    stat = os.stat(path)
+    mtime_ns = stat.st_mtime_ns - seconds * 10**9
+    os.utime(path, ns=(stat.st_atime_ns, mtime_ns))
+
+
+@pytest.fixture
+def listed(monkeypatch: pytest.MonkeyPatch) -> List[str]:
+    """The directories listed by the observer."""
+    paths: List[str] = []
+    scandir = os.scandir
+
+    def recording_scandir(path: Any) -> Any:
+        paths.append(os.fspath(path))
+        return scandir(path)
+
+    monkeypatch.setattr(utils.os, "scandir", recording_scandir)
+    return paths
+
+
+def test_existing_files_are_not_reported(tmp_path: Path) -> None:
+    (tmp_path / "a.emd").write_bytes(b"data")
+    observer, recorder = _observer(tmp_path)
+    assert not observer._poll(full_scan=False)
+    assert recorder.events == []
+
+
+def test_file_events(tmp_path: Path) -> None:
+    (tmp_path / "old.emd").write_bytes(b"data")
+    (tmp_path / "kept.emd").write_bytes(b"data")
+    observer, recorder = _observer(tmp_path)
+
+    (tmp_path / "new.emd").write_bytes(b"data")
+    (tmp_path / "old.emd").rename(tmp_path / "renamed.emd")
+    assert observer._poll(full_scan=False)
+    assert sorted(recorder.events) == [
+        ("created", str(tmp_path / "new.emd")),
+        ("created", str(tmp_path / "renamed.emd")),
+        ("deleted", str(tmp_path / "old.emd")),
+    ]
+
+    # Nothing changed since the last poll
+    recorder.events.clear()
+    assert not observer._poll(full_scan=False)
+    assert recorder.events == []
+
+
+def test_only_changed_directories_are_listed(tmp_path: Path, listed: List[str]) -> None:
+    for name in ("a", "b", "c"):
+        (tmp_path / name).mkdir()
+        (tmp_path / name / "old.emd").write_bytes(b"data")
+    observer, recorder = _observer(tmp_path)
+    listed.clear()
+
+    (tmp_path / "b" / "new.emd").write_bytes(b"data")
+    assert observer._poll(full_scan=False)
+    assert listed == [str(tmp_path / "b")]
+    assert recorder.events == [("created", str(tmp_path / "b" / "new.emd"))]
+
+    # A full scan lists every directory again
+    listed.clear()
+    assert not observer._poll(full_scan=True)
+    assert sorted(listed) == sorted(
+        str(path) for path in (tmp_path, tmp_path / "a", tmp_path / "b", tmp_path / "c")
+    )
+
+
+def test_recently_modified_directories_are_listed_again(
+    tmp_path: Path, listed: List[str]
+) -> None:
+    (tmp_path / "a").mkdir()
+    _touch_dir(tmp_path, 120)
+    observer, _ = _observer(tmp_path)
+    observer.mtime_resolution = 60
+    listed.clear()
+
+    # Changes within the timestamp resolution may not change the directory time
+    observer._poll(full_scan=False)
+    assert listed == [str(tmp_path / "a")]
+
+
+def test_directory_events(tmp_path: Path) -> None:
+    (tmp_path / "old").mkdir()
+    (tmp_path / "old" / "a.emd").write_bytes(b"data")
+    observer, recorder = _observer(tmp_path)
+
+    (tmp_path / "new" / "sub").mkdir(parents=True)
+    (tmp_path / "new" / "sub" / "b.emd").write_bytes(b"data")
+    (tmp_path / "old" / "a.emd").unlink()
+    (tmp_path / "old").rmdir()
+    assert observer._poll(full_scan=False)
+
+    # Files in new directories are reported, and those of removed ones deleted
+    assert sorted(recorder.events) == [
+        ("created", str(tmp_path / "new")),
+        ("created", str(tmp_path / "new" / "sub")),
+        ("created", str(tmp_path / "new" / "sub" / "b.emd")),
+        ("deleted", str(tmp_path / "old")),
+        ("deleted", str(tmp_path / "old" / "a.emd")),
+    ]
+
+
+class _Stop:
+    """Stand-in for the stop event, recording the poll intervals."""
+
+    def __init__(self, polls: int) -> None:
+        self.polls = polls
+        self.intervals: List[float] = []
+
+    def wait(self, timeout: float) -> bool:
+        self.intervals.append(timeout)
+        return len(self.intervals) > self.polls
+
+    def set(self) -> None:
+        pass
+
+
+def test_interval_adapts_to_activity(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    changes = [False, False, False, True, False]
+    observer = IncrementalPollingObserver(min_interval=1, max_interval=4)
+    observer.schedule(_Recorder(), tmp_path)
+    stop = _Stop(len(changes))
+    monkeypatch.setattr(observer, "_stopped", stop)
+    monkeypatch.setattr(observer, "_poll", lambda full_scan: changes.pop(0))
+
+    observer.run()
+    # The interval doubles while idle and resets on changes
+    assert stop.intervals == [1, 2, 4, 4, 1, 2]
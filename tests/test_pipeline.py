@@ -0,0 +1,168 @@
+import threading
+from typing import Any, Callable, Iterator, List
+
+import pytest
+
+from picoprobe.tools.pipeline import Pipeline, StageStats
+
+
+def _run(pipeline: Pipeline, timeout: float = 10) -> Any:
+    """Run the pipeline in a thread, failing the test if it does not finish."""
+    outcome: List[Any] = []
+
+    def target() -> None:
+        try:
+            outcome.append(pipeline.run())
+        except BaseException as e:
+            outcome.append(e)
+
+    thread = threading.Thread(target=target, daemon=True)
+    thread.start()
+    thread.join(timeout)
+    assert not thread.is_alive(), "The pipeline is deadlocked"
+    return outcome[0]
+
+
+def _collect(items: List[Any]) -> Callable[[Iterator[Any]], None]:
+    def sink(inputs: Iterator[Any]) -> None:
+        items.extend(inputs)
+
+    return sink
+
+
+def _double(inputs: Iterator[List[int]]) -> Iterator[List[int]]:
+    for item in inputs:
+        yield [2 * value for value in item]
+
+
+def test_items_flow_through_the_stages_in_order() -> None:
+    doubled: List[Any] = []
+    copies: List[Any] = []
+    pipeline = Pipeline(queue_size=2)
+    pipeline.add_source("read", ([i] * (i % 3 + 1) for i in range(20)))
+    pipeline.add_stage("double", _double, upstream="read")
+    pipeline.add_stage("collect", _collect(doubled), upstream="double")
+    # Stages feeding several stages send every item to each
+    pipeline.add_stage("copy", _collect(copies), upstream="read")
+    stats = _run(pipeline)
+
+    assert doubled == [[2 * i] * (i % 3 + 1) for i in range(20)]
+    assert copies == [[i] * (i % 3 + 1) for i in range(20)]
+    assert all(isinstance(s, StageStats) for s in stats.values())
+    # The items and units (by default their length) are counted
+    units = sum(i % 3 + 1 for i in range(20))
+    for name in ("read", "double", "collect", "copy"):
+        assert (stats[name].items, stats[name].units) == (20, units)
+
+
+def test_invalid_stages() -> None:
+    pipeline = Pipeline()
+    pipeline.add_source("read", [])
+    with pytest.raises(ValueError, match="Unknown upstream"):
+        pipeline.add_stage("double", _double, upstream="write")
+    with pytest.raises(ValueError, match="Duplicate"):
+        pipeline.add_stage("read", _double, upstream="read")
+
+
+def test_empty_source() -> None:
+    items: List[Any] = []
+    pipeline = Pipeline()
+    pipeline.add_source("read", [])
+    pipeline.add_stage("double", _double, upstream="read")
+    pipeline.add_stage("collect", _collect(items), upstream="double")
+    stats = _run(pipeline)
+    assert items == []
+    assert stats["collect"].items == 0
+
+
+def _failing_stage(after: int) -> Callable[[Iterator[Any]], Iterator[Any]]:
+    def stage(inputs: Iterator[Any]) -> Iterator[Any]:
+        for i, item in enumerate(inputs):
+            if i == after:
+                raise RuntimeError("Stage failed")
+            yield item
+
+    return stage
+
+
+@pytest.mark.parametrize("after", [0, 5])
+def test_failing_stage_does_not_block_its_upstream(after: int) -> None:
+    produced: List[int] = []
+
+    def source() -> Iterator[List[int]]:
+        for i in range(10_000):
+            produced.append(i)
+            yield [i]
+
+    pipeline = Pipeline(queue_size=1)
+    pipeline.add_source("read", source())
+    pipeline.add_stage("fail", _failing_stage(after), upstream="read")
+    pipeline.add_stage("collect", _collect([]), upstream="fail")
+    pipeline.add_stage("copy", _collect([]), upstream="read")
+
+    error = _run(pipeline)
+    assert isinstance(error, RuntimeError)
+    # The other stages are stopped
+    assert len(produced) < 10_000
+
+
+def test_failing_source_stops_the_pipeline() -> None:
+    def source() -> Iterator[List[int]]:
+        yield [1]
+        raise OSError("Unreadable file")
+
+    items: List[Any] = []
+    pipeline = Pipeline()
+    pipeline.add_source("read", source())
+    pipeline.add_stage("double", _double, upstream="read")
+    pipeline.add_stage("collect", _collect(items), upstream="double")
+    assert isinstance(_run(pipeline), OSError)
+
+
+def test_stages_may_stop_consuming_early() -> None:
+    def first(inputs: Iterator[Any]) -> Iterator[Any]:
+        yield next(inputs)
+
+    items: List[Any] = []
+    pipeline = Pipeline(queue_size=1)
+    pipeline.add_source("read", ([i] for i in range(100)))
+    pipeline.add_stage("first", first, upstream="read")
+    pipeline.add_stage("collect", _collect(items), upstream="first")
+    stats = _run(pipeline)
+    assert items == [[0]]
+    assert stats["read"].items == 100
+
+
+def test_full_queues_block_the_producer() -> None:
+    produced: List[int] = []
+    consumed: List[Any] = []
+    release = threading.Event()
+
+    def source() -> Iterator[List[int]]:
+        for i in range(100):
+            produced.append(i)
+            yield [i]
+
+    def slow_sink(inputs: Iterator[Any]) -> None:
+        for item in inputs:
+            release.wait(10)
+            consumed.append(item)
+
+    pipeline = Pipeline(queue_size=2)
+    pipeline.add_source("read", source())
+    pipeline.add_stage("slow", slow_sink, upstream="read")
+    thread = threading.Thread(target=pipeline.run, daemon=True)
+    thread.start()
+    try:
+        # Wait for the source to fill the queue
+        while pipeline.stages["slow"].inbox.qsize() < 2:  # type: ignore[union-attr]
+            threading.Event().wait(0.01)
+        threading.Event().wait(0.2)
+        # One item is consumed, two are queued and one waits to be queued
+        assert len(produced) == 4
+        assert consumed == []
+    finally:
+        release.set()
+        thread.join(10)
+    assert len(consumed) == 100
+    assert pipeline.stages["read"].stats.wait_output > 0
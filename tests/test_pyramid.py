@@ -0,0 +1,89 @@
+import json
+import zlib
+from pathlib import Path
+from typing import List
+
+import numpy as np
+import pytest
+
+from picoprobe.tools.pyramid import SpectrumImagePyramid, write_image_pyramid
+from picoprobe.tools.streaming import reduce_spectrum_image
+
+
+def _read_array(path: Path) -> np.ndarray:
+    """Read a Zarr (v2) array written by `ZarrArrayWriter`, one chunk at a time."""
+    meta = json.loads((path / ".zarray").read_text())
+    shape, chunks = meta["shape"], meta["chunks"]
+    dtype = np.dtype(meta["dtype"])
+    assert meta["compressor"]["id"] == "zlib"
+
+    grid = [-(-n // c) for n, c in zip(shape, chunks)]
+    padded = np.zeros([g * c for g, c in zip(grid, chunks)], dtype=dtype)
+    for index in np.ndindex(*grid):
+        raw = zlib.decompress((path / ".".join(map(str, index))).read_bytes())
+        chunk = np.frombuffer(raw, dtype=dtype).reshape(chunks)
+        padded[tuple(slice(i * c, (i + 1) * c) for i, c in zip(index, chunks))] = chunk
+    return padded[tuple(slice(0, n) for n in shape)]
+
+
+def _bin2x2(data: np.ndarray) -> np.ndarray:
+    """Reference 2x2 binning, padding odd axes with zeros."""
+    y, x = data.shape[:2]
+    padded = np.zeros((y + y % 2, x + x % 2) + data.shape[2:], dtype=np.int64)
+    padded[:y, :x] = data
+    return (
+        padded[0::2, 0::2]
+        + padded[1::2, 0::2]
+        + padded[0::2, 1::2]
+        + padded[1::2, 1::2]
+    )
+
+
+def _levels(path: Path) -> List[str]:
+    attrs = json.loads((path / ".zattrs").read_text())
+    return [d["path"] for d in attrs["multiscales"][0]["datasets"]]
+
+
+@pytest.mark.parametrize("max_block_bytes", [1, 10_000])
+def test_cube_pyramid_round_trip(tmp_path: Path, max_block_bytes: int) -> None:
+    data = np.random.default_rng(0).poisson(5.0, size=(13, 9, 16)).astype(np.uint16)
+    pyramid = SpectrumImagePyramid(tmp_path / "a.zarr", chunks=(4, 4, 8))
+    reduce_spectrum_image(data, [pyramid], max_block_bytes)
+    path = pyramid.result()
+
+    cube = path / "cube"
+    levels = _levels(cube)
+    # 13x9 -> 7x5 -> 4x3 (fits in a chunk)
+    assert levels == ["0", "1", "2"]
+
+    expected = data.astype(np.int64)
+    for level in levels:
+        level_data = _read_array(cube / level)
+        np.testing.assert_array_equal(level_data, expected)
+        # Binning preserves the counts
+        assert level_data.sum() == data.sum(dtype=np.int64)
+        expected = _bin2x2(expected)
+    assert _read_array(cube / "0").dtype == np.uint16
+    assert _read_array(cube / "1").dtype == np.uint32
+
+
+def test_image_pyramid_round_trip(tmp_path: Path) -> None:
+    image = np.arange(11 * 6, dtype=np.float64).reshape(11, 6)
+    path = write_image_pyramid(image, tmp_path / "a.zarr", chunks=(4, 4))
+
+    expected = image
+    for level in _levels(path / "image"):
+        np.testing.assert_allclose(_read_array(path / "image" / level), expected)
+        expected = _bin2x2(expected.astype(np.int64)).astype(np.float64)
+
+
+def test_zarr_reads_pyramid(tmp_path: Path) -> None:
+    zarr = pytest.importorskip("zarr")
+    data = np.random.default_rng(0).poisson(5.0, size=(10, 7, 12)).astype(np.uint16)
+    pyramid = SpectrumImagePyramid(tmp_path / "a.zarr", chunks=(4, 4, 8))
+    reduce_spectrum_image(data, [pyramid])
+    pyramid.result()
+
+    store = zarr.open(str(tmp_path / "a.zarr"), mode="r")
+    np.testing.assert_array_equal(store["cube/0"][:], data)
+    assert store["cube/1"][:].sum() == data.sum(dtype=np.int64)
@@ -0,0 +1,87 @@
+from pathlib import Path
+from typing import Tuple
+
+import imageio.v3 as iio
+import numpy as np
+import pytest
+
+from picoprobe.tools.rendering import (
+    colormap_lut,
+    downsample,
+    render_image,
+    scale_to_uint8,
+    write_png,
+)
+
+
+def test_colormap_lut() -> None:
+    lut = colormap_lut("gray")
+    assert lut.shape == (256, 3)
+    assert lut.dtype == np.uint8
+    np.testing.assert_array_equal(lut[:, 0], np.arange(256))
+    # The tables are cached and read-only
+    assert colormap_lut("gray") is lut
+    assert not lut.flags.writeable
+    assert colormap_lut("gray", 16).shape == (16, 3)
+
+
+def test_scale_to_uint8() -> None:
+    image = np.array([[0.0, 1.0], [2.0, np.nan]])
+    np.testing.assert_array_equal(scale_to_uint8(image), [[0, 128], [255, 0]])
+    # Values outside the given range are clipped
+    np.testing.assert_array_equal(
+        scale_to_uint8(image, vmin=1.0, vmax=1.5), [[0, 0], [255, 0]]
+    )
+
+
+@pytest.mark.parametrize("value", [0.0, 7.0, np.nan])
+def test_flat_images_are_scaled_to_zero(value: float) -> None:
+    scaled = scale_to_uint8(np.full((3, 4), value))
+    np.testing.assert_array_equal(scaled, np.zeros((3, 4), dtype=np.uint8))
+
+
+def test_downsample() -> None:
+    image = np.arange(16, dtype=np.float32).reshape(4, 4)
+    np.testing.assert_array_equal(downsample(image, 4), image)
+    np.testing.assert_array_equal(downsample(image, 2), [[2.5, 4.5], [10.5, 12.5]])
+
+    # The longest side is at most `max_size`, and the remainder is cropped
+    assert downsample(np.zeros((1000, 300)), 256).shape == (250, 75)
+    # Very elongated images are subsampled
+    assert downsample(np.zeros((1, 1000)), 256).shape == (1, 250)
+
+
+@pytest.mark.parametrize("shape", [(5, 7, 3), (5, 7)])
+def test_png_round_trip(tmp_path: Path, shape: Tuple[int, ...]) -> None:
+    pixels = np.random.default_rng(0).integers(0, 256, size=shape, dtype=np.uint8)
+    write_png(tmp_path / "image.png", pixels)
+    np.testing.assert_array_equal(iio.imread(tmp_path / "image.png"), pixels)
+
+
+def test_render_image_with_thumbnail(tmp_path: Path) -> None:
+    image = np.zeros((600, 400), dtype=np.float32)
+    image[:300] = 10.0
+    savefile, thumbnail = render_image(
+        image, tmp_path / "map.png", cmap="gray", thumbnail=tmp_path / "map.thumb.png"
+    )
+    assert savefile == tmp_path / "map.png"
+    assert thumbnail == tmp_path / "map.thumb.png"
+
+    full = iio.imread(savefile)
+    assert full.shape == (600, 400, 3)
+    np.testing.assert_array_equal(full[0, 0], [255, 255, 255])
+    np.testing.assert_array_equal(full[-1, -1], [0, 0, 0])
+
+    # The thumbnail keeps the intensity range of the full image
+    small = iio.imread(thumbnail)
+    assert small.shape == (200, 133, 3)
+    np.testing.assert_array_equal(small[0, 0], [255, 255, 255])
+    np.testing.assert_array_equal(small[-1, -1], [0, 0, 0])
+
+
+def test_render_flat_image(tmp_path: Path) -> None:
+    savefile, thumbnail = render_image(np.ones((4, 4)), tmp_path / "flat.png")
+    assert thumbnail is None
+    lut = colormap_lut("Blues_r")
+    rgb = iio.imread(savefile)
+    assert (rgb == lut[0]).all()
@@ -0,0 +1,189 @@
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Sequence
+
+import h5py
+import numpy as np
+import pytest
+
+from picoprobe import router
+from picoprobe.router import FlowRouter
+from picoprobe.utils import (
+    BaseFlowHandler,
+    FileLifecycle,
+    FlowInputType,
+    SQLiteCheckPoint,
+)
+
+
+class _Submitter:
+    """Submitter shared by the handlers, recording the files of each flow run."""
+
+    def __init__(self) -> None:
+        self.runs: List[List[str]] = []
+        self.shutdowns = 0
+
+    def reserve(self) -> bool:
+        return True
+
+    def submit(
+        self,
+        flow_client: Any,
+        flow_input: FlowInputType,
+        run_label: str = "Run",
+        checkpoint: Any = None,
+        events: Sequence[str] = (),
+        paths: Sequence[str] = (),
+    ) -> None:
+        self.runs.append(list(paths))
+
+    def shutdown(self) -> None:
+        self.shutdowns += 1
+
+
+class _Handler(BaseFlowHandler):
+    def __init__(self, checkpoint_file: Path, submitter: _Submitter) -> None:
+        self.received: List[str] = []
+        super().__init__(
+            flow_client=None,
+            checkpoint=SQLiteCheckPoint(checkpoint_file),
+            submitter=submitter,  # type: ignore[arg-type]
+            fingerprint="path",
+        )
+
+    def create_flow_input(self, src_paths: List[str]) -> FlowInputType:
+        return {"input": {"num_files": len(src_paths)}}
+
+    def on_file_ready(self, src_path: str) -> None:
+        self.received.append(src_path)
+        super().on_file_ready(src_path)
+
+
+@pytest.fixture
+def submitter() -> _Submitter:
+    return _Submitter()
+
+
+@pytest.fixture
+def handlers(tmp_path: Path, submitter: _Submitter) -> Dict[str, _Handler]:
+    names = ("images", "spectra", "large", "other")
+    return {name: _Handler(tmp_path / f"{name}.db", submitter) for name in names}
+
+
+@pytest.fixture
+def lifecycle(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> Iterator[FileLifecycle]:
+    recorder = FileLifecycle()
+    recorder.configure(tmp_path / "events.jsonl", export_interval=3600)
+    monkeypatch.setattr(router, "lifecycle", recorder)
+    yield recorder
+    recorder.close()
+
+
+def _velox_file(path: Path, group_type: str, shape: Sequence[int]) -> str:
+    """Write a Velox-like EMD file holding a single signal."""
+    with h5py.File(path, "w") as f:
+        group = f.create_group(f"Data/{group_type}/0123")
+        group.create_dataset("Data", data=np.zeros(shape, dtype=np.uint16))
+    return str(path)
+
+
+def _file(path: Path, size: int) -> str:
+    path.write_bytes(b"\0" * size)
+    return str(path)
+
+
+def test_files_are_routed_by_pattern_and_size(
+    tmp_path: Path, handlers: Dict[str, _Handler]
+) -> None:
+    flow_router = FlowRouter()
+    flow_router.add_route(handlers["large"], pattern="*.emd", min_size=100)
+    flow_router.add_route(handlers["images"], pattern="*.emd", max_size=10)
+    flow_router.add_route(handlers["other"])
+
+    large = _file(tmp_path / "large.emd", 100)
+    small = _file(tmp_path / "small.emd", 10)
+    medium = _file(tmp_path / "medium.emd", 50)
+    text = _file(tmp_path / "notes.txt", 1000)
+    assert flow_router.route(large) is handlers["large"]
+    assert flow_router.route(small) is handlers["images"]
+    # Files matching no size bound and other names go to the catch-all route
+    assert flow_router.route(medium) is handlers["other"]
+    assert flow_router.route(text) is handlers["other"]
+
+
+def test_first_matching_route_wins(
+    tmp_path: Path, handlers: Dict[str, _Handler]
+) -> None:
+    flow_router = FlowRouter()
+    flow_router.add_route(handlers["images"], pattern="*.emd")
+    flow_router.add_route(handlers["other"], pattern="a*")
+
+    path = _file(tmp_path / "a.emd", 1)
+    assert flow_router.route(path) is handlers["images"]
+    assert flow_router.route(_file(tmp_path / "a.txt", 1)) is handlers["other"]
+
+
+def test_files_are_routed_by_signal(
+    tmp_path: Path, handlers: Dict[str, _Handler]
+) -> None:
+    flow_router = FlowRouter()
+    flow_router.add_route(handlers["spectra"], signal="spectrum_image")
+    flow_router.add_route(handlers["images"], signal="time_series")
+
+    spectrum_image = _velox_file(tmp_path / "si.emd", "SpectrumImage", (4, 4, 16))
+    stack = _velox_file(tmp_path / "stack.emd", "Image", (8, 8, 4))
+    image = _velox_file(tmp_path / "image.emd", "Image", (8, 8, 1))
+    assert flow_router.route(spectrum_image) is handlers["spectra"]
+    assert flow_router.route(stack) is handlers["images"]
+    assert flow_router.route(image) is None
+
+    # Files which are not HDF5 have no signal type
+    assert flow_router.route(_file(tmp_path / "broken.emd", 10)) is None
+
+
+def test_unmatched_files_are_skipped(
+    tmp_path: Path,
+    handlers: Dict[str, _Handler],
+    submitter: _Submitter,
+    lifecycle: FileLifecycle,
+) -> None:
+    flow_router = FlowRouter()
+    flow_router.add_route(handlers["images"], pattern="*.emd")
+
+    path = _file(tmp_path / "notes.txt", 1)
+    flow_router.on_file_ready(path)
+    flow_router.on_file_ready(str(tmp_path / "deleted.emd"))
+    assert handlers["images"].received == []
+    assert submitter.runs == []
+
+    lifecycle._flush()
+    metrics = lifecycle.openmetrics()
+    assert f'picoprobe_files_total{{stage="{FileLifecycle.SKIPPED}"}} 1' in metrics
+    assert f'picoprobe_files_total{{stage="{FileLifecycle.FAILED}"}} 1' in metrics
+
+
+def test_handlers_share_the_submitter(
+    tmp_path: Path, handlers: Dict[str, _Handler], submitter: _Submitter
+) -> None:
+    flow_router = FlowRouter()
+    flow_router.add_route(handlers["large"], min_size=100)
+    flow_router.add_route(handlers["images"], pattern="*.emd")
+    flow_router.add_route(handlers["images"], pattern="*.tif")
+    assert flow_router.handlers == [handlers["large"], handlers["images"]]
+
+    large = _file(tmp_path / "large.emd", 100)
+    small = _file(tmp_path / "small.emd", 1)
+    tif = _file(tmp_path / "small.tif", 1)
+    for path in (large, small, tif):
+        flow_router.on_file_ready(path)
+    assert handlers["large"].received == [large]
+    assert handlers["images"].received == [small, tif]
+    assert submitter.runs == [[large], [small], [tif]]
+
+    # Files already processed by any handler are known to the router
+    assert flow_router.is_known(small, Path(small).stat())
+
+    # Each handler shuts the shared submitter down once the batches are flushed
+    flow_router.shutdown()
+    assert submitter.shutdowns == 2
@@ -0,0 +1,102 @@
+import json
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict
+
+import numpy as np
+
+from picoprobe.tools.serialization import (
+    add_experiments,
+    dumps,
+    to_jsonable,
+    write_sidecar,
+)
+
+
+def test_numpy_values_become_native() -> None:
+    metadata = {
+        "count": np.int64(3),
+        "scale": np.float32(0.5),
+        "flag": np.bool_(True),
+        "offsets": np.array([1, 2, 3], dtype=np.uint16),
+        "nested": {"shape": (np.int32(4), 5)},
+    }
+    converted = to_jsonable(metadata)
+    assert converted == {
+        "count": 3,
+        "scale": 0.5,
+        "flag": True,
+        "offsets": [1, 2, 3],
+        "nested": {"shape": [4, 5]},
+    }
+    assert type(converted["count"]) is int
+    assert type(converted["flag"]) is bool
+    json.dumps(converted)
+
+
+def test_other_values() -> None:
+    started = datetime(2023, 7, 22, 4, 26, 40)
+    converted = to_jsonable(
+        {1: float("nan"), "inf": np.float64(np.inf), "raw": b"EDS", "t": started}
+    )
+    assert converted == {"1": None, "inf": None, "raw": "EDS", "t": started.isoformat()}
+    assert to_jsonable(Path("a.emd")) == "a.emd"
+
+
+def test_large_arrays_are_summarized(tmp_path: Path) -> None:
+    table = np.arange(100, dtype=np.float64)
+    table[0] = np.nan
+    metadata = {"Signal": {"calibration": table, "labels": ["a"] * 100}}
+    arrays: Dict[str, np.ndarray] = {}
+    converted = to_jsonable(metadata, max_array_size=10, arrays=arrays)
+
+    summary = converted["Signal"]["calibration"]
+    assert summary["shape"] == [100]
+    assert summary["dtype"] == "float64"
+    # The summary statistics ignore the non-finite values
+    assert summary["min"] == 1.0
+    assert summary["max"] == 99.0
+    assert summary["sidecar_key"] == "Signal.calibration"
+    # Lists of strings are kept
+    assert converted["Signal"]["labels"] == ["a"] * 100
+
+    sidecar = write_sidecar(arrays, tmp_path / "metadata.npz")
+    assert sidecar is not None
+    with np.load(sidecar) as saved:
+        np.testing.assert_array_equal(saved["Signal.calibration"], table)
+
+
+def test_no_sidecar_without_arrays(tmp_path: Path) -> None:
+    assert write_sidecar({}, tmp_path / "metadata.npz") is None
+    assert not (tmp_path / "metadata.npz").exists()
+
+
+def test_dumps_is_compact_by_default() -> None:
+    assert dumps({"a": [1, 2]}) == '{"a":[1,2]}'
+    assert dumps({"a": 1}, indent=2) == '{\n  "a": 1\n}'
+
+
+def test_first_experiment_is_published_once() -> None:
+    metadata: Dict[str, Any] = {}
+    experiments = [
+        {"experiment_file": "a.emd", "experiment_metadata": {"General": {}}},
+        {"experiment_file": "b.emd", "experiment_metadata": {"Signal": {}}},
+    ]
+    add_experiments(metadata, experiments, ["experiment_metadata"])
+
+    assert metadata["experiment_metadata"] == {"General": {}}
+    assert metadata["experiments"] == [
+        {"experiment_file": "a.emd"},
+        {"experiment_file": "b.emd", "experiment_metadata": {"Signal": {}}},
+    ]
+
+
+def test_ragged_lists_are_converted_element_wise() -> None:
+    ragged = [[i] * (i % 3) for i in range(65)]
+    mixed = [1, "a", [2, 3]] * 30
+    converted = to_jsonable({"ragged": ragged, "mixed": mixed}, max_array_size=64)
+    assert converted == {"ragged": ragged, "mixed": mixed}
+
+    # Long lists of strings are not summarized
+    labels = [f"label{i}" for i in range(100)]
+    assert to_jsonable(labels, max_array_size=10) == labels
@@ -0,0 +1,38 @@
+import time
+from pathlib import Path
+
+from picoprobe.simulator import CheckpointMonitor, FileRecord
+from picoprobe.utils import CheckPoint, SQLiteCheckPoint
+
+
+def test_monitor_matches_exact_path(tmp_path: Path) -> None:
+    checkpoint = SQLiteCheckPoint(tmp_path / "checkpoint.db")
+    record = FileRecord(0, tmp_path / "data" / "a_1.emd")
+    # "_" must not match any character, and other directories must not match
+    checkpoint.seen("axb", str(tmp_path / "data" / "ax1.emd"))
+    checkpoint.seen("other", str(tmp_path / "other" / "a_1.emd.bak"))
+
+    monitor = CheckpointMonitor(tmp_path / "checkpoint.db")
+    monitor.update(record)
+    assert record.ready is None
+
+    checkpoint.seen("a", str(record.path))
+    checkpoint.set_state(["a"], CheckPoint.SUBMITTED, "run-1")
+    monitor.update(record)
+    assert record.ready is not None
+    assert record.submitted is not None
+    monitor.close()
+
+
+def test_monitor_ignores_previous_runs(tmp_path: Path) -> None:
+    checkpoint = SQLiteCheckPoint(tmp_path / "checkpoint.db")
+    path = tmp_path / "a.emd"
+    checkpoint.seen("old", str(path))
+    time.sleep(0.01)
+
+    # A new file reusing the name of a file seen before the write started
+    record = FileRecord(0, path)
+    monitor = CheckpointMonitor(tmp_path / "checkpoint.db")
+    monitor.update(record)
+    assert record.ready is None
+    monitor.close()
@@ -0,0 +1,138 @@
+from pathlib import Path
+from typing import Any, Dict, Iterator, Tuple
+
+import h5py
+import imageio.v3 as iio
+import numpy as np
+import pytest
+
+from picoprobe.tools import spectrum_image
+from picoprobe.tools.spectrum_image import (
+    energy_axis,
+    energy_windows,
+    load_hyperspectral_image,
+    save_element_maps,
+    xray_line_window,
+)
+
+# The window of the Fe Ka line (6.404 keV) with a 130 eV resolution
+FE_KA = (6.2691, 6.5387)
+
+
+class _Metadata:
+    def as_dictionary(self) -> Dict[str, Any]:
+        return {"Signal": {"signal_type": "EDS_TEM"}}
+
+
+class _Signal:
+    """Stand-in for the lazy HyperSpy signal of the spectrum image."""
+
+    def __init__(self, data: Any) -> None:
+        self.data = data
+        self.metadata = _Metadata()
+
+
+def _xray_line_window(line: str, resolution: float = 130.0) -> Tuple[float, float]:
+    """The X-ray line lookup, without the HyperSpy database of elements."""
+    if line != "Fe_Ka":
+        raise ValueError(f"Unknown X-ray line: {line}")
+    return FE_KA
+
+
+@pytest.fixture
+def experiment_file(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> Iterator[Tuple[Path, np.ndarray]]:
+    """A Velox-like EMD file with a (6, 5, 2048) spectrum image, and its data."""
+    path = tmp_path / "experiment.emd"
+    data = np.random.default_rng(0).poisson(3.0, size=(6, 5, 2048)).astype(np.uint16)
+    with h5py.File(path, "w") as f:
+        group = f.create_group("Data/SpectrumImage/0123")
+        group.create_dataset("Data", data=data, chunks=(2, 5, 2048))
+
+    # Loading the signal with HyperSpy is covered by test_streaming
+    with h5py.File(path, "r") as f:
+        dataset = f["Data/SpectrumImage/0123/Data"]
+        monkeypatch.setattr(
+            spectrum_image, "open_spectrum_image", lambda path: _Signal(dataset)
+        )
+        monkeypatch.setattr(spectrum_image, "xray_line_window", _xray_line_window)
+        yield path, data
+
+
+def test_xray_line_window() -> None:
+    pytest.importorskip("hyperspy.api")
+    assert xray_line_window("Fe_Ka") == pytest.approx(FE_KA, abs=1e-3)
+    # The lines are broader at higher energies
+    low, high = xray_line_window("Cu_Ka")
+    assert high - low > FE_KA[1] - FE_KA[0]
+    for line in ("Xx_Ka", "Fe_Zz", "Fe"):
+        with pytest.raises(ValueError, match="Unknown X-ray line"):
+            xray_line_window(line)
+
+
+def test_energy_windows(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(spectrum_image, "xray_line_window", _xray_line_window)
+    energy = energy_axis(2048)
+    channels = energy_windows(["Fe_Ka", [1.0, 1.5], (2, 1)], energy)
+    assert list(channels) == ["Fe_Ka", "1-1.5keV", "2-1keV"]
+
+    # Each window covers the channels with energies within its bounds
+    for (low, high), label in ((FE_KA, "Fe_Ka"), ((1.0, 1.5), "1-1.5keV")):
+        start, stop = channels[label]
+        assert energy[start - 1] < low <= energy[start]
+        assert energy[stop - 1] <= high < energy[stop]
+    # Inverted windows are empty
+    start, stop = channels["2-1keV"]
+    assert start == stop
+
+    with pytest.raises(ValueError, match="Unknown X-ray line"):
+        energy_windows(["Xx_Ka"], energy)
+
+
+def test_element_maps(experiment_file: Tuple[Path, np.ndarray]) -> None:
+    path, data = experiment_file
+    image, spectrum, energy, element_maps, metadata = load_hyperspectral_image(
+        path, windows=["Fe_Ka", [1.0, 1.5]]
+    )
+    expected = data.astype(np.int64)
+    np.testing.assert_array_equal(image, expected.sum(axis=2))
+    np.testing.assert_array_equal(spectrum, expected.sum(axis=(0, 1)))
+    assert metadata["Signal"]["signal_type"] == "EDS_TEM"
+
+    # The maps integrate the channels of each window
+    assert list(element_maps) == ["Fe_Ka", "1-1.5keV"]
+    in_window = (energy >= FE_KA[0]) & (energy <= FE_KA[1])
+    np.testing.assert_array_equal(
+        element_maps["Fe_Ka"], expected[:, :, in_window].sum(axis=2)
+    )
+    in_window = (energy >= 1.0) & (energy <= 1.5)
+    np.testing.assert_array_equal(
+        element_maps["1-1.5keV"], expected[:, :, in_window].sum(axis=2)
+    )
+
+    files = save_element_maps(path, element_maps)
+    assert files["element_maps"] == {
+        "Fe_Ka": str(path.with_name("experiment.Fe_Ka.png")),
+        "1-1.5keV": str(path.with_name("experiment.1-1.5keV.png")),
+    }
+    for map_file in files["element_maps"].values():
+        assert iio.imread(map_file).shape == (6, 5, 3)
+
+    # The values of the maps are saved with their labels
+    assert files["element_maps_data"] == str(path.with_suffix(".element_maps.npz"))
+    with np.load(files["element_maps_data"]) as saved:
+        assert sorted(saved.files) == ["1-1.5keV", "Fe_Ka"]
+        for label, element_map in element_maps.items():
+            np.testing.assert_array_equal(saved[label], element_map)
+
+
+def test_no_element_maps(experiment_file: Tuple[Path, np.ndarray]) -> None:
+    path, _ = experiment_file
+    *_, element_maps, _ = load_hyperspectral_image(path)
+    assert element_maps == {}
+    assert save_element_maps(path, element_maps) == {
+        "element_maps": {},
+        "element_maps_data": None,
+    }
+    assert not path.with_suffix(".element_maps.npz").exists()
@@ -0,0 +1,129 @@
+import os
+import time
+from pathlib import Path
+from typing import List
+
+from picoprobe.utils import FileStabilizer, StableFileEventHandler
+
+
+def _age(path: Path, seconds: float) -> None:
+    """Set the modification time of `path` to `seconds` ago."""
+    mtime = time.time() - seconds
+    os.utime(path, (mtime, mtime))
+
+
+def test_file_released_after_settle_time(tmp_path: Path) -> None:
+    path = tmp_path / "a.emd"
+    path.write_bytes(b"data")
+    stabilizer = FileStabilizer(settle_time=0.2)
+    stabilizer.track(str(path))
+
+    # The first poll records the size, the file is not settled yet
+    assert stabilizer.poll() == []
+    assert stabilizer.poll() == []
+    time.sleep(0.25)
+    assert stabilizer.poll() == [str(path)]
+    assert len(stabilizer) == 0
+
+
+def test_write_restarts_settle_timer(tmp_path: Path) -> None:
+    path = tmp_path / "a.emd"
+    path.write_bytes(b"data")
+    stabilizer = FileStabilizer(settle_time=0.2)
+    stabilizer.track(str(path))
+    stabilizer.poll()
+
+    time.sleep(0.25)
+    with open(path, "ab") as f:
+        f.write(b"more")
+    assert stabilizer.poll() == []
+    time.sleep(0.25)
+    assert stabilizer.poll() == [str(path)]
+
+
+def test_closed_file_released_on_next_poll(tmp_path: Path) -> None:
+    path = tmp_path / "a.emd"
+    path.write_bytes(b"data")
+    stabilizer = FileStabilizer(settle_time=60)
+    stabilizer.track(str(path))
+    stabilizer.close(str(path))
+
+    assert stabilizer.poll() == []
+    assert stabilizer.poll() == [str(path)]
+
+
+def test_deleted_file_is_discarded(tmp_path: Path) -> None:
+    path = tmp_path / "a.emd"
+    path.write_bytes(b"data")
+    stabilizer = FileStabilizer(settle_time=0)
+    stabilizer.track(str(path))
+    path.unlink()
+
+    assert stabilizer.poll() == []
+    assert len(stabilizer) == 0
+
+
+def test_empty_file_is_not_released(tmp_path: Path) -> None:
+    path = tmp_path / "a.emd"
+    path.touch()
+    stabilizer = FileStabilizer(settle_time=0, empty_timeout=60)
+    stabilizer.track(str(path))
+    stabilizer.close(str(path))
+
+    assert stabilizer.poll() == []
+    assert stabilizer.poll() == []
+    assert len(stabilizer) == 1
+
+    # The writer starts after all
+    path.write_bytes(b"data")
+    stabilizer.poll()
+    assert stabilizer.poll() == [str(path)]
+
+
+def test_empty_file_expires(tmp_path: Path) -> None:
+    path = tmp_path / "a.emd"
+    path.touch()
+    stabilizer = FileStabilizer(settle_time=0, empty_timeout=0.1)
+    stabilizer.track(str(path))
+
+    stabilizer.poll()
+    time.sleep(0.15)
+    assert stabilizer.poll() == []
+    assert len(stabilizer) == 0
+
+
+class _Handler(StableFileEventHandler):
+    def __init__(self) -> None:
+        super().__init__(pattern="*.emd", settle_time=0)
+        self.ready: List[str] = []
+
+    def on_file_ready(self, src_path: str) -> None:
+        if src_path.endswith("bad.emd"):
+            raise OSError("Cannot read file")
+        self.ready.append(src_path)
+
+
+def test_failing_file_does_not_lose_others(tmp_path: Path) -> None:
+    handler = _Handler()
+    paths = [tmp_path / name for name in ("a.emd", "bad.emd", "c.emd")]
+    for path in paths:
+        path.write_bytes(b"data")
+        handler.stabilizer.track(str(path))
+        handler.stabilizer.close(str(path))
+
+    handler.poll()
+    handler.poll()
+    assert sorted(handler.ready) == [str(paths[0]), str(paths[2])]
+
+
+def test_reconcile_backfills_old_files(tmp_path: Path) -> None:
+    handler = _Handler()
+    for name in ("b.emd", "a.emd", "notes.txt"):
+        (tmp_path / name).write_bytes(b"data")
+    _age(tmp_path / "a.emd", 20)
+    _age(tmp_path / "b.emd", 10)
+
+    assert handler.reconcile(tmp_path) == 2
+    handler.poll()
+    # Oldest first, and files not matching the pattern are ignored
+    assert handler.ready == [str(tmp_path / "a.emd"), str(tmp_path / "b.emd")]
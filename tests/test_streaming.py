@@ -0,0 +1,101 @@
+from pathlib import Path
+from typing import Any
+
+import h5py
+import numpy as np
+import pytest
+
+from picoprobe.tools.streaming import (
+    ImageProjection,
+    Reducer,
+    SumSpectrum,
+    WindowMaps,
+    iter_row_blocks,
+    project_spectrum_image,
+    reduce_spectrum_image,
+)
+
+WINDOWS = [(0, 4), (2, 10), (15, 16), (7, 7)]
+
+
+def _spectrum_image(shape: Any = (13, 9, 16), dtype: Any = np.uint16) -> np.ndarray:
+    return np.random.default_rng(0).poisson(50.0, size=shape).astype(dtype)
+
+
+def _check(data: Any, reference: np.ndarray, max_block_bytes: int) -> None:
+    image, spectrum = ImageProjection(), SumSpectrum()
+    maps = WindowMaps(WINDOWS)
+    reduce_spectrum_image(data, [image, spectrum, maps], max_block_bytes)
+
+    expected = reference.astype(np.int64)
+    np.testing.assert_array_equal(image.result(), expected.sum(axis=2))
+    np.testing.assert_array_equal(spectrum.result(), expected.sum(axis=(0, 1)))
+    for window_map, (start, stop) in zip(maps.result(), WINDOWS):
+        np.testing.assert_array_equal(
+            window_map, expected[:, :, start:stop].sum(axis=2)
+        )
+
+
+@pytest.mark.parametrize("max_block_bytes", [1, 1000, 2**30])
+def test_reducers_match_numpy(max_block_bytes: int) -> None:
+    data = _spectrum_image()
+    _check(data, data, max_block_bytes)
+
+
+@pytest.mark.parametrize("chunks", [None, (4, 9, 16), (5, 3, 8)])
+def test_reducers_read_hdf5(tmp_path: Path, chunks: Any) -> None:
+    data = _spectrum_image()
+    with h5py.File(tmp_path / "data.h5", "w") as f:
+        dataset = f.create_dataset("data", data=data, chunks=chunks)
+        _check(dataset, data, max_block_bytes=1000)
+
+
+def test_blocks_are_aligned_to_chunks(tmp_path: Path) -> None:
+    data = _spectrum_image()
+    with h5py.File(tmp_path / "data.h5", "w") as f:
+        dataset = f.create_dataset("data", data=data, chunks=(4, 9, 16))
+        row_bytes = 9 * 16 * 2
+        blocks = [rows for rows, _ in iter_row_blocks(dataset, 9 * row_bytes)]
+    # Two chunks of 4 rows fit in the block, the last block is partial
+    assert blocks == [slice(0, 8), slice(8, 13)]
+
+
+def test_sums_do_not_overflow() -> None:
+    data = np.full((2, 2, 300), 255, dtype=np.uint8)
+    image, spectrum = project_spectrum_image(data)
+    assert image[0, 0] == 255 * 300
+    assert spectrum[0] == 255 * 4
+
+
+def test_window_outside_of_spectrum() -> None:
+    with pytest.raises(ValueError):
+        reduce_spectrum_image(_spectrum_image(), [WindowMaps([(10, 17)])])
+
+
+def test_reducer_requires_update_and_result() -> None:
+    class Incomplete(Reducer):
+        def update(self, rows: slice, block: np.ndarray) -> None:
+            pass
+
+    with pytest.raises(TypeError):
+        Incomplete()  # type: ignore[abstract]
+
+
+def test_reducers_match_hyperspy(tmp_path: Path) -> None:
+    hs = pytest.importorskip("hyperspy.api")
+    data = _spectrum_image((13, 9, 64))
+    hs.signals.Signal1D(data).save(tmp_path / "data.hspy")
+
+    signal = hs.load(tmp_path / "data.hspy", lazy=True)
+    image, spectrum = ImageProjection(), SumSpectrum()
+    maps = WindowMaps([(10, 20)])
+    reduce_spectrum_image(signal.data, [image, spectrum, maps], max_block_bytes=4096)
+
+    signal = hs.load(tmp_path / "data.hspy")
+    signal_axes = signal.axes_manager.signal_axes
+    navigation_axes = signal.axes_manager.navigation_axes
+    np.testing.assert_array_equal(image.result(), signal.sum(signal_axes).data)
+    np.testing.assert_array_equal(spectrum.result(), signal.sum(navigation_axes).data)
+    np.testing.assert_array_equal(
+        maps.result()[0], signal.isig[10:20].sum(signal_axes).data
+    )
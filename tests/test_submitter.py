@@ -0,0 +1,212 @@
+import json
+import time
+from pathlib import Path
+from threading import Event, Lock, Thread
+from typing import Any, Dict, List, Optional, Tuple
+
+import pytest
+
+from picoprobe.utils import FlowSubmitter, TokenBucket
+
+
+def test_bucket_allows_burst() -> None:
+    bucket = TokenBucket(rate=1.0, capacity=3)
+    start = time.monotonic()
+    waited = [bucket.acquire() for _ in range(3)]
+    assert waited == [0.0, 0.0, 0.0]
+    assert time.monotonic() - start < 0.1
+
+
+def test_bucket_refills_at_rate() -> None:
+    bucket = TokenBucket(rate=20.0, capacity=1)
+    bucket.acquire()
+    start = time.monotonic()
+    waited = bucket.acquire()
+    elapsed = time.monotonic() - start
+    # The next token takes 1/20 s to refill
+    assert 0.03 < waited < 0.2
+    assert 0.03 < elapsed < 0.2
+
+
+def test_bucket_adapts_rate() -> None:
+    bucket = TokenBucket(rate=4.0, capacity=1, min_rate=1.0)
+    bucket.decrease()
+    assert bucket.rate == 2.0
+    bucket.decrease()
+    bucket.decrease()
+    assert bucket.rate == 1.0
+
+    # Each success recovers a tenth of the maximum rate
+    bucket.increase()
+    assert bucket.rate == 1.4
+    for _ in range(10):
+        bucket.increase()
+    assert bucket.rate == 4.0
+
+
+class _APIError(Exception):
+    def __init__(self, http_status: int) -> None:
+        super().__init__(f"HTTP {http_status}")
+        self.http_status = http_status
+
+
+class _Client:
+    """Flow client failing with the given errors before starting the runs."""
+
+    def __init__(self, errors: List[Exception]) -> None:
+        self.errors = errors
+        self.calls = 0
+
+    def run_flow(self, flow_input: Dict[str, Any], label: str) -> Dict[str, str]:
+        self.calls += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        return {"action_id": f"run-{self.calls}"}
+
+    def get_flow_id(self) -> str:
+        return "flow"
+
+    def get_flow_definition(self) -> Dict[str, Any]:
+        return {}
+
+
+def _run(
+    client: _Client, max_retries: int = 3, dead_letter_file: Optional[Path] = None
+) -> FlowSubmitter:
+    submitter = FlowSubmitter(
+        num_workers=1,
+        rate=1000.0,
+        max_retries=max_retries,
+        base_delay=0.001,
+        max_delay=0.01,
+        dead_letter_file=dead_letter_file,
+    )
+    submitter.submit(client, {"input": {}}, run_label="test")
+    submitter.shutdown()
+    return submitter
+
+
+def test_transient_errors_are_retried() -> None:
+    client = _Client([_APIError(429), _APIError(503), ConnectionError()])
+    submitter = _run(client)
+
+    assert client.calls == 4
+    metrics = submitter.metrics.as_dict()
+    assert metrics["submitted"] == 1
+    assert metrics["retries"] == 3
+    assert metrics["throttled"] == 1
+
+
+def test_throttling_slows_down_submissions() -> None:
+    client = _Client([_APIError(429), _APIError(429)])
+    submitter = _run(client)
+
+    # Halved twice, then recovered by a single success
+    assert submitter.rate_limiter.rate == 1000.0 / 4 + 100.0
+
+
+def test_permanent_error_is_not_retried(tmp_path: Path) -> None:
+    dead_letter_file = tmp_path / "dead-letter.jsonl"
+    client = _Client([_APIError(400)])
+    submitter = _run(client, dead_letter_file=dead_letter_file)
+
+    assert client.calls == 1
+    assert submitter.metrics.as_dict()["failed"] == 1
+    record = json.loads(dead_letter_file.read_text())
+    assert record["run_label"] == "test"
+    assert "400" in record["error"]
+
+
+def test_retries_are_bounded(tmp_path: Path) -> None:
+    dead_letter_file = tmp_path / "dead-letter.jsonl"
+    client = _Client([_APIError(500) for _ in range(10)])
+    submitter = _run(client, max_retries=2, dead_letter_file=dead_letter_file)
+
+    assert client.calls == 3
+    assert submitter.metrics.as_dict()["failed"] == 1
+    assert len(dead_letter_file.read_text().splitlines()) == 1
+
+
+class _SlowClient:
+    """Flow client recording when each run is started, once `ready` is set."""
+
+    def __init__(self, delay: float = 0.0) -> None:
+        self.delay = delay
+        self.ready = Event()
+        self.ready.set()
+        self.labels: List[str] = []
+        self.calls: List[Tuple[float, float]] = []
+        self.flow_id_calls = 0
+        self._lock = Lock()
+
+    def run_flow(self, flow_input: Dict[str, Any], label: str) -> Dict[str, str]:
+        start = time.monotonic()
+        self.ready.wait(5)
+        time.sleep(self.delay)
+        with self._lock:
+            self.labels.append(label)
+            self.calls.append((start, time.monotonic()))
+            return {"action_id": f"run-{len(self.calls)}"}
+
+    def get_flow_id(self) -> str:
+        self.flow_id_calls += 1
+        return "flow"
+
+    def get_flow_definition(self) -> Dict[str, Any]:
+        return {}
+
+
+def test_full_queue_blocks_the_caller() -> None:
+    client = _SlowClient()
+    client.ready.clear()
+    submitter = FlowSubmitter(num_workers=1, queue_size=1, rate=1000.0)
+
+    # The worker holds the first run and the queue holds the second
+    submitter.submit(client, {"input": {}}, run_label="0")  # type: ignore[arg-type]
+    submitter.submit(client, {"input": {}}, run_label="1")  # type: ignore[arg-type]
+    caller = Thread(
+        target=submitter.submit, args=(client, {"input": {}}, "2"), daemon=True
+    )
+    caller.start()
+    caller.join(0.2)
+    assert caller.is_alive()
+    # The blocked caller is counted in the queue depth
+    assert submitter.metrics.as_dict()["queue_depth"] == 2
+
+    client.ready.set()
+    caller.join(5)
+    assert not caller.is_alive()
+    submitter.shutdown()
+    assert client.labels == ["0", "1", "2"]
+
+
+def test_shutdown_drains_the_queue() -> None:
+    client = _SlowClient(delay=0.01)
+    submitter = FlowSubmitter(num_workers=1, queue_size=10, rate=1000.0)
+    for i in range(5):
+        submitter.submit(client, {"input": {}}, run_label=str(i))  # type: ignore[arg-type]
+    submitter.shutdown()
+
+    assert client.labels == [str(i) for i in range(5)]
+    metrics = submitter.metrics.as_dict()
+    assert metrics["submitted"] == 5
+    assert metrics["queue_depth"] == 0
+    # Shutting down again is a no-op, but no more flows can be submitted
+    submitter.shutdown()
+    with pytest.raises(RuntimeError):
+        submitter.submit(client, {"input": {}})  # type: ignore[arg-type]
+
+
+def test_first_run_deploys_the_flow_alone() -> None:
+    client = _SlowClient(delay=0.05)
+    submitter = FlowSubmitter(num_workers=4, rate=1000.0)
+    for i in range(8):
+        submitter.submit(client, {"input": {}}, run_label=str(i))  # type: ignore[arg-type]
+    submitter.shutdown()
+
+    first, *others = sorted(client.calls)
+    # No other run starts before the flow is deployed by the first run
+    assert all(start >= first[1] for start, _ in others)
+    # Once deployed, the workers start runs concurrently
+    assert any(start < end for (_, end), (start, _) in zip(others, others[1:]))
+    assert client.flow_id_calls == 1
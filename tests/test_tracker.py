@@ -0,0 +1,167 @@
+import json
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Union
+
+import pytest
+
+from picoprobe import utils
+from picoprobe.utils import (
+    CheckPoint,
+    FileLifecycle,
+    FlowSubmitter,
+    RunTracker,
+    SQLiteCheckPoint,
+)
+
+
+class _Client:
+    """Flow client reporting the configured status of each run."""
+
+    def __init__(self) -> None:
+        self.statuses: Dict[str, Union[str, Dict[str, Any], Exception]] = {}
+        self.checked: List[str] = []
+
+    def get_status(self, run_id: str) -> Dict[str, Any]:
+        self.checked.append(run_id)
+        status = self.statuses.get(run_id, "ACTIVE")
+        if isinstance(status, Exception):
+            raise status
+        if isinstance(status, dict):
+            return status
+        return {"status": status}
+
+    def run_flow(self, flow_input: Dict[str, Any], label: str) -> Dict[str, str]:
+        raise ValueError("Invalid flow input")
+
+
+@pytest.fixture
+def tracker() -> Iterator[RunTracker]:
+    # The runs are polled by the tests rather than the background thread
+    tracker = RunTracker(max_in_flight=2, poll_interval=3600, batch_size=2)
+    yield tracker
+    tracker.stop()
+
+
+@pytest.fixture
+def lifecycle(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> Iterator[Path]:
+    """Record the lifecycle events to a log, returned once the recorder is closed."""
+    recorder = FileLifecycle()
+    recorder.configure(tmp_path / "events.jsonl", export_interval=3600)
+    monkeypatch.setattr(utils, "lifecycle", recorder)
+    yield tmp_path / "events.jsonl"
+    recorder.close()
+
+
+def _add(tracker: RunTracker, client: _Client, run_id: str, **kwargs: Any) -> None:
+    assert tracker.reserve()
+    tracker.add(client, run_id, **kwargs)  # type: ignore[arg-type]
+
+
+def test_runs_are_polled_in_batches(tracker: RunTracker) -> None:
+    tracker.max_in_flight = None
+    client = _Client()
+    for i in range(5):
+        _add(tracker, client, f"run-{i}")
+
+    for _ in range(3):
+        assert tracker.poll() == 0
+    # The least recently checked runs are polled first
+    assert client.checked == [f"run-{i}" for i in (0, 1, 2, 3, 4, 0)]
+    assert len(tracker) == 5
+
+
+def test_completed_runs_release_their_slot(tmp_path: Path, tracker: RunTracker) -> None:
+    checkpoint = SQLiteCheckPoint(tmp_path / "checkpoint.db")
+    client = _Client()
+    for run_id in ("a", "b"):
+        checkpoint.seen(run_id)
+        _add(tracker, client, run_id, checkpoint=checkpoint, events=[run_id])
+    # Every slot is taken
+    assert not tracker.reserve()
+
+    client.statuses["a"] = "SUCCEEDED"
+    assert tracker.poll() == 1
+    assert checkpoint.get("a")["state"] == CheckPoint.SUCCEEDED
+    assert checkpoint.get("b")["state"] == CheckPoint.RUNNING
+    assert tracker.in_flight == 1
+    assert tracker.reserve()
+    tracker.release()
+
+    client.statuses["b"] = "FAILED"
+    assert tracker.poll() == 1
+    assert checkpoint.get("b")["state"] == CheckPoint.FAILED
+    assert tracker.as_dict() == {
+        "in_flight": 0,
+        "running": 0,
+        "succeeded": 1,
+        "failed": 1,
+    }
+
+
+def test_status_errors_keep_the_run(tracker: RunTracker) -> None:
+    client = _Client()
+    client.statuses["a"] = ConnectionError("Service unavailable")
+    _add(tracker, client, "a")
+
+    assert tracker.poll() == 0
+    assert len(tracker) == 1
+    assert tracker.in_flight == 1
+
+    # The run is completed once its status is available again
+    client.statuses["a"] = "ENDED"
+    assert tracker.poll() == 1
+    assert tracker.in_flight == 0
+    assert tracker.failed == 1
+
+
+def test_failed_submission_releases_its_slot(tracker: RunTracker) -> None:
+    submitter = FlowSubmitter(num_workers=1, rate=1000.0, tracker=tracker)
+    assert submitter.reserve()
+    submitter.submit(_Client(), {"input": {}})  # type: ignore[arg-type]
+    submitter.shutdown()
+
+    assert submitter.metrics.as_dict()["failed"] == 1
+    assert tracker.in_flight == 0
+    assert len(tracker) == 0
+
+
+def test_lifecycle_of_the_flow_steps(tracker: RunTracker, lifecycle: Path) -> None:
+    client = _Client()
+    client.statuses["a"] = {
+        "status": "SUCCEEDED",
+        "completion_time": "2023-07-22T04:30:00.000000+00:00",
+        "details": {
+            "output": {
+                "Transfer": {
+                    "details": {
+                        "bytes_transferred": 1024,
+                        "completion_time": "2023-07-22T04:27:00+00:00",
+                    }
+                },
+                "TemporalImageTool": {"details": {"results": []}},
+                "Publishv2Ingest": {
+                    "details": {
+                        "index_id": "index",
+                        "creation_date": "2023-07-22T04:28:00Z",
+                        "completion_date": "2023-07-22T04:29:00Z",
+                    }
+                },
+                "Step": "not a step",
+            }
+        },
+    }
+    client.statuses["b"] = "FAILED"
+    _add(tracker, client, "a", paths=["a.emd"])
+    _add(tracker, client, "b", paths=["b.emd"])
+    assert tracker.poll() == 2
+    utils.lifecycle.close()
+
+    events = [json.loads(line) for line in open(lifecycle)]
+    stages = {(event["path"], event["stage"]): event["time"] for event in events}
+    assert stages == {
+        ("a.emd", "transfer_done"): 1690000020.0,
+        ("a.emd", "compute_done"): 1690000080.0,
+        ("a.emd", "published"): 1690000140.0,
+        ("b.emd", FileLifecycle.FAILED): pytest.approx(events[-1]["time"]),
+    }
+    assert all(event["run_id"] in ("a", "b") for event in events)
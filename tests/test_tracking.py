@@ -0,0 +1,122 @@
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+import numpy as np
+import pytest
+
+from picoprobe.tools.tracking import (
+    IoUTracker,
+    box_iou,
+    read_tables,
+    summarize_tracks,
+    track_detections,
+    track_table,
+    write_tables,
+)
+
+
+def _detections(
+    rows: List[Tuple[int, float, float, float, float]]
+) -> Dict[str, np.ndarray]:
+    table = np.array(sorted(rows), dtype=np.float32).reshape(-1, 5)
+    return {
+        "frame": table[:, 0].astype(np.int32),
+        "x1": table[:, 1],
+        "y1": table[:, 2],
+        "x2": table[:, 3],
+        "y2": table[:, 4],
+        "confidence": np.ones(len(table), dtype=np.float32),
+        "class": np.zeros(len(table), dtype=np.int16),
+    }
+
+
+def _synthetic_tracks() -> Dict[str, np.ndarray]:
+    """A particle moving right (missed in frame 4), one moving down and one appearing."""
+    rows = []
+    for frame in range(10):
+        if frame != 4:
+            rows.append((frame, 10 + 2 * frame, 10, 20 + 2 * frame, 20))
+        rows.append((frame, 50, 50 + frame, 60, 60 + frame))
+        if frame >= 6:
+            rows.append((frame, 100, 100, 110, 110))
+    return _detections(rows)
+
+
+def test_box_iou() -> None:
+    iou = box_iou(np.array([[0, 0, 2, 2]]), np.array([[1, 1, 3, 3], [5, 5, 6, 6]]))
+    np.testing.assert_allclose(iou, [[1 / 7, 0]])
+    assert box_iou(np.zeros((0, 4)), np.zeros((3, 4))).shape == (0, 3)
+
+
+def test_tracks_follow_particles() -> None:
+    pytest.importorskip("scipy")
+    detections = _synthetic_tracks()
+    tracks = track_detections(detections)
+
+    # Every particle keeps a single track id across the frames
+    for x1 in (50, 100):
+        ids = tracks[detections["x1"] == x1]
+        assert len(set(ids.tolist())) == 1
+    moving = tracks[detections["y1"] == 10]
+    assert len(set(moving.tolist())) == 1
+    assert len(set(tracks.tolist())) == 3
+
+
+def test_track_ends_after_max_gap() -> None:
+    pytest.importorskip("scipy")
+    tracker = IoUTracker(max_gap=1)
+    box = np.array([[0, 0, 10, 10]])
+    first = tracker.update(0, box)
+    # A gap of a single frame is bridged, a gap of two frames is not
+    np.testing.assert_array_equal(tracker.update(2, box), first)
+    assert tracker.update(5, box)[0] != first[0]
+
+
+def test_low_overlap_starts_new_track() -> None:
+    pytest.importorskip("scipy")
+    tracker = IoUTracker(iou_threshold=0.5)
+    first = tracker.update(0, np.array([[0, 0, 10, 10]]))
+    # IoU of 1/3 is below the threshold
+    assert tracker.update(1, np.array([[5, 0, 15, 10]]))[0] != first[0]
+
+
+def test_track_table_and_summary(tmp_path: Path) -> None:
+    pytest.importorskip("scipy")
+    detections = _synthetic_tracks()
+    detections["track"] = track_detections(detections)
+    tracks = track_table(detections)
+
+    by_start = {int(x): i for i, x in enumerate(tracks["x_start"])}
+    right = by_start[15]
+    assert tracks["length"][right] == 9
+    assert tracks["start_frame"][right] == 0
+    assert tracks["end_frame"][right] == 9
+    # The particle moves 2 pixels per frame
+    assert tracks["path_length"][right] == pytest.approx(18)
+    assert tracks["mean_speed"][right] == pytest.approx(2)
+    assert tracks["mean_speed"][by_start[55]] == pytest.approx(1)
+
+    summary = summarize_tracks(detections, tracks, n_frames=10, fps=50.0)
+    assert summary["num_tracks"] == 3
+    assert summary["num_detections"] == 9 + 10 + 4
+    assert summary["speed_px_per_s"]["max"] == pytest.approx(100)
+
+    path = write_tables(
+        tmp_path / "detections.h5",
+        {"detections": detections, "tracks": tracks},
+        {"fps": 50.0},
+    )
+    tables = read_tables(path)
+    for name, table in (("detections", detections), ("tracks", tracks)):
+        for column, values in table.items():
+            np.testing.assert_array_equal(tables[name][column], values)
+
+
+def test_empty_detections(tmp_path: Path) -> None:
+    detections = _detections([])
+    detections["track"] = track_detections(detections)
+    tracks = track_table(detections)
+    summary = summarize_tracks(detections, tracks, n_frames=5, fps=100.0)
+    assert summary["num_tracks"] == 0
+    assert summary["track_length"]["mean"] is None
+    write_tables(tmp_path / "empty.h5", {"detections": detections, "tracks": tracks})
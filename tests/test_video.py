@@ -0,0 +1,42 @@
+from types import SimpleNamespace
+from typing import Any
+
+import numpy as np
+import pytest
+
+from picoprobe.tools.video import DEFAULT_FPS, frame_rate, stack_normalizer
+
+
+def _signal(*axes: Any) -> Any:
+    return SimpleNamespace(axes_manager=SimpleNamespace(navigation_axes=list(axes)))
+
+
+def test_frame_rate_from_time_axis() -> None:
+    assert frame_rate(_signal(SimpleNamespace(units="s", scale=0.02))) == 50.0
+    assert frame_rate(_signal(SimpleNamespace(units="ms", scale=4.0))) == 250.0
+
+
+def test_frame_rate_default() -> None:
+    assert frame_rate(_signal()) == DEFAULT_FPS
+    # Spatial axes (and undefined units) are not time axes
+    assert frame_rate(_signal(SimpleNamespace(units="nm", scale=1.0))) == DEFAULT_FPS
+    assert (
+        frame_rate(_signal(SimpleNamespace(units="<undefined>", scale=1.0)), 30) == 30
+    )
+
+
+@pytest.mark.parametrize("mode", ["frame", "global", "percentile"])
+def test_frames_scaled_to_8_bits(mode: str) -> None:
+    data = np.arange(4 * 3 * 2, dtype=np.uint16).reshape(4, 3, 2) * 100
+    frames = stack_normalizer(data, mode, percentiles=(0, 100))(data)
+    assert frames.dtype == np.uint8
+    if mode == "frame":
+        assert (frames.min(axis=(1, 2)) == 0).all()
+        assert (frames.max(axis=(1, 2)) == 255).all()
+    else:
+        assert frames.min() == 0 and frames.max() == 255
+
+
+def test_flat_frames_are_black() -> None:
+    data = np.full((2, 4, 4), 7, dtype=np.uint16)
+    assert not stack_normalizer(data)(data).any()